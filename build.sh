@@ -37,6 +37,10 @@ echo "============================================"
 echo "Running database migrations..."
 python manage.py migrate --verbosity=2
 
+echo "============================================"
+echo "Creating cache tables..."
+python manage.py createcachetable --verbosity=2
+
 echo "============================================"
 echo "Running custom database initialization..."
 python manage.py init_db
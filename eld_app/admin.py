@@ -1,5 +1,28 @@
 from django.contrib import admin
-from .models import Trip, RouteSegment, DailyLog, LogEntry
+from django.db import transaction
+
+from .cycle import CycleService
+from .models import (
+    Trip, TripStop, RouteSegment, RouteGeometry, DailyLog, LogEntry, PlanningJob, DriverDutyDay, GeocodedLocation
+)
+from .signals import duty_days_of, invalidate_trips_of
+
+
+class TripRowAdmin(admin.ModelAdmin):
+    """Admin for rows a trip is rendered from, which send no delete signals
+
+    Deleting them invalidates their trips and refreshes the drivers' duty days here.
+    """
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, type(obj).objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            invalidate_trips_of(queryset)
+            days = duty_days_of(queryset)
+            super().delete_queryset(request, queryset)
+            CycleService.refresh_days(days)
 
 @admin.register(Trip)
 class TripAdmin(admin.ModelAdmin):
@@ -8,20 +31,49 @@ class TripAdmin(admin.ModelAdmin):
     search_fields = ['driver_name', 'carrier_name', 'truck_number']
     readonly_fields = ['id', 'created_at']
 
+@admin.register(TripStop)
+class TripStopAdmin(admin.ModelAdmin):
+    list_display = ['trip', 'sequence', 'stop_type', 'location', 'shipment']
+    list_filter = ['stop_type']
+    search_fields = ['location', 'shipment']
+
 @admin.register(RouteSegment)
-class RouteSegmentAdmin(admin.ModelAdmin):
+class RouteSegmentAdmin(TripRowAdmin):
     list_display = ['trip', 'segment_type', 'start_location', 'end_location', 'distance_miles', 'duration_hours']
     list_filter = ['segment_type']
     search_fields = ['start_location', 'end_location']
 
+@admin.register(RouteGeometry)
+class RouteGeometryAdmin(admin.ModelAdmin):
+    list_display = ['trip', 'leg']
+    list_filter = ['leg']
+
 @admin.register(DailyLog)
-class DailyLogAdmin(admin.ModelAdmin):
+class DailyLogAdmin(TripRowAdmin):
     list_display = ['trip', 'date', 'total_miles', 'total_hours_driving']
     list_filter = ['date']
     date_hierarchy = 'date'
 
 @admin.register(LogEntry)
-class LogEntryAdmin(admin.ModelAdmin):
+class LogEntryAdmin(TripRowAdmin):
     list_display = ['daily_log', 'start_time', 'end_time', 'duty_status', 'location']
     list_filter = ['duty_status', 'daily_log__date']
-    search_fields = ['location', 'remarks']
\ No newline at end of file
+    search_fields = ['location', 'remarks']
+
+@admin.register(PlanningJob)
+class PlanningJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'trip', 'status', 'stage', 'attempts', 'created_at', 'finished_at']
+    list_filter = ['status']
+    readonly_fields = ['id', 'created_at', 'started_at', 'heartbeat_at', 'finished_at']
+
+@admin.register(DriverDutyDay)
+class DriverDutyDayAdmin(admin.ModelAdmin):
+    list_display = ['driver_name', 'date', 'on_duty_hours', 'driving_hours']
+    search_fields = ['driver_name']
+    date_hierarchy = 'date'
+
+@admin.register(GeocodedLocation)
+class GeocodedLocationAdmin(admin.ModelAdmin):
+    list_display = ['query', 'name', 'lat', 'lng', 'created_at']
+    search_fields = ['query', 'name']
+    readonly_fields = ['created_at']
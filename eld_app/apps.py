@@ -3,4 +3,12 @@ from django.apps import AppConfig
 
 class EldAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'eld_app'
\ No newline at end of file
+    name = 'eld_app'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401  (connects cache invalidation receivers)
+        from .metrics import install_query_counter
+
+        connection_created.connect(install_query_counter, dispatch_uid='eld_app.metrics.install_query_counter')
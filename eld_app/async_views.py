@@ -0,0 +1,92 @@
+"""Async variants of the trip views, for serving under uvicorn via eld_project.asgi"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.db.models import prefetch_related_objects
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.request import Request
+
+from . import metrics
+from .cycle import CycleService
+from .geocoding import geocode_many, names_to_geocode
+from .models import Trip
+from .serializers import TripSerializer, TripCreateSerializer
+from .services import HOSService, RouteService, TripPlanService
+from .trip_cache import aget_trip_entry, entry_response
+from .views import paginate_trips
+
+
+def _save_and_render(trip, segments, daily_logs_data, routes):
+    """Persist a planned trip and render it, in one hop to the sync thread"""
+    TripPlanService.save_plans([(trip, segments, daily_logs_data, routes)])
+    prefetch_related_objects([trip], 'route_segments', 'daily_logs__log_entries')
+    with metrics.timed('render'):
+        return TripSerializer(trip).data
+
+
+def _plan(trip, routes):
+    """Plan a trip's segments and daily logs from its route data"""
+    segments = HOSService.plan_trip_segments(trip, routes=routes)
+    return segments, HOSService.generate_daily_logs(trip, segments)
+
+
+def _render_trip_page(request):
+    paginator, data = paginate_trips(Request(request))
+    return paginator.get_paginated_response(data).data
+
+
+@csrf_exempt
+@require_POST
+async def create_trip(request):
+    """Create a new trip, routing its legs without blocking the event loop"""
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Request body must be JSON'}, status=400)
+
+    # Cycle seeding and geocoding read the database, which can't happen on the event loop
+    context = {}
+    if isinstance(payload, dict) and 'current_cycle_hours' not in payload and isinstance(payload.get('driver_name'), str):
+        context['cycle_hours'] = await sync_to_async(CycleService.cycle_hours)([payload['driver_name']])
+    names = names_to_geocode(payload)
+    if names:
+        context['geocoded'] = await sync_to_async(geocode_many)(names)
+
+    serializer = TripCreateSerializer(data=payload, context=context)
+
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+
+    trip = Trip(**serializer.validated_data)
+
+    try:
+        routes = await RouteService.aget_routes(HOSService.trip_legs(trip))
+
+        # Planning is CPU-bound and can load the gazetteer and POI files on first use, so it
+        # runs on a worker thread; it doesn't touch the database, so it needn't wait for the DB thread
+        segments, daily_logs_data = await sync_to_async(_plan, thread_sensitive=False)(trip, routes)
+
+        data = await sync_to_async(_save_and_render)(trip, segments, daily_logs_data, routes)
+        return JsonResponse(data, status=201)
+
+    except Exception as e:
+        return JsonResponse({'error': f'Failed to generate trip plan: {str(e)}'}, status=500)
+
+
+@require_GET
+async def get_trip(request, trip_id):
+    """Get trip details by ID, from the rendered-trip cache with conditional GET support"""
+    entry = await aget_trip_entry(trip_id)
+    if entry is None:
+        return JsonResponse({'error': 'Trip not found'}, status=404)
+    return entry_response(request, entry)
+
+
+@require_GET
+async def list_trips(request):
+    """List trips, newest first, a cursor page at a time"""
+    # DRF's cursor paginator is sync-only, so the page query runs in the sync thread
+    data = await sync_to_async(_render_trip_page)(request)
+    return JsonResponse(data)
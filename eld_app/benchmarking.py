@@ -0,0 +1,238 @@
+"""Helpers for benchmarks and load tests: a stub OpenRouteService, server processes and an HTTP load generator"""
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from .geo import haversine_matrix
+
+
+class StubORSServer:
+    """Local stand-in for the ORS directions API with injectable latency and failures
+
+    Routes are the straight-line distance times ``detour_factor`` at ``speed_mph``.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, failure_rate=0.0,
+                 detour_factor=1.2, speed_mph=55, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.detour_factor = detour_factor
+        self.speed_mph = speed_mph
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                status, payload = stub.respond(body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def respond(self, body):
+        """Return (status, payload) for a directions request body"""
+        with self._lock:
+            self.requests += 1
+            fail = self._random.random() < self.failure_rate
+
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            return 503, {'error': 'Injected failure'}
+
+        (start_lng, start_lat), (end_lng, end_lat) = body['coordinates'][:2]
+        miles = float(haversine_matrix([(start_lat, start_lng)], [(end_lat, end_lng)])[0, 0]) * self.detour_factor
+        return 200, {
+            'routes': [{
+                'summary': {
+                    'distance': miles / 0.621371 * 1000,
+                    'duration': miles / self.speed_mph * 3600
+                },
+                'geometry': None
+            }]
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def trip_payload_factory(seed):
+    """Build trip create payloads for request ``i``, jittered so no two trips share a route"""
+    rng = random.Random(seed)
+
+    def payload(i):
+        lat, lng = rng.uniform(30, 45), rng.uniform(-120, -75)
+        return {
+            'current_location': f'Origin {i}', 'current_lat': f'{lat:.6f}', 'current_lng': f'{lng:.6f}',
+            'pickup_location': f'Pickup {i}', 'pickup_lat': f'{lat + 1:.6f}', 'pickup_lng': f'{lng + 1:.6f}',
+            'dropoff_location': f'Dropoff {i}', 'dropoff_lat': f'{lat + 2:.6f}', 'dropoff_lng': f'{lng + 3:.6f}',
+            'current_cycle_hours': '20.0', 'driver_name': f'Driver {i % 50}',
+            'carrier_name': 'Load Test Freight', 'truck_number': f'LT-{i % 50:03d}',
+        }
+
+    return payload
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize_latencies(latencies, elapsed, errors=0):
+    """Throughput and latency percentiles (ms) for a run"""
+    if not latencies:
+        return {'requests': 0, 'errors': errors, 'elapsed_s': round(elapsed, 3)}
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'max_ms': round(max(latencies) * 1000, 2),
+    }
+
+
+def best_per_call(fn, iterations, repeat, setup=None):
+    """Best-of-``repeat`` mean microseconds per call of ``fn``
+
+    ``setup`` runs before every call and is left out of the timing, so a cold
+    figure measures the call alone rather than the call plus clearing a cache.
+    """
+    perf_counter = time.perf_counter
+    best = float('inf')
+    for _ in range(repeat):
+        if setup is None:
+            start = perf_counter()
+            for _ in range(iterations):
+                fn()
+            elapsed = perf_counter() - start
+        else:
+            elapsed = 0.0
+            for _ in range(iterations):
+                setup()
+                start = perf_counter()
+                fn()
+                elapsed += perf_counter() - start
+        best = min(best, elapsed)
+    return best / iterations * 1e6
+
+
+def run_load(method, url, total_requests, concurrency, payload_factory=None, expected_status=None):
+    """Fire ``total_requests`` HTTP requests from ``concurrency`` client threads
+
+    ``url`` may be a callable building the URL for request ``i``, and
+    ``payload_factory(i)`` builds the JSON body for request ``i``. Responses whose
+    status isn't in ``expected_status`` count as errors.
+    """
+    local = threading.local()
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def fire(i):
+        nonlocal errors
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+
+        body = payload_factory(i) if payload_factory else None
+        target = url(i) if callable(url) else url
+        start = time.perf_counter()
+        try:
+            response = session.request(method, target, json=body, timeout=60)
+            ok = expected_status is None or response.status_code in expected_status
+        except requests.RequestException:
+            ok = False
+        latency = time.perf_counter() - start
+
+        with lock:
+            latencies.append(latency)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(fire, range(total_requests)))
+    elapsed = time.perf_counter() - start
+
+    return summarize_latencies(latencies, elapsed, errors)
+
+
+def wait_for_http(url, timeout=30):
+    """Poll ``url`` until it answers at all, raising if it doesn't within ``timeout``"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise TimeoutError(f'{url} did not come up within {timeout}s')
+
+
+@contextmanager
+def gunicorn_server(app, port, env, workers=2, worker_class=None, cwd=None):
+    """Run gunicorn serving ``app`` on 127.0.0.1:``port`` until the block exits
+
+    Yields the base URL once the server answers.
+    """
+    command = ['gunicorn', app, '--workers', str(workers), '--bind', f'127.0.0.1:{port}', '--log-level', 'warning']
+    if worker_class:
+        command += ['-k', worker_class]
+
+    process = subprocess.Popen(command, env={**os.environ, **env}, cwd=cwd, stdout=sys.stdout, stderr=sys.stderr)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        wait_for_http(f'{base_url}/api/trips/?view=summary&page_size=1')
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
@@ -0,0 +1,282 @@
+"""Hours-of-service violation scan over stored logs
+
+Log entries stream out of the database in driver/time order through ``.iterator()``
+and each driver's history is evaluated in a single pass: a few running counters
+cover the 11-hour, 14-hour and 30-minute break rules, and a deque of at most
+eight daily totals covers the 70-hour/8-day cycle, so memory stays flat however
+many entries are scanned. Drivers are independent, so the scan can be split into
+batches of drivers and run in a process pool.
+"""
+import json
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+import django
+from django.conf import settings
+from django.db import connections
+
+from .cycle import CYCLE_DAYS, CYCLE_LIMIT_HOURS, ON_DUTY_STATUSES, RESTART_HOURS
+from .models import DailyLog, LogEntry
+
+DRIVING_LIMIT_HOURS = 11
+DUTY_WINDOW_HOURS = 14
+BREAK_AFTER_DRIVING_HOURS = 8
+BREAK_HOURS = 0.5
+SHIFT_RESET_HOURS = 10
+
+RULE_LIMITS = {
+    'driving_11_hour': DRIVING_LIMIT_HOURS,
+    'duty_window_14_hour': DUTY_WINDOW_HOURS,
+    'break_30_minute': BREAK_AFTER_DRIVING_HOURS,
+    'cycle_70_hour': CYCLE_LIMIT_HOURS,
+}
+
+SCAN_FIELDS = [
+    'daily_log__trip__driver_name',
+    'daily_log__trip_id',
+    'daily_log__date',
+    'start_time',
+    'end_time',
+    'duty_status',
+    'location',
+]
+
+
+class Violation(NamedTuple):
+    """Driving past an hours-of-service limit, from the moment the limit was crossed"""
+    driver_name: str
+    rule: str
+    at: datetime
+    hours: float
+    limit: float
+    trip_id: str
+    date: str
+    location: str
+
+
+def _hours(value):
+    return value.hour + value.minute / 60 + value.second / 3600
+
+
+def _moment(hour):
+    """Naive datetime of an hour counted from the start of the proleptic Gregorian calendar"""
+    day, hours = divmod(hour, 24)
+    return (datetime.fromordinal(int(day)) + timedelta(seconds=round(hours * 3600))).replace(microsecond=0)
+
+
+class DriverScan:
+    """Sliding-window accumulators over one driver's duty history
+
+    Entries must be fed in time order. Unlogged time between entries counts as off
+    duty, and the part of an entry overlapping time already scanned (a driver's
+    trips planned over each other) is counted once. Each rule is reported once per
+    shift, break period or cycle day rather than once per offending entry.
+    """
+
+    def __init__(self, driver_name):
+        self.driver_name = driver_name
+        self.cursor = None
+        # Consecutive hours off duty, and without driving, up to the cursor
+        self.rest = float('inf')
+        self.pause = float('inf')
+        self.shift_start = None
+        self.shift_driving = 0.0
+        self.driving_since_break = 0.0
+        # (day ordinal, on-duty hours) of the days in the current 8-day window
+        self.days = deque()
+        self.cycle_used = 0.0
+        self.flagged = set()
+
+    def _not_driving(self, hours, off_duty):
+        self.pause += hours
+        if self.pause >= BREAK_HOURS:
+            self.driving_since_break = 0.0
+            self.flagged.discard('break_30_minute')
+        if not off_duty:
+            return
+
+        self.rest += hours
+        if self.rest >= SHIFT_RESET_HOURS:
+            self.shift_start = None
+            self.shift_driving = 0.0
+            self.flagged.difference_update({'driving_11_hour', 'duty_window_14_hour'})
+        if self.rest >= RESTART_HOURS:
+            self.days.clear()
+            self.cycle_used = 0.0
+
+    def _cycle_window(self, day):
+        """Drop the days before the 8-day window ending on ``day`` and open ``day``"""
+        while self.days and self.days[0][0] <= day - CYCLE_DAYS:
+            self.cycle_used -= self.days.popleft()[1]
+        if not self.days or self.days[-1][0] != day:
+            self.days.append((day, 0.0))
+            self.flagged.discard('cycle_70_hour')
+
+    def _violation(self, rule, at, hours, entry):
+        self.flagged.add(rule)
+        trip_id, date, location = entry
+        return Violation(self.driver_name, rule, _moment(at), round(hours, 2), RULE_LIMITS[rule],
+                         str(trip_id), date.isoformat(), location)
+
+    def _on_duty(self, start, end, driving, entry):
+        violations = []
+        self.rest = 0.0
+        if self.shift_start is None:
+            self.shift_start = start
+
+        # Per calendar day, as the cycle window moves at midnight
+        piece_start = start
+        while piece_start < end:
+            day = int(piece_start // 24)
+            piece_end = min(end, (day + 1) * 24)
+            self._cycle_window(day)
+            if (driving and self.cycle_used + piece_end - piece_start > CYCLE_LIMIT_HOURS
+                    and 'cycle_70_hour' not in self.flagged):
+                crossed = piece_start + max(0.0, CYCLE_LIMIT_HOURS - self.cycle_used)
+                violations.append(self._violation('cycle_70_hour', crossed,
+                                                  self.cycle_used + piece_end - piece_start, entry))
+            self.cycle_used += piece_end - piece_start
+            self.days[-1] = (day, self.days[-1][1] + piece_end - piece_start)
+            piece_start = piece_end
+
+        if not driving:
+            self._not_driving(end - start, off_duty=False)
+            return violations
+
+        hours = end - start
+        self.pause = 0.0
+        if self.shift_driving + hours > DRIVING_LIMIT_HOURS and 'driving_11_hour' not in self.flagged:
+            crossed = start + max(0.0, DRIVING_LIMIT_HOURS - self.shift_driving)
+            violations.append(self._violation('driving_11_hour', crossed, self.shift_driving + hours, entry))
+        window_end = self.shift_start + DUTY_WINDOW_HOURS
+        if end > window_end and 'duty_window_14_hour' not in self.flagged:
+            violations.append(self._violation('duty_window_14_hour', max(start, window_end),
+                                              end - self.shift_start, entry))
+        if (self.driving_since_break + hours > BREAK_AFTER_DRIVING_HOURS
+                and 'break_30_minute' not in self.flagged):
+            crossed = start + max(0.0, BREAK_AFTER_DRIVING_HOURS - self.driving_since_break)
+            violations.append(self._violation('break_30_minute', crossed,
+                                              self.driving_since_break + hours, entry))
+        self.shift_driving += hours
+        self.driving_since_break += hours
+        return violations
+
+    def feed(self, trip_id, date, start_time, end_time, duty_status, location):
+        """Account for one log entry and return the violations it commits"""
+        start = date.toordinal() * 24 + _hours(start_time)
+        # Entries that run past midnight end "earlier" than they start
+        end = start + (_hours(end_time) - _hours(start_time)) % 24
+        if self.cursor is not None:
+            if start > self.cursor:
+                self._not_driving(start - self.cursor, off_duty=True)
+            start = max(start, self.cursor)
+        if end <= start:
+            return []
+        self.cursor = end
+
+        if duty_status in ON_DUTY_STATUSES:
+            return self._on_duty(start, end, duty_status == 'driving', (trip_id, date, location))
+        self._not_driving(end - start, off_duty=True)
+        return []
+
+
+def scan_queryset(carrier=None, driver=None, drivers=None, start_date=None, end_date=None):
+    """Log entries to scan, in driver/time order, as value tuples
+
+    Starts the days of a cycle before ``start_date`` so the window is full when the range begins.
+    """
+    entries = LogEntry.objects.all()
+    if carrier:
+        entries = entries.filter(daily_log__trip__carrier_name=carrier)
+    if driver:
+        entries = entries.filter(daily_log__trip__driver_name=driver)
+    if drivers is not None:
+        entries = entries.filter(daily_log__trip__driver_name__in=drivers)
+    if start_date:
+        entries = entries.filter(daily_log__date__gte=start_date - timedelta(days=CYCLE_DAYS - 1))
+    if end_date:
+        entries = entries.filter(daily_log__date__lte=end_date)
+
+    return (entries
+            .order_by('daily_log__trip__driver_name', 'daily_log__date', 'start_time', 'pk')
+            .values_list(*SCAN_FIELDS))
+
+
+def scan_violations(rows, start_date=None):
+    """Yield the violations in value tuples of SCAN_FIELDS, in driver/time order, as they are found"""
+    scan = None
+    for driver_name, *entry in rows:
+        if scan is None or scan.driver_name != driver_name:
+            scan = DriverScan(driver_name)
+        for violation in scan.feed(*entry):
+            if start_date is None or violation.at.date() >= start_date:
+                yield violation
+
+
+def iter_violations(chunk_size=None, using=None, **filters):
+    """Yield the violations of the logs matching the scan filters, read from database ``using``"""
+    rows = scan_queryset(**filters).using(using).iterator(chunk_size=chunk_size or settings.EXPORT_CHUNK_SIZE)
+    return scan_violations(rows, start_date=filters.get('start_date'))
+
+
+def as_json(violation):
+    """A violation as a JSON-serializable dict"""
+    return {**violation._asdict(), 'at': violation.at.isoformat()}
+
+
+def iter_ndjson(violations):
+    """Encode violations as newline-delimited JSON objects"""
+    for violation in violations:
+        yield json.dumps(as_json(violation)) + '\n'
+
+
+def driver_names(carrier=None, driver=None, start_date=None, end_date=None):
+    """Names of the drivers with logs matching the scan filters, in scan order"""
+    logs = DailyLog.objects.all()
+    if carrier:
+        logs = logs.filter(trip__carrier_name=carrier)
+    if driver:
+        logs = logs.filter(trip__driver_name=driver)
+    if start_date:
+        logs = logs.filter(date__gte=start_date)
+    if end_date:
+        logs = logs.filter(date__lte=end_date)
+    return logs.values_list('trip__driver_name', flat=True).order_by('trip__driver_name').distinct()
+
+
+def _scan_drivers(drivers, chunk_size, filters):
+    """Violations of a batch of drivers, run in a worker process"""
+    try:
+        return list(iter_violations(chunk_size=chunk_size, drivers=drivers, **filters))
+    finally:
+        connections.close_all()
+
+
+def iter_violations_parallel(workers, drivers_per_task=50, chunk_size=None, **filters):
+    """Yield the same violations as ``iter_violations``, scanning batches of drivers in ``workers`` processes
+
+    Batches are submitted a few at a time and their results yielded in driver order,
+    so neither the pending work nor the finished results pile up in memory.
+    """
+    names = driver_names(**filters).iterator(chunk_size=chunk_size or settings.EXPORT_CHUNK_SIZE)
+    # Workers start from scratch instead of inheriting this process's database connections, and
+    # set Django up before the tasks (which import the models) are unpickled
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+        pending = deque()
+        batch = []
+        for name in names:
+            batch.append(name)
+            if len(batch) < drivers_per_task:
+                continue
+            pending.append(pool.submit(_scan_drivers, batch, chunk_size, filters))
+            batch = []
+            if len(pending) > 2 * workers:
+                yield from pending.popleft().result()
+        if batch:
+            pending.append(pool.submit(_scan_drivers, batch, chunk_size, filters))
+        while pending:
+            yield from pending.popleft().result()
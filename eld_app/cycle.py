@@ -0,0 +1,161 @@
+"""Rolling 70-hour/8-day duty cycle from per-driver daily aggregates
+
+DriverDutyDay keeps one row per driver per day, recomputed from that day's log
+entries whenever its logs are written, so a cycle query reads at most eight rows
+instead of scanning the driver's log history.
+"""
+import operator
+from datetime import datetime, timedelta
+from decimal import Decimal
+from functools import reduce
+from typing import NamedTuple
+
+from django.db.models import Q
+
+from .models import DriverDutyDay, LogEntry
+
+CYCLE_LIMIT_HOURS = 70
+CYCLE_DAYS = 8
+RESTART_HOURS = 34
+
+ON_DUTY_STATUSES = ('driving', 'on_duty_not_driving')
+
+
+class CycleState(NamedTuple):
+    """Cycle hours used and still available at some point in time"""
+    used_hours: float
+    available_hours: float
+
+
+def _hours(value):
+    return value.hour + value.minute / 60 + value.second / 3600
+
+
+def _decimal(value):
+    return Decimal(str(round(value, 2)))
+
+
+def _merged_hours(intervals):
+    """Hours covered by (start, end) intervals, counting overlaps once"""
+    total = 0.0
+    covered_to = None
+    for start, end in sorted(intervals):
+        if covered_to is not None and start < covered_to:
+            start = covered_to
+        if end > start:
+            total += end - start
+            covered_to = end
+    return total
+
+
+def _cycle_used(days, at):
+    """On-duty hours counting towards the cycle at ``at`` from a driver's window of days
+
+    A gap of RESTART_HOURS or more between on-duty periods is a restart and clears the
+    hours before it. Days are whole, so duty later on the day of ``at`` is counted too.
+    """
+    window_start = datetime.combine(at.date() - timedelta(days=CYCLE_DAYS - 1), datetime.min.time())
+    used = 0.0
+    last_end = None
+
+    for day in days:
+        if day.first_duty_start is None:
+            continue
+        offset = (day.date - window_start.date()).days * 24
+        if last_end is not None and offset + float(day.first_duty_start) - last_end >= RESTART_HOURS:
+            used = 0.0
+        used += float(day.on_duty_hours)
+        last_end = offset + float(day.last_duty_end)
+
+    if last_end is not None and (at - window_start).total_seconds() / 3600 - last_end >= RESTART_HOURS:
+        used = 0.0
+    return used
+
+
+class CycleService:
+    """Per-driver daily duty aggregates and the 70-hour/8-day cycle computed from them"""
+
+    @staticmethod
+    def refresh_days(keys):
+        """Recompute the DriverDutyDay rows for ``(driver_name, date)`` keys from their log entries
+
+        Reads only the entries of those days, so the cost follows the size of the
+        write rather than the driver's history. A driver's trips can be planned over
+        each other, so overlapping entries are merged, as the violation scan does, and a
+        day never counts more than 24 hours.
+        """
+        keys = set(keys)
+        if not keys:
+            return
+
+        days = {}
+        entries = (LogEntry.objects
+                   .filter(daily_log__trip__driver_name__in={driver for driver, _ in keys},
+                           daily_log__date__in={date for _, date in keys})
+                   .values_list('daily_log__trip__driver_name', 'daily_log__date',
+                                'start_time', 'end_time', 'duty_status'))
+        for driver, date, start_time, end_time, duty_status in entries:
+            if (driver, date) not in keys:
+                continue
+            day = days.setdefault((driver, date), {'on_duty': [], 'driving': [], 'first': None, 'last': None})
+            if duty_status not in ON_DUTY_STATUSES:
+                continue
+
+            start = _hours(start_time)
+            # Entries that run past midnight end "earlier" than they start
+            end = start + (_hours(end_time) - start) % 24
+            day['on_duty'].append((start, end))
+            if duty_status == 'driving':
+                day['driving'].append((start, end))
+            day['first'] = start if day['first'] is None else min(day['first'], start)
+            day['last'] = end if day['last'] is None else max(day['last'], end)
+
+        DriverDutyDay.objects.bulk_create([
+            DriverDutyDay(
+                driver_name=driver,
+                date=date,
+                on_duty_hours=_decimal(min(24.0, _merged_hours(day['on_duty']))),
+                driving_hours=_decimal(min(24.0, _merged_hours(day['driving']))),
+                first_duty_start=None if day['first'] is None else _decimal(day['first']),
+                last_duty_end=None if day['last'] is None else _decimal(day['last'])
+            )
+            for (driver, date), day in days.items()
+        ], update_conflicts=True, unique_fields=['driver_name', 'date'],
+            update_fields=['on_duty_hours', 'driving_hours', 'first_duty_start', 'last_duty_end'])
+
+        # Days whose logs are all gone
+        emptied = keys - days.keys()
+        if emptied:
+            DriverDutyDay.objects.filter(
+                reduce(operator.or_, (Q(driver_name=driver, date=date) for driver, date in emptied))
+            ).delete()
+
+    @staticmethod
+    def cycle_states(driver_names, at=None):
+        """Return a CycleState per driver at ``at`` (now by default), in one query"""
+        at = at or datetime.now()
+        days_by_driver = {driver: [] for driver in driver_names}
+        for day in DriverDutyDay.objects.filter(
+            driver_name__in=days_by_driver,
+            date__range=(at.date() - timedelta(days=CYCLE_DAYS - 1), at.date())
+        ).order_by('date'):
+            days_by_driver[day.driver_name].append(day)
+
+        states = {}
+        for driver, days in days_by_driver.items():
+            used = _cycle_used(days, at)
+            states[driver] = CycleState(round(used, 2), round(max(0.0, CYCLE_LIMIT_HOURS - used), 2))
+        return states
+
+    @staticmethod
+    def cycle_state(driver_name, at=None):
+        """Return a driver's CycleState at ``at`` (now by default)"""
+        return CycleService.cycle_states([driver_name], at)[driver_name]
+
+    @staticmethod
+    def cycle_hours(driver_names, at=None):
+        """Cycle hours used per driver, as a ``Trip.current_cycle_hours`` value"""
+        return {
+            driver: min(Decimal(CYCLE_LIMIT_HOURS), Decimal(str(round(state.used_hours, 1))))
+            for driver, state in CycleService.cycle_states(driver_names, at).items()
+        }
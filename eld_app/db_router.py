@@ -0,0 +1,102 @@
+"""Read-replica routing for the API tier
+
+Reads made while serving a GET or HEAD request go to one read replica, picked per
+request; everything else, and every write, uses the primary. A client that has just
+written is pinned to the primary for a few seconds by a cookie so it reads its own
+writes despite replication lag. With no replicas configured every query uses the
+primary.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from . import metrics
+
+READ_METHODS = ('GET', 'HEAD')
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+# Alias reads are sent to, or None for the primary
+_read_alias = ContextVar('eld_read_alias', default=None)
+
+
+@contextmanager
+def reads_from(alias):
+    """Send reads within the block to ``alias`` (None for the primary)"""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def primary_reads():
+    """Read from the primary within the block (or, as a decorator, every call)"""
+    return reads_from(None)
+
+
+class ReplicaRouter:
+    """Send reads to the request's replica, and writes and migrations to the primary"""
+
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        # Reads inside a transaction must see its uncommitted writes
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            alias = DEFAULT_DB_ALIAS
+        metrics.DB_READS.inc(alias)
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReadReplicaMiddleware:
+    """Route a request's reads to a replica and pin recent writers to the primary"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        with reads_from(self._read_alias(request)):
+            response = self.get_response(request)
+        return self._pin(request, response)
+
+    async def __acall__(self, request):
+        with reads_from(self._read_alias(request)):
+            response = await self.get_response(request)
+        return self._pin(request, response)
+
+    def _read_alias(self, request):
+        replicas = settings.READ_REPLICAS['ALIASES']
+        if (not replicas or request.method not in READ_METHODS
+                or settings.READ_REPLICAS['PIN_COOKIE'] in request.COOKIES):
+            return None
+        return random.choice(replicas)
+
+    def _pin(self, request, response):
+        if request.method in WRITE_METHODS and response.status_code < 400:
+            # Cross-site API clients only send SameSite=None cookies, which must be Secure
+            secure = request.is_secure()
+            response.set_cookie(
+                settings.READ_REPLICAS['PIN_COOKIE'], '1',
+                max_age=settings.READ_REPLICAS['PIN_SECONDS'],
+                secure=secure, httponly=True, samesite='None' if secure else 'Lax'
+            )
+        return response
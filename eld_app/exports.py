@@ -0,0 +1,131 @@
+"""Streaming export of daily log entries for compliance audits
+
+Rows come out of the database a chunk at a time through ``.iterator()`` and are
+encoded row by row, so memory stays flat however large the export is.
+"""
+import csv
+import datetime
+import io
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import router
+from django.http import StreamingHttpResponse
+
+from .models import LogEntry
+
+EXPORT_FIELDS = [
+    ('trip_id', 'daily_log__trip_id'),
+    ('carrier_name', 'daily_log__trip__carrier_name'),
+    ('driver_name', 'daily_log__trip__driver_name'),
+    ('truck_number', 'daily_log__trip__truck_number'),
+    ('daily_log_id', 'daily_log_id'),
+    ('date', 'daily_log__date'),
+    ('start_time', 'start_time'),
+    ('end_time', 'end_time'),
+    ('duty_status', 'duty_status'),
+    ('location', 'location'),
+    ('remarks', 'remarks'),
+]
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+# Rows encoded into each chunk handed to the server
+ROWS_PER_CHUNK = 500
+
+
+def log_entry_queryset(carrier=None, driver=None, truck=None, start_date=None, end_date=None):
+    """Log entries matching the export filters, in date/trip/time order, as value tuples"""
+    entries = LogEntry.objects.all()
+    if carrier:
+        entries = entries.filter(daily_log__trip__carrier_name=carrier)
+    if driver:
+        entries = entries.filter(daily_log__trip__driver_name=driver)
+    if truck:
+        entries = entries.filter(daily_log__trip__truck_number=truck)
+    if start_date:
+        entries = entries.filter(daily_log__date__gte=start_date)
+    if end_date:
+        entries = entries.filter(daily_log__date__lte=end_date)
+
+    return (entries
+            .order_by('daily_log__date', 'daily_log__trip_id', 'start_time', 'pk')
+            .values_list(*[column for _, column in EXPORT_FIELDS]))
+
+
+def _json_default(value):
+    """Dates and times as ISO 8601, and other values JSON has no type for (trip UUIDs) as text"""
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def iter_ndjson(rows):
+    """Encode value tuples as newline-delimited JSON objects, keeping numbers and nulls native"""
+    names = [name for name, _ in EXPORT_FIELDS]
+    for row in rows:
+        yield json.dumps(dict(zip(names, row)), default=_json_default) + '\n'
+
+
+def iter_csv(rows):
+    """Encode value tuples as CSV lines, header first"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values):
+        writer.writerow(values)
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    yield line([name for name, _ in EXPORT_FIELDS])
+    for row in rows:
+        yield line(row)
+
+
+def iter_export(output, chunk_size=None, using=None, **filters):
+    """Yield the encoded export in chunks of ROWS_PER_CHUNK lines, read from database ``using``"""
+    rows = log_entry_queryset(**filters).using(using).iterator(chunk_size=chunk_size or settings.EXPORT_CHUNK_SIZE)
+    lines = iter_csv(rows) if output == 'csv' else iter_ndjson(rows)
+
+    chunk = []
+    for text in lines:
+        chunk.append(text)
+        if len(chunk) >= ROWS_PER_CHUNK:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+async def _aiter_sync(iterator):
+    """Drive a sync iterator from async code one chunk at a time, on the DB thread"""
+    next_chunk = sync_to_async(lambda: next(iterator, None))
+    while True:
+        chunk = await next_chunk()
+        if chunk is None:
+            break
+        yield chunk
+
+
+def streaming_response(content, content_type, filename):
+    """StreamingHttpResponse for a sync iterator of chunks, async-iterated when served under ASGI"""
+    if settings.SERVER_MODE == 'asgi':
+        # Django buffers sync iterators completely under ASGI
+        content = _aiter_sync(content)
+
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def export_response(output, filename, **filters):
+    """StreamingHttpResponse for an export"""
+    # The body is read after the view returns, so pick the database while the request's routing applies
+    content = iter_export(output, using=router.db_for_read(LogEntry), **filters)
+    return streaming_response(content, CONTENT_TYPES[output], filename)
@@ -0,0 +1,208 @@
+import math
+
+import numpy as np
+
+EARTH_RADIUS_MILES = 3958.756
+MILES_PER_DEGREE = math.pi * EARTH_RADIUS_MILES / 180
+
+_GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash_encode(lat, lng, precision=7):
+    """Encode a coordinate as a geohash string of the given precision"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    lat = float(lat)
+    lng = float(lng)
+
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # Geohash interleaves bits starting with longitude
+
+    while len(chars) < precision:
+        if even:
+            mid = (lng_range[0] + lng_range[1]) / 2
+            if lng >= mid:
+                bits = (bits << 1) | 1
+                lng_range[0] = mid
+            else:
+                bits = bits << 1
+                lng_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if lat >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits = bits << 1
+                lat_range[1] = mid
+
+        even = not even
+        bit_count += 1
+
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(chars)
+
+
+def _as_radians(points):
+    """Convert a sequence of (lat, lng) pairs to an (n, 2) float array in radians"""
+    array = np.asarray(points, dtype=float).reshape(-1, 2)
+    return np.radians(array)
+
+
+def haversine_matrix(origins, destinations=None):
+    """All-pairs Haversine distances in miles between two lists of (lat, lng) pairs
+
+    Returns an ``(len(origins), len(destinations))`` array; ``destinations``
+    defaults to ``origins``. Uses the same formula as ``RouteService.calculate_distance``.
+    """
+    origins = _as_radians(origins)
+    destinations = origins if destinations is None else _as_radians(destinations)
+
+    lat1 = origins[:, 0][:, np.newaxis]
+    lng1 = origins[:, 1][:, np.newaxis]
+    lat2 = destinations[:, 0][np.newaxis, :]
+    lng2 = destinations[:, 1][np.newaxis, :]
+
+    dlat = lat2 - lat1
+    dlng = lng2 - lng1
+
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    return EARTH_RADIUS_MILES * c
+
+
+def haversine_pairs(origins, destinations):
+    """Haversine distances in miles from each of ``origins`` to the destination at the same position"""
+    origins = _as_radians(origins)
+    destinations = _as_radians(destinations)
+
+    dlat = destinations[:, 0] - origins[:, 0]
+    dlng = destinations[:, 1] - origins[:, 1]
+
+    a = np.sin(dlat / 2) ** 2 + np.cos(origins[:, 0]) * np.cos(destinations[:, 0]) * np.sin(dlng / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    return EARTH_RADIUS_MILES * c
+
+
+def haversine_one_to_many(origin, points):
+    """Haversine distances in miles from one (lat, lng) pair to each of ``points``"""
+    return haversine_matrix([origin], points)[0]
+
+
+class GridIndex:
+    """Nearest-point lookups over a fixed set of (lat, lng) points bucketed into a uniform grid"""
+
+    def __init__(self, lats, lngs, grid_degrees):
+        self.lats = np.asarray(lats, dtype=float)
+        self.lngs = np.asarray(lngs, dtype=float)
+        self.grid_degrees = grid_degrees
+
+        # Points sorted by cell, and each cell's slice of them
+        rows = np.floor(self.lats / grid_degrees).astype(np.int64)
+        cols = np.floor(self.lngs / grid_degrees).astype(np.int64)
+        order = np.lexsort((cols, rows))
+        self._points = order
+        self._cells = {}
+        if not len(order):
+            return
+
+        keys = np.stack([rows[order], cols[order]], axis=1)
+        starts = np.flatnonzero(np.any(keys[1:] != keys[:-1], axis=1)) + 1
+        bounds = np.concatenate([[0], starts, [len(order)]]).tolist()
+        for (row, col), start, end in zip(keys[bounds[:-1]].tolist(), bounds[:-1], bounds[1:]):
+            self._cells[row, col] = (start, end)
+
+    def __len__(self):
+        return len(self._points)
+
+    def nearest(self, lat, lng, max_miles):
+        """Return (index, miles) of the point nearest (lat, lng), or None if none is within ``max_miles``"""
+        lat = float(lat)
+        lng = float(lng)
+        row = int(math.floor(lat / self.grid_degrees))
+        col = int(math.floor(lng / self.grid_degrees))
+        # Points outside ring r of cells are at least r cell widths away
+        cell_miles = self.grid_degrees * MILES_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01)
+        max_ring = int(max_miles / cell_miles) + 1
+
+        best = None
+        for ring in range(max_ring + 1):
+            slices = [
+                self._cells.get((row + dr, col + dc))
+                for dr in range(-ring, ring + 1)
+                for dc in ((-ring, ring) if abs(dr) < ring else range(-ring, ring + 1))
+            ]
+            candidates = [self._points[start:end] for start, end in filter(None, slices)]
+            if candidates:
+                candidates = np.concatenate(candidates)
+                distances = haversine_one_to_many(
+                    (lat, lng), np.stack([self.lats[candidates], self.lngs[candidates]], axis=1)
+                )
+                index = int(distances.argmin())
+                if best is None or distances[index] < best[1]:
+                    best = (int(candidates[index]), float(distances[index]))
+            if best is not None and best[1] <= ring * cell_miles:
+                break
+
+        if best is None or best[1] > max_miles:
+            return None
+        return best
+
+
+def _encode_value(value, chunks):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+
+
+def encode_polyline(points, precision=5):
+    """Encode (lat, lng) pairs as a Google encoded polyline, the geometry format ORS returns"""
+    factor = 10 ** precision
+    chunks = []
+    prev_lat = prev_lng = 0
+    for lat, lng in points:
+        lat = int(round(float(lat) * factor))
+        lng = int(round(float(lng) * factor))
+        _encode_value(lat - prev_lat, chunks)
+        _encode_value(lng - prev_lng, chunks)
+        prev_lat, prev_lng = lat, lng
+    return ''.join(chunks)
+
+
+def decode_polyline_array(encoded, precision=5):
+    """Decode a Google encoded polyline into an (n, 2) array of (lat, lng), without a Python loop per character"""
+    chunks = np.frombuffer(encoded.encode('ascii'), dtype=np.uint8).astype(np.int64) - 63
+    # Each value ends at its first chunk without the continuation bit
+    last = chunks < 0x20
+    ends = np.flatnonzero(last)
+    if not len(ends):
+        return np.empty((0, 2))
+    chunks = chunks[:ends[-1] + 1]
+    last = last[:ends[-1] + 1]
+
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    value_of_chunk = np.cumsum(last) - last
+    shifts = 5 * (np.arange(len(chunks)) - starts[value_of_chunk])
+    values = np.add.reduceat((chunks & 0x1f) << shifts, starts)
+    values = np.where(values & 1, ~(values >> 1), values >> 1)
+
+    deltas = values[:len(values) // 2 * 2].reshape(-1, 2)
+    return np.cumsum(deltas, axis=0) / 10 ** precision
+
+
+def decode_polyline(encoded, precision=5):
+    """Decode a Google encoded polyline into a list of (lat, lng) pairs"""
+    if not encoded:
+        return []
+    lats, lngs = decode_polyline_array(encoded, precision).T.tolist()
+    return list(zip(lats, lngs))
@@ -0,0 +1,261 @@
+"""Server-side geocoding of location names against a local gazetteer
+
+Places are loaded from a CSV into three in-memory indexes: a dict of normalized
+names for exact matches, the same names sorted for prefix matches, and trigram
+posting lists scored with the Dice coefficient for misspelt or partial names.
+Reverse lookups go through a grid index of the places. Names resolved for trips
+are cached in GeocodedLocation, so each name is only matched once and an admin
+can correct what a name resolves to.
+"""
+import bisect
+import csv
+import logging
+import re
+import threading
+from decimal import Decimal
+from functools import lru_cache
+from typing import NamedTuple
+
+import numpy as np
+from django.conf import settings
+
+from .geo import GridIndex
+from .models import GeocodedLocation
+
+logger = logging.getLogger(__name__)
+
+# Keys scanned for prefix matches; enough to rank the most populous completions of short prefixes
+PREFIX_SCAN = 500
+# Score of a prefix match, above most fuzzy matches but below an exact one
+PREFIX_SCORE = 0.9
+
+LOCATION_FIELDS = (
+    ('current_location', 'current_lat', 'current_lng'),
+    ('pickup_location', 'pickup_lat', 'pickup_lng'),
+    ('dropoff_location', 'dropoff_lat', 'dropoff_lng'),
+)
+STOP_LOCATION_FIELDS = (
+    ('location', 'lat', 'lng'),
+)
+
+_NON_WORD = re.compile(r'[^\w]+')
+
+
+def _coordinate(value):
+    return Decimal(str(round(value, 6)))
+
+
+class Place(NamedTuple):
+    name: str
+    lat: float
+    lng: float
+    population: int = 0
+
+    def coordinates(self):
+        """(lat, lng) as Decimals at the precision trips store"""
+        return _coordinate(self.lat), _coordinate(self.lng)
+
+
+def normalize(name):
+    """Case- and punctuation-insensitive form of a location name"""
+    return _NON_WORD.sub(' ', name.lower()).strip()
+
+
+def _trigrams(key):
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Gazetteer:
+    """Places indexed for exact, prefix and fuzzy name lookups and nearest-place lookups"""
+
+    def __init__(self, places, grid_degrees=0.25, min_similarity=0.5, reverse_max_miles=25):
+        self.places = places
+        self.min_similarity = min_similarity
+        self.reverse_max_miles = reverse_max_miles
+
+        # Each place is found by its full name ("Denver, CO") and its bare name ("Denver");
+        # a name shared by several places resolves to the most populous
+        best = {}
+        for index, place in enumerate(places):
+            for key in {normalize(place.name), normalize(place.name.split(',')[0])}:
+                if key and (key not in best or place.population > places[best[key]].population):
+                    best[key] = index
+        self._keys = sorted(best)
+        self._exact = best
+        self._key_places = np.array([best[key] for key in self._keys], dtype=np.int64)
+        self._populations = np.array([place.population for place in places], dtype=np.int64)
+
+        postings = {}
+        trigram_counts = []
+        for key_index, key in enumerate(self._keys):
+            trigrams = _trigrams(key)
+            trigram_counts.append(len(trigrams))
+            for trigram in trigrams:
+                postings.setdefault(trigram, []).append(key_index)
+        self._postings = {trigram: np.array(ids, dtype=np.int64) for trigram, ids in postings.items()}
+        self._trigram_counts = np.array(trigram_counts, dtype=float)
+
+        self._grid = GridIndex([place.lat for place in places], [place.lng for place in places], grid_degrees)
+
+    @classmethod
+    def from_csv(cls, path, **options):
+        """Load a CSV with ``name,lat,lng`` columns and optional ``region`` and ``population``"""
+        places = []
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                name = row['name'].strip()
+                region = (row.get('region') or '').strip()
+                places.append(Place(
+                    f'{name}, {region}' if region else name,
+                    float(row['lat']),
+                    float(row['lng']),
+                    int(float(row.get('population') or 0))
+                ))
+        return cls(places, **options)
+
+    def _prefixed(self, key):
+        """Key indexes starting with ``key``, at most PREFIX_SCAN of them"""
+        start = bisect.bisect_left(self._keys, key)
+        end = start
+        while end < len(self._keys) and end - start < PREFIX_SCAN and self._keys[end].startswith(key):
+            end += 1
+        return np.arange(start, end, dtype=np.int64)
+
+    def search(self, query, limit=10):
+        """Return up to ``limit`` (place, score) matches for a name, best first
+
+        Scores are 1 for an exact match, PREFIX_SCORE for a name the query starts, and
+        otherwise the Dice coefficient of the trigrams of the query and the name.
+        """
+        key = normalize(query)
+        if not key:
+            return []
+
+        trigrams = _trigrams(key)
+        postings = [self._postings[trigram] for trigram in trigrams if trigram in self._postings]
+        ids = np.empty(0, dtype=np.int64)
+        scores = np.empty(0)
+        if postings:
+            shared = np.bincount(np.concatenate(postings), minlength=len(self._keys))
+            ids = np.flatnonzero(shared)
+            scores = 2 * shared[ids] / (len(trigrams) + self._trigram_counts[ids])
+
+        prefixed = self._prefixed(key)
+        ids = np.concatenate([ids, prefixed])
+        scores = np.concatenate([scores, np.full(len(prefixed), PREFIX_SCORE)])
+        if key in self._exact:
+            ids = np.append(ids, bisect.bisect_left(self._keys, key))
+            scores = np.append(scores, 1.0)
+
+        keep = scores >= self.min_similarity
+        ids, scores = ids[keep], scores[keep]
+        # Best score first, then the more populous place; a place can match by several keys
+        order = np.lexsort((-self._populations[self._key_places[ids]], -scores))
+        results = []
+        seen = set()
+        for key_index, score in zip(ids[order].tolist(), scores[order].tolist()):
+            place_index = int(self._key_places[key_index])
+            if place_index not in seen:
+                seen.add(place_index)
+                results.append((self.places[place_index], round(score, 3)))
+                if len(results) >= limit:
+                    break
+        return results
+
+    def lookup(self, query):
+        """Return the best-matching Place for a name, or None if nothing is similar enough"""
+        exact = self._exact.get(normalize(query))
+        if exact is not None:
+            return self.places[exact]
+        matches = self.search(query, limit=1)
+        return matches[0][0] if matches else None
+
+    def reverse(self, lat, lng, max_miles=None):
+        """Return (place, miles) for the place nearest a point, or None if none is within ``max_miles``"""
+        found = self._grid.nearest(lat, lng, self.reverse_max_miles if max_miles is None else max_miles)
+        return (self.places[found[0]], found[1]) if found else None
+
+    def stats(self):
+        return {'places': len(self.places), 'names': len(self._keys), 'trigrams': len(self._postings)}
+
+
+_gazetteer = None
+_gazetteer_loaded = False
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """Return the process-wide gazetteer, or None if GEOCODING_GAZETTEER_PATH isn't set or fails to load"""
+    global _gazetteer, _gazetteer_loaded
+
+    if not _gazetteer_loaded:
+        with _gazetteer_lock:
+            if not _gazetteer_loaded:
+                options = settings.GEOCODING
+                if options['GAZETTEER_PATH']:
+                    try:
+                        _gazetteer = Gazetteer.from_csv(
+                            options['GAZETTEER_PATH'],
+                            grid_degrees=options['GRID_DEGREES'],
+                            min_similarity=options['MIN_SIMILARITY'],
+                            reverse_max_miles=options['REVERSE_MAX_MILES'],
+                        )
+                    except (OSError, KeyError, ValueError) as e:
+                        logger.error('Could not load gazetteer from %s: %s', options['GAZETTEER_PATH'], e)
+                _gazetteer_loaded = True
+    return _gazetteer
+
+
+def geocode_many(names):
+    """Resolve location names to Places in one cache query, matching and caching names not seen before
+
+    Returns a dict of name to Place, or to None for names that can't be resolved.
+    """
+    keys = {name: normalize(name) for name in names}
+    cached = {
+        row.query: Place(row.name, float(row.lat), float(row.lng))
+        for row in GeocodedLocation.objects.filter(query__in=set(keys.values()))
+    }
+
+    gazetteer = get_gazetteer()
+    resolved = {}
+    new = {}
+    for name, key in keys.items():
+        place = cached.get(key) or new.get(key)
+        if place is None and gazetteer is not None:
+            place = gazetteer.lookup(name)
+            if place is not None:
+                new[key] = place
+        resolved[name] = place
+
+    if new:
+        GeocodedLocation.objects.bulk_create([
+            GeocodedLocation(query=key, name=place.name, lat=lat, lng=lng)
+            for key, place in new.items()
+            for lat, lng in [place.coordinates()]
+        ], ignore_conflicts=True)
+    return resolved
+
+
+def names_to_geocode(payload, location_fields=LOCATION_FIELDS):
+    """Location names of a trip (or stop) payload given without coordinates"""
+    if not isinstance(payload, dict):
+        return set()
+    return {
+        payload[name_field]
+        for name_field, lat_field, lng_field in location_fields
+        if isinstance(payload.get(name_field), str)
+        and payload.get(lat_field) is None and payload.get(lng_field) is None
+    }
+
+
+@lru_cache(maxsize=4096)
+def place_near(lat, lng):
+    """Name of the place nearest (lat, lng), or None without a gazetteer or a place in reach
+
+    Memoized, since re-planning a lane names the same points again.
+    """
+    gazetteer = get_gazetteer()
+    found = gazetteer.reverse(lat, lng) if gazetteer is not None else None
+    return found[0].name if found else None
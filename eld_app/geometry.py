@@ -0,0 +1,217 @@
+"""Route geometry: compact storage of each leg and simplification for the map
+
+Legs are stored as encoded polylines (precision 5, the format ORS returns), a few
+bytes per coordinate instead of the ~20 of a JSON array, and kept out of the trip
+payloads. The geometry endpoint simplifies them with Douglas-Peucker to a tolerance
+matched to the map's zoom. The planner looks up points along a leg by mileage to
+place its stops and name the towns it passes.
+"""
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .db_router import primary_reads
+from .geo import EARTH_RADIUS_MILES, decode_polyline, decode_polyline_array, encode_polyline, haversine_pairs
+from .models import RouteGeometry, Trip
+
+# Web Mercator ground resolution of one pixel of a 256-px tile at zoom 0, at the equator
+MILES_PER_PIXEL_AT_ZOOM_0 = 156543.03392 / 1609.344
+MAX_ZOOM = 22
+# Memory for the decoded leg paths the planner keeps; each point takes 24 bytes
+LEG_PATH_CACHE_BYTES = 4 * 1024 * 1024
+
+
+def tolerance_for_zoom(zoom, pixels=1.0):
+    """Simplification tolerance in miles that stays under ``pixels`` on screen at a map zoom"""
+    return pixels * MILES_PER_PIXEL_AT_ZOOM_0 / 2 ** zoom
+
+
+def route_polyline(route, leg):
+    """Encoded polyline of a routed leg, or a straight line between its ends if the route has no geometry"""
+    geometry = route.get('geometry')
+    if isinstance(geometry, str) and geometry:
+        return geometry
+    # GeoJSON LineString, as ORS returns with geometry_format=geojson
+    if isinstance(geometry, dict):
+        geometry = geometry.get('coordinates')
+    if geometry:
+        return encode_polyline((lat, lng) for lng, lat, *_ in geometry)
+
+    start_lat, start_lng, end_lat, end_lng = leg
+    return encode_polyline([(start_lat, start_lng), (end_lat, end_lng)])
+
+
+def leg_geometries(trip, legs, routes, first_leg=0):
+    """Unsaved RouteGeometry rows for routed legs, numbered from ``first_leg``"""
+    return [
+        RouteGeometry(trip=trip, leg=first_leg + index, polyline=route_polyline(route, leg))
+        for index, (leg, route) in enumerate(zip(legs, routes))
+    ]
+
+
+class LegPathCache:
+    """Thread-safe LRU cache of decoded leg paths, bounded by the bytes of their arrays
+
+    Entries are keyed on a digest of the leg's polyline rather than the polyline
+    itself, so a key costs the same few bytes however long the leg is.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            path = self._data.get(key)
+            if path is not None:
+                self._data.move_to_end(key)
+            return path
+
+    def set(self, key, path):
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.size -= _path_bytes(previous)
+            self._data[key] = path
+            self.size += _path_bytes(path)
+
+            # A path larger than the whole budget is still kept until the next one comes in
+            while self.size > self.max_bytes and len(self._data) > 1:
+                _, evicted = self._data.popitem(last=False)
+                self.size -= _path_bytes(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+def _path_bytes(path):
+    miles, points = path
+    return miles.nbytes + points.nbytes
+
+
+_leg_paths = LegPathCache(LEG_PATH_CACHE_BYTES)
+
+
+def _leg_path(polyline, distance_miles):
+    """Points of a leg's encoded polyline and their miles from its start, as (miles, points) arrays"""
+    key = (hashlib.blake2b(polyline.encode(), digest_size=16).digest(), distance_miles)
+    path = _leg_paths.get(key)
+    if path is not None:
+        return path
+
+    points = decode_polyline_array(polyline)
+    miles = np.concatenate([[0.0], np.cumsum(haversine_pairs(points[:-1], points[1:]))])
+    # Stops are planned on the route's distance, which the simplified geometry can fall short of
+    if miles[-1] > 0:
+        miles *= distance_miles / miles[-1]
+    _leg_paths.set(key, (miles, points))
+    return miles, points
+
+
+class LegPath:
+    """Points along a routed leg by miles from its start, for placing the stops planned on it
+
+    The geometry is decoded the first time a position is asked for, so legs planned
+    without stops cost nothing extra. Decoded paths are shared through a cache
+    bounded by memory, since dispatch re-plans the same lanes.
+    """
+
+    def __init__(self, route, leg):
+        self.route = route
+        self.leg = leg
+        self._path = None
+
+    def position(self, miles):
+        """(lat, lng) ``miles`` along the leg"""
+        if self._path is None:
+            self._path = _leg_path(route_polyline(self.route, self.leg), float(self.route['distance_miles']))
+        path_miles, points = self._path
+        return float(np.interp(miles, path_miles, points[:, 0])), float(np.interp(miles, path_miles, points[:, 1]))
+
+
+def simplify(points, tolerance_miles):
+    """Douglas-Peucker simplification of (lat, lng) points
+
+    Keeps the fewest points such that no dropped point lies further than
+    ``tolerance_miles`` from the simplified line.
+    """
+    if len(points) < 3 or tolerance_miles <= 0:
+        return list(points)
+
+    coords = np.radians(np.asarray(points, dtype=float))
+    # Sinusoidal projection around the line's mean longitude, in miles
+    x = EARTH_RADIUS_MILES * (coords[:, 1] - coords[:, 1].mean()) * np.cos(coords[:, 0])
+    y = EARTH_RADIUS_MILES * coords[:, 0]
+    xy = np.stack([x, y], axis=1)
+
+    keep = np.zeros(len(xy), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(xy) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+
+        start = xy[first]
+        direction = xy[last] - start
+        offsets = xy[first + 1:last] - start
+        length_squared = direction @ direction
+        # Distance to the segment, not the infinite line, so backtracking points are kept
+        if length_squared:
+            t = np.clip(offsets @ direction / length_squared, 0, 1)
+            offsets = offsets - t[:, np.newaxis] * direction
+        distances = np.hypot(offsets[:, 0], offsets[:, 1])
+
+        index = int(distances.argmax())
+        if distances[index] > tolerance_miles:
+            split = first + 1 + index
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+
+    return [point for point, kept in zip(points, keep.tolist()) if kept]
+
+
+def trip_geometry(trip_id, tolerance_miles=0):
+    """Payload of a trip's leg polylines simplified to ``tolerance_miles``, or None if there's no such trip"""
+    # Read from the primary, as the result is cached against the trip's current version
+    with primary_reads():
+        legs = list(RouteGeometry.objects.filter(trip_id=trip_id).values_list('leg', 'polyline'))
+        if not legs and not Trip.objects.filter(id=trip_id).exists():
+            return None
+
+    result = []
+    for leg, polyline in legs:
+        points = decode_polyline(polyline)
+        simplified = simplify(points, tolerance_miles)
+        result.append({
+            'leg': leg,
+            'polyline': encode_polyline(simplified) if len(simplified) < len(points) else polyline,
+            'points': len(simplified),
+            'source_points': len(points)
+        })
+
+    return {
+        'trip_id': str(trip_id),
+        'encoding': 'polyline',
+        'precision': 5,
+        'tolerance_miles': tolerance_miles,
+        'legs': result
+    }
+
+
+def normalize_tolerance(tolerance_miles):
+    """Round a tolerance to 3 significant figures so near-identical requests share a cache entry"""
+    if tolerance_miles <= 0:
+        return 0.0
+    return round(tolerance_miles, 2 - int(math.floor(math.log10(tolerance_miles))))
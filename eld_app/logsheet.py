@@ -0,0 +1,318 @@
+"""Server-side rendering of each daily log's 24-hour duty-status grid (log sheet) as SVG
+
+A sheet is a pure function of its sheet data (the log's header fields and duty periods),
+so rendered sheets are cached content-addressed by a hash of that data and unchanged
+days of a re-planned trip keep theirs. Each trip's date -> hash index is cached against
+the trip cache's version stamps, so repeat views are served without touching the database.
+"""
+import hashlib
+import io
+import json
+import logging
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, transaction
+
+from . import metrics
+from .db_router import primary_reads
+from .models import DailyLog, LogEntry, Trip
+from .trip_cache import get_versioned
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the drawing changes, so sheets rendered by older code aren't served
+RENDER_VERSION = 1
+
+ROWS = [
+    ('off_duty', 'Off Duty'),
+    ('sleeper_berth', 'Sleeper Berth'),
+    ('driving', 'Driving'),
+    ('on_duty_not_driving', 'On Duty (Not Driving)')
+]
+ROW_INDEX = {status: index for index, (status, _) in enumerate(ROWS)}
+DAY_SECONDS = 86400
+
+# Layout in SVG user units: 30 per hour across the grid
+WIDTH = 1000
+GRID_LEFT = 170
+GRID_WIDTH = 720
+GRID_TOP = 110
+ROW_HEIGHT = 36
+TOTALS_LEFT = GRID_LEFT + GRID_WIDTH + 20
+LINE_HEIGHT = 16
+
+
+def _cache():
+    return caches[settings.LOGSHEET['CACHE_ALIAS']]
+
+
+def _sheet_key(sheet_hash):
+    return f'logsheet:{sheet_hash}'
+
+
+def _packet_key(packet_hash):
+    return f'logsheet-packet:{packet_hash}'
+
+
+def _seconds(value):
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def _hhmm(seconds):
+    minutes = int(round(seconds / 60))
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+def trip_sheets(trip_id):
+    """Sheet data of each daily log of a trip keyed by ISO date, or None if there's no such trip"""
+    # Read from the primary, as the index built from this is cached against the trip's current version
+    with primary_reads():
+        trip = (Trip.objects.filter(id=trip_id)
+                .values('driver_name', 'carrier_name', 'truck_number', 'current_location', 'dropoff_location')
+                .first())
+        if trip is None:
+            return None
+        logs = list(DailyLog.objects.filter(trip_id=trip_id).order_by('date').values_list('id', 'date', 'total_miles'))
+        entries = (LogEntry.objects.filter(daily_log__trip_id=trip_id)
+                   .order_by('start_time', 'pk')
+                   .values_list('daily_log_id', 'start_time', 'end_time', 'duty_status', 'location', 'remarks'))
+
+        entries_by_log = {}
+        for log_id, *entry in entries:
+            entries_by_log.setdefault(log_id, []).append(entry)
+
+    sheets = {}
+    # Part of the previous day's last period running past midnight
+    carried = None
+    previous_date = None
+    for log_id, date, total_miles in logs:
+        periods = []
+        if carried and (date - previous_date).days == 1:
+            periods.append(carried)
+        carried = None
+
+        for start, end, status, location, remarks in entries_by_log.get(log_id, []):
+            start, end = _seconds(start), _seconds(end)
+            if end == start:
+                continue
+            if end < start:
+                carried = [0, end, status, location, remarks]
+                end = DAY_SECONDS
+            periods.append([start, end, status, location, remarks])
+
+        sheets[date.isoformat()] = {
+            'date': date.isoformat(),
+            'driver_name': trip['driver_name'],
+            'carrier_name': trip['carrier_name'],
+            'truck_number': trip['truck_number'],
+            'origin': trip['current_location'],
+            'destination': trip['dropoff_location'],
+            'total_miles': str(total_miles),
+            'periods': periods
+        }
+        previous_date = date
+    return sheets
+
+
+def sheet_hash(sheet):
+    """Content hash of sheet data (and the renderer version)"""
+    payload = json.dumps([RENDER_VERSION, sheet], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _timeline(periods):
+    """Periods in order, clipped to the day, with unlogged time filled in as off duty"""
+    timeline = []
+    cursor = 0
+    for start, end, status, location, remarks in sorted(periods, key=lambda period: period[0]):
+        start = max(start, cursor)
+        end = min(end, DAY_SECONDS)
+        if end <= start:
+            continue
+        if start > cursor:
+            timeline.append((cursor, start, 'off_duty', '', ''))
+        timeline.append((start, end, status, location, remarks))
+        cursor = end
+    if cursor < DAY_SECONDS:
+        timeline.append((cursor, DAY_SECONDS, 'off_duty', '', ''))
+    return timeline
+
+
+def _x(seconds):
+    return GRID_LEFT + GRID_WIDTH * seconds / DAY_SECONDS
+
+
+@metrics.timed('logsheet')
+def render_svg(sheet):
+    """Render sheet data as an SVG log sheet"""
+    timeline = _timeline(sheet['periods'])
+    totals = dict.fromkeys(ROW_INDEX, 0)
+    for start, end, status, _, _ in timeline:
+        totals[status] += end - start
+    remarks = [(start, location, text) for start, _, _, location, text in timeline if location or text]
+
+    grid_bottom = GRID_TOP + ROW_HEIGHT * len(ROWS)
+    height = grid_bottom + 50 + LINE_HEIGHT * len(remarks)
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{height}" '
+        f'viewBox="0 0 {WIDTH} {height}" font-family="Helvetica, Arial, sans-serif" font-size="11">',
+        f'<rect width="{WIDTH}" height="{height}" fill="#fff"/>',
+        f'<text x="20" y="28" font-size="16" font-weight="bold">Driver\'s Daily Log - {escape(sheet["date"])}</text>',
+        f'<text x="20" y="50">Driver: {escape(sheet["driver_name"])}    Carrier: {escape(sheet["carrier_name"])}'
+        f'    Truck: {escape(sheet["truck_number"])}</text>',
+        f'<text x="20" y="68">From: {escape(sheet["origin"])}    To: {escape(sheet["destination"])}</text>',
+        f'<text x="20" y="86">Total miles driving today: {escape(sheet["total_miles"])}</text>',
+        f'<text x="{TOTALS_LEFT}" y="{GRID_TOP - 6}" font-weight="bold">Hours</text>',
+    ]
+
+    for hour in range(25):
+        label = 'Mid' if hour in (0, 24) else 'Noon' if hour == 12 else str(hour % 12)
+        parts.append(f'<text x="{_x(hour * 3600):.1f}" y="{GRID_TOP - 6}" text-anchor="middle">{label}</text>')
+
+    for index, (status, label) in enumerate(ROWS):
+        top = GRID_TOP + index * ROW_HEIGHT
+        middle = top + ROW_HEIGHT / 2 + 4
+        parts.append(f'<rect x="{GRID_LEFT}" y="{top}" width="{GRID_WIDTH}" height="{ROW_HEIGHT}" fill="none" stroke="#000"/>')
+        parts.append(f'<text x="{GRID_LEFT - 8}" y="{middle}" text-anchor="end">{index + 1}. {label}</text>')
+        parts.append(f'<text x="{TOTALS_LEFT}" y="{middle}">{_hhmm(totals[status])}</text>')
+    parts.append(f'<text x="{TOTALS_LEFT}" y="{grid_bottom + 16}" font-weight="bold">{_hhmm(sum(totals.values()))}</text>')
+
+    # Hour lines across each row, with half- and quarter-hour ticks hanging from its top
+    ticks = []
+    for quarter in range(1, 96):
+        x = _x(quarter * 900)
+        for index in range(len(ROWS)):
+            top = GRID_TOP + index * ROW_HEIGHT
+            length = ROW_HEIGHT if quarter % 4 == 0 else ROW_HEIGHT / 2 if quarter % 2 == 0 else ROW_HEIGHT / 4
+            ticks.append(f'M{x:.1f} {top}v{length:g}')
+    parts.append(f'<path d="{"".join(ticks)}" stroke="#888" stroke-width="0.5"/>')
+
+    line = []
+    for start, end, status, _, _ in timeline:
+        y = GRID_TOP + ROW_HEIGHT * (ROW_INDEX[status] + 0.5)
+        line.append(f'V{y:g}' if line else f'M{_x(start):.1f} {y:g}')
+        line.append(f'H{_x(end):.1f}')
+    parts.append(f'<path d="{"".join(line)}" fill="none" stroke="#1a4fd6" stroke-width="2.5"/>')
+
+    y = grid_bottom + 34
+    parts.append(f'<text x="20" y="{y}" font-weight="bold">Remarks</text>')
+    for start, location, text in remarks:
+        y += LINE_HEIGHT
+        parts.append(f'<text x="20" y="{y}">{_hhmm(start)}  {escape(location)}: {escape(text)}</text>')
+
+    parts.append('</svg>')
+    return ''.join(parts).encode()
+
+
+def _build_index(trip_id):
+    sheets = trip_sheets(trip_id)
+    if sheets is None:
+        return None
+
+    hashes = {date: sheet_hash(sheet) for date, sheet in sheets.items()}
+    # Rendering every day up front is what makes the first views cache hits too
+    cached = _cache().get_many([_sheet_key(value) for value in hashes.values()])
+    rendered = {
+        _sheet_key(hashes[date]): render_svg(sheet)
+        for date, sheet in sheets.items()
+        if _sheet_key(hashes[date]) not in cached
+    }
+    if rendered:
+        _cache().set_many(rendered, timeout=settings.LOGSHEET['TTL_SECONDS'])
+    return hashes
+
+
+def sheet_index(trip_id):
+    """Return the {ISO date: sheet hash} of a trip's logs, rendering any uncached sheets, or None"""
+    return get_versioned(trip_id, 'logsheets', _build_index)
+
+
+def _sheets(trip_id, index):
+    """Return {date: (hash, svg)} for the dates of an index, re-rendering sheets evicted from the cache"""
+    keys = {date: _sheet_key(value) for date, value in index.items()}
+    cached = _cache().get_many(list(keys.values()))
+    sheets = {date: (index[date], cached[key]) for date, key in keys.items() if key in cached}
+
+    missing = [date for date in keys if date not in sheets]
+    if missing:
+        # The trip may also have changed since the index was built, so render what it holds now
+        current = trip_sheets(trip_id) or {}
+        rendered = {
+            date: (sheet_hash(current[date]), render_svg(current[date]))
+            for date in missing if date in current
+        }
+        _cache().set_many(
+            {_sheet_key(value): svg for value, svg in rendered.values()},
+            timeout=settings.LOGSHEET['TTL_SECONDS']
+        )
+        sheets.update(rendered)
+    return sheets
+
+
+def get_sheet(trip_id, date):
+    """Return (hash, svg) for one day of a trip, or None if the trip has no log that day"""
+    index = sheet_index(trip_id)
+    if not index or date not in index:
+        return None
+    return _sheets(trip_id, {date: index[date]}).get(date)
+
+
+def get_packet(trip_id):
+    """Return (hash, zip bytes) of every log sheet of a trip, or None if there's no such trip"""
+    index = sheet_index(trip_id)
+    if index is None:
+        return None
+
+    packet_hash = hashlib.sha256(json.dumps(sorted(index.items())).encode()).hexdigest()
+    packet = _cache().get(_packet_key(packet_hash))
+    if packet is None:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for date, (_, svg) in sorted(_sheets(trip_id, index).items()):
+                # Fixed timestamps keep the archive bytes a function of the sheets
+                info = zipfile.ZipInfo(f'{date}.svg', date_time=tuple(map(int, date.split('-'))) + (0, 0, 0))
+                info.compress_type = zipfile.ZIP_DEFLATED
+                archive.writestr(info, svg)
+        packet = buffer.getvalue()
+        _cache().set(_packet_key(packet_hash), packet, timeout=settings.LOGSHEET['TTL_SECONDS'])
+    return packet_hash, packet
+
+
+_prerender_executor = None
+_prerender_executor_lock = threading.Lock()
+
+
+def _get_prerender_executor():
+    """Return the process-wide single thread that pre-renders log sheets"""
+    global _prerender_executor
+
+    if _prerender_executor is None:
+        with _prerender_executor_lock:
+            if _prerender_executor is None:
+                _prerender_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='logsheet')
+    return _prerender_executor
+
+
+def _prerender(trip_ids):
+    try:
+        for trip_id in trip_ids:
+            sheet_index(trip_id)
+    except Exception:
+        logger.exception('Pre-rendering log sheets failed')
+    finally:
+        # Close outright: with persistent connections close_old_connections() would keep an
+        # idle one open on this thread on top of the request threads' own
+        connections.close_all()
+
+
+def prerender_on_commit(trip_ids):
+    """Render the log sheets of trips in the background once the current transaction commits"""
+    if not settings.LOGSHEET['PRERENDER']:
+        return
+    trip_ids = list(trip_ids)
+    transaction.on_commit(lambda: _get_prerender_executor().submit(_prerender, trip_ids))
@@ -0,0 +1,231 @@
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from eld_app.benchmarking import StubORSServer, best_per_call, gunicorn_server, run_load, trip_payload_factory
+from eld_app.services import HOSService, RouteService, _plan_leg
+
+# Metrics where a larger value is better; every other compared metric is better smaller
+HIGHER_IS_BETTER = ('throughput_rps',)
+# Metrics compared between runs; the rest (counts, means, maxima) are informational
+COMPARED_METRICS = {
+    'micro': ('us_per_call', 'cold_us', 'memoized_us', 'us'),
+    'load': ('p50_ms', 'p95_ms', 'throughput_rps', 'errors'),
+}
+
+
+def flatten(results, prefix=''):
+    """Flatten nested result dicts into {'a.b.c': number}"""
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{name}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(baseline, current, threshold):
+    """Return (name, baseline, current, change) for each metric that regressed beyond ``threshold``"""
+    base = flatten({'micro': baseline.get('micro', {}), 'load': baseline.get('load', {})})
+    new = flatten({'micro': current.get('micro', {}), 'load': current.get('load', {})})
+
+    regressions = []
+    for name, value in new.items():
+        metric = name.rsplit('.', 1)[-1]
+        if name not in base or metric not in COMPARED_METRICS[name.split('.', 1)[0]]:
+            continue
+        old = base[name]
+        if metric == 'errors':
+            regressed = value > old
+        elif metric in HIGHER_IS_BETTER:
+            regressed = value < old * (1 - threshold)
+        else:
+            regressed = value > old * (1 + threshold)
+        if regressed:
+            change = (value - old) / old if old else float('inf')
+            regressions.append((name, old, value, change))
+    return regressions
+
+
+class Command(BaseCommand):
+    help = ('Run the planner microbenchmarks and create/get/list load scenarios against a stub ORS, '
+            'write the results as JSON and optionally fail on regressions against a baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--suite', choices=['micro', 'load', 'all'], default='all')
+        parser.add_argument('--output', help='Write results JSON here (default: stdout)')
+        parser.add_argument('--baseline', help='Results JSON of an earlier run to compare against')
+        parser.add_argument('--max-regression', type=float, default=0.2,
+                            help='Allowed relative slowdown per metric before the run fails')
+
+        micro = parser.add_argument_group('microbenchmarks')
+        micro.add_argument('--miles', type=float, nargs='+', default=[300, 800, 1500, 3000],
+                           help='Trip lengths to plan')
+        micro.add_argument('--iterations', type=int, default=2000)
+        micro.add_argument('--repeat', type=int, default=5)
+
+        load = parser.add_argument_group('load scenarios')
+        load.add_argument('--database-url', action='append', dest='database_urls',
+                          help='Database to load-test (repeatable); defaults to a throwaway SQLite file')
+        load.add_argument('--scenarios', nargs='+', choices=['create', 'get', 'list'],
+                          default=['create', 'get', 'list'])
+        load.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+        load.add_argument('--concurrency', type=int, default=16, help='Concurrent client threads')
+        load.add_argument('--workers', type=int, default=2, help='Server worker processes')
+        load.add_argument('--ors-latency', type=float, default=0.05, help='Seconds added to every stub ORS call')
+        load.add_argument('--ors-failure-rate', type=float, default=0.0,
+                          help='Fraction of stub ORS calls answered with a 503')
+        load.add_argument('--port', type=int, default=8766)
+        load.add_argument('--seed', type=int, default=42)
+
+    def run_micro(self, options):
+        iterations = options['iterations']
+        repeat = options['repeat']
+        rng = random.Random(options['seed'])
+        points = [(rng.uniform(25, 49), rng.uniform(-124, -67)) for _ in range(64)]
+        pairs = list(zip(points, points[1:]))
+
+        def distances():
+            for (lat1, lng1), (lat2, lng2) in pairs:
+                RouteService.calculate_distance(lat1, lng1, lat2, lng2)
+
+        results = {
+            'calculate_distance': {'us_per_call': round(best_per_call(distances, iterations, repeat) / len(pairs), 4)}
+        }
+
+        for miles in options['miles']:
+            hours = miles / 55
+
+            def plan():
+                return HOSService._plan_segment('Origin', 'Destination', miles, hours, 20.0, 1)
+
+            segments = plan()
+            results[f'plan_segment_{miles:.0f}mi'] = {
+                'cold_us': round(best_per_call(plan, iterations, repeat, setup=_plan_leg.cache_clear), 3),
+                'memoized_us': round(best_per_call(plan, iterations, repeat), 3),
+            }
+            results[f'generate_daily_logs_{miles:.0f}mi'] = {
+                'us': round(best_per_call(lambda: HOSService.generate_daily_logs(None, segments), iterations, repeat), 3),
+                'segments': len(segments),
+            }
+        return results
+
+    def prepare_database(self, database_url):
+        env = {**os.environ, 'DATABASE_URL': database_url}
+        for command in (['migrate', '--noinput', '-v0'], ['createcachetable']):
+            subprocess.run([sys.executable, 'manage.py', *command], env=env, cwd=settings.BASE_DIR, check=True)
+
+    def run_scenarios(self, base_url, options):
+        results = {}
+        total = options['requests']
+        concurrency = options['concurrency']
+
+        # Creation also seeds the trips the read scenarios fetch
+        if 'create' in options['scenarios'] or 'get' in options['scenarios']:
+            results['create'] = run_load(
+                'POST', f'{base_url}/api/trips/create/', total, concurrency,
+                payload_factory=trip_payload_factory(options['seed']), expected_status={201},
+            )
+
+        if 'get' in options['scenarios']:
+            page = requests.get(f'{base_url}/api/trips/', params={'view': 'summary', 'page_size': 500}, timeout=60)
+            ids = [trip['id'] for trip in page.json()['results']]
+            if ids:
+                results['get'] = run_load(
+                    'GET', lambda i: f'{base_url}/api/trips/{ids[i % len(ids)]}/', total, concurrency,
+                    expected_status={200},
+                )
+
+        if 'list' in options['scenarios']:
+            results['list'] = run_load(
+                'GET', f'{base_url}/api/trips/?page_size=50', total, concurrency, expected_status={200},
+            )
+
+        if 'create' not in options['scenarios']:
+            results.pop('create', None)
+        return results
+
+    def run_load_suite(self, options):
+        scratch = None
+        database_urls = options['database_urls']
+        if not database_urls:
+            scratch = tempfile.mkdtemp(prefix='eld-benchmark-')
+            database_urls = [f"sqlite:///{os.path.join(scratch, 'benchmark.sqlite3')}"]
+
+        results = {}
+        try:
+            with StubORSServer(latency=options['ors_latency'], failure_rate=options['ors_failure_rate'],
+                               seed=options['seed']) as stub:
+                for database_url in database_urls:
+                    label = urlparse(database_url).scheme
+                    if label in results:
+                        label = f'{label}_{len(results)}'
+
+                    self.stderr.write(f'Load scenarios on {label}...')
+                    self.prepare_database(database_url)
+                    env = {
+                        'DATABASE_URL': database_url,
+                        'ORS_BASE_URL': stub.url,
+                        'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'eld_project.settings'),
+                    }
+                    with gunicorn_server('eld_project.wsgi:application', options['port'], env,
+                                         workers=options['workers'], cwd=settings.BASE_DIR) as base_url:
+                        results[label] = self.run_scenarios(base_url, options)
+                    results[label]['ors_requests'] = stub.requests
+        finally:
+            if scratch:
+                shutil.rmtree(scratch, ignore_errors=True)
+        return results
+
+    def handle(self, *args, **options):
+        results = {
+            'meta': {
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'options': {key: options[key] for key in (
+                    'suite', 'miles', 'iterations', 'repeat', 'scenarios', 'requests', 'concurrency',
+                    'workers', 'ors_latency', 'ors_failure_rate', 'seed'
+                )},
+            }
+        }
+
+        start = time.perf_counter()
+        if options['suite'] in ('micro', 'all'):
+            self.stderr.write('Microbenchmarks...')
+            results['micro'] = self.run_micro(options)
+        if options['suite'] in ('load', 'all'):
+            results['load'] = self.run_load_suite(options)
+        results['meta']['elapsed_s'] = round(time.perf_counter() - start, 2)
+
+        report = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as out:
+                out.write(report + '\n')
+            self.stderr.write(f"Results written to {options['output']}")
+        else:
+            self.stdout.write(report)
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            regressions = compare(baseline, results, options['max_regression'])
+            for name, old, new, change in regressions:
+                self.stderr.write(self.style.ERROR(f'{name}: {old} -> {new} ({change:+.0%})'))
+            if regressions:
+                raise CommandError(f"{len(regressions)} metrics regressed by more than {options['max_regression']:.0%}")
+            self.stderr.write(self.style.SUCCESS('No regressions against the baseline'))
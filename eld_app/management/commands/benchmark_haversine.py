@@ -0,0 +1,57 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from eld_app.geo import haversine_matrix
+from eld_app.services import RouteService
+
+# Largest difference in miles allowed between the vectorized and scalar distances
+MAX_ERROR_MILES = 1e-9
+
+
+class Command(BaseCommand):
+    help = 'Compare the vectorized distance matrix against the scalar Haversine loop'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 300],
+                            help='Number of points per side of the square matrix')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per size; the best is reported')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        for size in options['sizes']:
+            # Continental US bounding box
+            points = [(rng.uniform(25, 49), rng.uniform(-124, -67)) for _ in range(size)]
+
+            scalar_best = float('inf')
+            vector_best = float('inf')
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                scalar = [
+                    [RouteService.calculate_distance(lat1, lng1, lat2, lng2) for lat2, lng2 in points]
+                    for lat1, lng1 in points
+                ]
+                scalar_best = min(scalar_best, time.perf_counter() - start)
+
+                start = time.perf_counter()
+                vector = haversine_matrix(points)
+                vector_best = min(vector_best, time.perf_counter() - start)
+
+            max_error = max(
+                abs(scalar[i][j] - vector[i, j]) for i in range(size) for j in range(size)
+            )
+
+            self.stdout.write(
+                f'{size}x{size}: scalar {scalar_best * 1000:.2f} ms, '
+                f'vectorized {vector_best * 1000:.2f} ms, '
+                f'speedup {scalar_best / vector_best:.1f}x, max error {max_error:.2e} mi'
+            )
+
+            if max_error > MAX_ERROR_MILES:
+                raise CommandError(
+                    f'Vectorized result differs from the scalar one by {max_error:.2e} miles '
+                    f'(more than {MAX_ERROR_MILES:.0e}) at {size}x{size}'
+                )
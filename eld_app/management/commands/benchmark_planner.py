@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from eld_app.benchmarking import best_per_call
+from eld_app.services import HOSService, _plan_leg
+
+
+class Command(BaseCommand):
+    help = 'Microbenchmark the HOS planner core and daily log generation across trip lengths'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--miles', type=float, nargs='+', default=[300, 800, 1500, 3000],
+                            help='Leg lengths to plan')
+        parser.add_argument('--speed', type=float, default=55, help='Average speed used for leg durations')
+        parser.add_argument('--iterations', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        repeat = options['repeat']
+
+        for miles in options['miles']:
+            hours = miles / options['speed']
+
+            def plan():
+                return HOSService._plan_segment('Origin', 'Destination', miles, hours, 20.0, 1)
+
+            cold = best_per_call(plan, iterations, repeat, setup=_plan_leg.cache_clear)
+            warm = best_per_call(plan, iterations, repeat)
+
+            segments = plan()
+            logs = best_per_call(lambda: HOSService.generate_daily_logs(None, segments), iterations, repeat)
+            days = len(HOSService.generate_daily_logs(None, segments))
+
+            self.stdout.write(
+                f'{miles:>6.0f} mi ({len(segments)} segments, {days} days): '
+                f'plan cold {cold:.1f} us, memoized {warm:.1f} us ({cold / warm:.1f}x), '
+                f'daily logs {logs:.1f} us'
+            )
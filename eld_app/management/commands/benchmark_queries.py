@@ -0,0 +1,164 @@
+import random
+import time
+from datetime import timedelta
+from importlib import import_module
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.migrations.operations import AddConstraint, AddIndex
+
+from eld_app.models import Trip, DailyLog, LogEntry
+from eld_app.services import HOSService, RouteService, TripPlanService
+
+# Migration adding the hot-query indexes
+INDEX_MIGRATION = '0003_hot_query_indexes'
+
+CARRIERS = ['Acme Freight', 'Blue Line Logistics', 'Cardinal Transport', 'Delta Haulers', 'Eagle Express']
+
+
+def hot_queries(sample):
+    """Name -> zero-argument callable returning the queryset for each hot query"""
+    start = sample['date'] - timedelta(days=7)
+    return {
+        'trip list page': lambda: Trip.objects.order_by('-created_at', '-id')[:50],
+        'trips by carrier': lambda: Trip.objects.filter(carrier_name=sample['carrier']).order_by('-created_at')[:50],
+        'trips by driver': lambda: Trip.objects.filter(driver_name=sample['driver']).order_by('-created_at')[:50],
+        'trips by truck': lambda: Trip.objects.filter(truck_number=sample['truck']).order_by('-created_at')[:50],
+        'daily logs of trip': lambda: DailyLog.objects.filter(trip_id=sample['trip_id']).order_by('date'),
+        'daily log by trip+date': lambda: DailyLog.objects.filter(trip_id=sample['trip_id'], date=sample['date']),
+        'entries of daily log': lambda: LogEntry.objects.filter(daily_log_id=sample['daily_log_id']).order_by('start_time'),
+        'carrier logs in date range': lambda: DailyLog.objects.filter(
+            trip__carrier_name=sample['carrier'], date__range=(start, sample['date'])
+        ).order_by('date'),
+    }
+
+
+def set_indexes(enabled):
+    """Create or drop the indexes and constraints added by INDEX_MIGRATION
+
+    Works on the live schema rather than migrating back, so later migrations don't interfere.
+    SQLite can only drop a unique constraint by rebuilding the table from the current model,
+    which would put it straight back, so there constraints are left in place.
+    """
+    operations = import_module(f'eld_app.migrations.{INDEX_MIGRATION}').Migration.operations
+    with connection.schema_editor() as editor:
+        for operation in operations:
+            model = apps.get_model('eld_app', operation.model_name)
+            if isinstance(operation, AddIndex):
+                (editor.add_index if enabled else editor.remove_index)(model, operation.index)
+            elif isinstance(operation, AddConstraint) and connection.vendor != 'sqlite':
+                (editor.add_constraint if enabled else editor.remove_constraint)(model, operation.constraint)
+
+
+class Command(BaseCommand):
+    help = 'Seed a synthetic fleet in a throwaway test database and compare hot-query plans before/after the indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trips', type=int, default=5000, help='Synthetic trips to seed')
+        parser.add_argument('--drivers', type=int, default=500)
+        parser.add_argument('--runs', type=int, default=20, help='Timed runs per query; the median is reported')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--plans', action='store_true', help='Print full query plans')
+
+    def seed(self, options):
+        rng = random.Random(options['seed'])
+        trips = []
+        for i in range(options['trips']):
+            driver = rng.randrange(options['drivers'])
+            lat, lng = rng.uniform(30, 45), rng.uniform(-120, -75)
+            trips.append(Trip(
+                current_location=f'Origin {i}', current_lat=round(lat, 6), current_lng=round(lng, 6),
+                pickup_location=f'Pickup {i}', pickup_lat=round(lat + rng.uniform(-1, 1), 6),
+                pickup_lng=round(lng + rng.uniform(-1, 1), 6),
+                dropoff_location=f'Dropoff {i}', dropoff_lat=round(lat + rng.uniform(-5, 5), 6),
+                dropoff_lng=round(lng + rng.uniform(-10, 10), 6),
+                current_cycle_hours=round(rng.uniform(0, 40), 1),
+                driver_name=f'Driver {driver}', carrier_name=CARRIERS[driver % len(CARRIERS)],
+                truck_number=f'TRK-{driver:04d}',
+            ))
+
+        plans = []
+        for trip in trips:
+            # Straight-line routes keep seeding offline and deterministic
+            routes = [RouteService._fallback_route(*leg) for leg in HOSService.trip_legs(trip)]
+            segments = HOSService.plan_trip_segments(trip, routes=routes)
+            daily_logs = HOSService.generate_daily_logs(trip, segments)
+
+            # Spread trips over the past year so date-range filters are selective
+            offset = timedelta(days=rng.randrange(365))
+            for log in daily_logs:
+                log['date'] -= offset
+            plans.append((trip, segments, daily_logs, routes))
+
+        for start in range(0, len(plans), 500):
+            TripPlanService.save_plans(plans[start:start + 500])
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def measure(self, label, sample, options):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'== {label} =='))
+        results = {}
+        for name, build in hot_queries(sample).items():
+            queryset = build()
+            plan = queryset.explain()
+            sql, params = queryset.query.sql_with_params()
+
+            # Time the raw statement so model instantiation doesn't drown out the database
+            timings = []
+            with connection.cursor() as cursor:
+                for _ in range(options['runs']):
+                    start = time.perf_counter()
+                    cursor.execute(sql, params)
+                    cursor.fetchall()
+                    timings.append(time.perf_counter() - start)
+            timings.sort()
+            results[name] = timings[len(timings) // 2] * 1000
+
+            self.stdout.write(f'{name:<28} {results[name]:8.3f} ms')
+            plan_lines = plan.splitlines()
+            shown = plan_lines if options['plans'] else plan_lines[:2]
+            for line in shown:
+                self.stdout.write(f'    {line}')
+        return results
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            set_indexes(False)
+            if connection.vendor == 'sqlite':
+                self.stdout.write('SQLite: unique constraints stay in place for the "before" run')
+
+            self.stdout.write(f"Seeding {options['trips']} trips...")
+            self.seed(options)
+
+            daily_log = DailyLog.objects.order_by('?').select_related('trip').first()
+            sample = {
+                'carrier': daily_log.trip.carrier_name,
+                'driver': daily_log.trip.driver_name,
+                'truck': daily_log.trip.truck_number,
+                'trip_id': daily_log.trip_id,
+                'daily_log_id': daily_log.pk,
+                'date': daily_log.date,
+            }
+            self.stdout.write(
+                f'{Trip.objects.count()} trips, {DailyLog.objects.count()} daily logs, '
+                f'{LogEntry.objects.count()} log entries'
+            )
+
+            before = self.measure(f'before {INDEX_MIGRATION}', sample, options)
+
+            set_indexes(True)
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+            after = self.measure(f'after {INDEX_MIGRATION}', sample, options)
+
+            self.stdout.write(self.style.MIGRATE_HEADING('== speedup =='))
+            for name in before:
+                self.stdout.write(f'{name:<28} {before[name]:8.3f} -> {after[name]:8.3f} ms '
+                                  f'({before[name] / after[name]:.1f}x)')
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from eld_app.road_network import RoadNetwork
+
+
+class Command(BaseCommand):
+    help = ('Compile a road edge list CSV (from_lat,from_lng,to_lat,to_lng[,miles,mph,oneway]) into the '
+            '.npz graph ROAD_NETWORK_PATH loads quickly at worker start')
+
+    def add_arguments(self, parser):
+        parser.add_argument('edge_list', help='Edge list CSV, e.g. exported from OpenStreetMap')
+        parser.add_argument('output', help='Graph file to write (.npz)')
+        parser.add_argument('--default-mph', type=float, default=settings.ROAD_NETWORK['DEFAULT_MPH'],
+                            help='Speed of edges without an mph column')
+        parser.add_argument('--landmarks', type=int, default=8,
+                            help='Landmarks to precompute for faster A* (0 to skip; each adds 8 bytes per node)')
+
+    def handle(self, *args, **options):
+        if not options['output'].endswith('.npz'):
+            raise CommandError('The output file must end in .npz')
+
+        start = time.perf_counter()
+        try:
+            network = RoadNetwork.from_edge_list(options['edge_list'], default_mph=options['default_mph'])
+        except (OSError, KeyError, ValueError) as e:
+            raise CommandError(f"Could not read {options['edge_list']}: {e}")
+        if options['landmarks']:
+            self.stderr.write(f"Precomputing {options['landmarks']} landmarks...")
+            network.build_landmarks(options['landmarks'])
+        network.save(options['output'])
+
+        stats = network.stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {stats['nodes']} nodes, {stats['edges']} edges and {stats['landmarks']} landmarks to {options['output']} "
+            f"in {time.perf_counter() - start:.1f}s"
+        ))
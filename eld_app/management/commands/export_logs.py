@@ -0,0 +1,30 @@
+import sys
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from eld_app.exports import iter_export
+
+
+class Command(BaseCommand):
+    help = 'Stream log entries as NDJSON or CSV for a compliance audit'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', choices=['ndjson', 'csv'], default='ndjson')
+        parser.add_argument('--carrier')
+        parser.add_argument('--driver')
+        parser.add_argument('--truck')
+        parser.add_argument('--start-date', type=date.fromisoformat, help='First log date to include (YYYY-MM-DD)')
+        parser.add_argument('--end-date', type=date.fromisoformat, help='Last log date to include (YYYY-MM-DD)')
+        parser.add_argument('--chunk-size', type=int, help='Rows fetched per database round trip')
+        parser.add_argument('--file', help='Write to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        filters = {name: options[name] for name in ('carrier', 'driver', 'truck', 'start_date', 'end_date')}
+        chunks = iter_export(options['output'], chunk_size=options['chunk_size'], **filters)
+
+        if options['file']:
+            with open(options['file'], 'w', newline='') as out:
+                out.writelines(chunks)
+        else:
+            sys.stdout.writelines(chunks)
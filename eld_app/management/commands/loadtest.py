@@ -0,0 +1,64 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from eld_app.benchmarking import StubORSServer, gunicorn_server, run_load, trip_payload_factory
+
+SERVERS = {
+    'wsgi': {
+        'app': 'eld_project.wsgi:application',
+        'worker_class': None,
+        'create_path': '/api/trips/create/',
+    },
+    'asgi': {
+        'app': 'eld_project.asgi:application',
+        'worker_class': 'uvicorn.workers.UvicornWorker',
+        'create_path': '/api/async/trips/create/',
+    },
+}
+
+
+class Command(BaseCommand):
+    help = 'Load-test trip creation under the WSGI and ASGI servers against a stub ORS with injected latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['wsgi', 'asgi', 'both'], default='both')
+        parser.add_argument('--requests', type=int, default=200, help='Total requests per mode')
+        parser.add_argument('--concurrency', type=int, default=32, help='Concurrent client threads')
+        parser.add_argument('--workers', type=int, default=2, help='Server worker processes')
+        parser.add_argument('--ors-latency', type=float, default=0.5, help='Seconds added to every ORS call')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        modes = ['wsgi', 'asgi'] if options['mode'] == 'both' else [options['mode']]
+        results = {}
+
+        with StubORSServer(latency=options['ors_latency'], seed=options['seed']) as stub:
+            for mode in modes:
+                server = SERVERS[mode]
+                env = {
+                    'SERVER_MODE': mode,
+                    'ORS_BASE_URL': stub.url,
+                    'ROUTE_CACHE_ENABLED': 'false',
+                    'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'eld_project.settings'),
+                }
+
+                self.stdout.write(f"Starting {mode} server: {server['app']}")
+                with gunicorn_server(server['app'], options['port'], env, workers=options['workers'],
+                                     worker_class=server['worker_class'], cwd=settings.BASE_DIR) as base_url:
+                    results[mode] = run_load(
+                        'POST', base_url + server['create_path'],
+                        total_requests=options['requests'],
+                        concurrency=options['concurrency'],
+                        payload_factory=trip_payload_factory(options['seed']),
+                        expected_status={201},
+                    )
+
+                self.stdout.write(f'{mode}: {json.dumps(results[mode])}')
+
+        if len(results) == 2 and results['wsgi'].get('throughput_rps'):
+            ratio = results['asgi'].get('throughput_rps', 0) / results['wsgi']['throughput_rps']
+            self.stdout.write(self.style.SUCCESS(f'ASGI/WSGI throughput ratio: {ratio:.2f}x'))
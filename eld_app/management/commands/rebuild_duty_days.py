@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from eld_app.cycle import CycleService
+from eld_app.models import DailyLog, DriverDutyDay
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-driver daily duty aggregates used by the cycle engine from the stored logs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--driver', help='Only rebuild this driver')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Driver-days recomputed per transaction')
+
+    def handle(self, *args, **options):
+        logs = DailyLog.objects.all()
+        existing = DriverDutyDay.objects.all()
+        if options['driver']:
+            logs = logs.filter(trip__driver_name=options['driver'])
+            existing = existing.filter(driver_name=options['driver'])
+
+        keys = (logs.values_list('trip__driver_name', 'date')
+                .order_by('trip__driver_name', 'date')
+                .distinct()
+                .iterator())
+
+        # Days are overwritten in place rather than cleared first, so cycle queries running
+        # meanwhile see either the old or the rebuilt hours of a day, never none
+        rebuilt = set()
+        batch = []
+        for key in keys:
+            batch.append(key)
+            if len(batch) >= options['batch_size']:
+                with transaction.atomic():
+                    CycleService.refresh_days(batch)
+                rebuilt.update(batch)
+                batch = []
+        if batch:
+            with transaction.atomic():
+                CycleService.refresh_days(batch)
+            rebuilt.update(batch)
+
+        # Then drop the days no log covers any more
+        stale = [
+            pk for pk, driver, date in existing.values_list('pk', 'driver_name', 'date').iterator()
+            if (driver, date) not in rebuilt
+        ]
+        for start in range(0, len(stale), options['batch_size']):
+            DriverDutyDay.objects.filter(pk__in=stale[start:start + options['batch_size']]).delete()
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(rebuilt)} driver-days, removed {len(stale)} stale'))
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from eld_app.services import PlanningJobService
+
+
+class Command(BaseCommand):
+    help = 'Work the queue of async trip planning jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit instead of polling')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--max-attempts', type=int, default=3,
+                            help='Attempts per job before it is marked failed')
+        parser.add_argument('--stale-after', type=int, default=300,
+                            help='Seconds before a running job is assumed orphaned and requeued')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Planning worker started')
+
+        while True:
+            close_old_connections()
+
+            requeued, failed = PlanningJobService.requeue_stale(options['stale_after'], options['max_attempts'])
+            if requeued or failed:
+                self.stdout.write(f'Requeued {requeued} and failed {failed} stale jobs')
+
+            job = PlanningJobService.claim_next()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            started = time.monotonic()
+            job = PlanningJobService.run(job, max_attempts=options['max_attempts'])
+            elapsed = time.monotonic() - started
+
+            if job.status == 'succeeded':
+                self.stdout.write(self.style.SUCCESS(f'Job {job.id} succeeded in {elapsed:.2f}s'))
+            else:
+                self.stdout.write(self.style.ERROR(f'Job {job.id} {job.status}: {job.error}'))
+
+        self.stdout.write('Queue drained')
@@ -0,0 +1,54 @@
+import sys
+from collections import Counter
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from eld_app.compliance import iter_ndjson, iter_violations, iter_violations_parallel
+
+
+class Command(BaseCommand):
+    help = 'Scan stored logs for hours-of-service violations and write them as NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--carrier')
+        parser.add_argument('--driver')
+        parser.add_argument('--start-date', type=date.fromisoformat, help='First log date to report (YYYY-MM-DD)')
+        parser.add_argument('--end-date', type=date.fromisoformat, help='Last log date to scan (YYYY-MM-DD)')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes scanning drivers in parallel; 1 scans in this process')
+        parser.add_argument('--drivers-per-task', type=int, default=50, help='Drivers each worker scans at a time')
+        parser.add_argument('--chunk-size', type=int, help='Rows fetched per database round trip')
+        parser.add_argument('--file', help='Write to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        filters = {name: options[name] for name in ('carrier', 'driver', 'start_date', 'end_date')}
+        if filters['start_date'] and filters['end_date'] and filters['start_date'] > filters['end_date']:
+            raise CommandError('--start-date must not be after --end-date')
+        if options['workers'] < 1 or options['drivers_per_task'] < 1:
+            raise CommandError('--workers and --drivers-per-task must be at least 1')
+
+        if options['workers'] > 1:
+            violations = iter_violations_parallel(options['workers'], options['drivers_per_task'],
+                                                  chunk_size=options['chunk_size'], **filters)
+        else:
+            violations = iter_violations(chunk_size=options['chunk_size'], **filters)
+
+        counts = Counter()
+
+        def counted():
+            for violation in violations:
+                counts[violation.rule] += 1
+                yield violation
+
+        out = open(options['file'], 'w') if options['file'] else sys.stdout
+        try:
+            for line in iter_ndjson(counted()):
+                out.write(line)
+                out.flush()
+        finally:
+            if options['file']:
+                out.close()
+
+        summary = ', '.join(f'{rule}: {count}' for rule, count in sorted(counts.items())) or 'none'
+        self.stderr.write(self.style.SUCCESS(f'{sum(counts.values())} violations ({summary})'))
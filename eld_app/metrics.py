@@ -0,0 +1,216 @@
+"""In-process metrics for the request hot path, exported in Prometheus text format
+
+Stages of a request are timed with ``timed()``, which feeds a process-wide
+histogram and, when a request is being served, that request's Server-Timing
+breakdown. Database queries are counted by an execute wrapper on every
+connection. Each worker process keeps its own metrics.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter keyed by label values"""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values"""
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last is +Inf), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((key, [list(counts), total, count]) for key, (counts, total, count) in self._series.items())
+        for label_values, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}')
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+REQUEST_SECONDS = Histogram('eld_request_seconds', 'Request latency by view', ['view', 'method', 'status'])
+STAGE_SECONDS = Histogram('eld_stage_seconds', 'Latency of hot-path stages', ['stage'])
+REQUEST_DB_QUERIES = Histogram(
+    'eld_request_db_queries', 'Database queries per request', ['view'], buckets=QUERY_COUNT_BUCKETS
+)
+ROUTE_RESULTS = Counter('eld_route_results_total', 'Routed legs by where the route came from', ['source'])
+DB_READS = Counter('eld_db_reads_total', 'Reads routed by the replica router, by database alias', ['alias'])
+
+REGISTRY = [REQUEST_SECONDS, STAGE_SECONDS, REQUEST_DB_QUERIES, ROUTE_RESULTS, DB_READS]
+
+
+def render():
+    """Render every metric in Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+class RequestMetrics:
+    """Stage timings and query counts of one request, shared with the threads serving it"""
+
+    def __init__(self):
+        self.stages = {}
+        self.queries = 0
+        self.query_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_query(self, seconds):
+        with self._lock:
+            self.queries += 1
+            self.query_seconds += seconds
+
+    def server_timing(self, total):
+        with self._lock:
+            parts = [f'{stage};dur={seconds * 1000:.2f}' for stage, seconds in self.stages.items()]
+            parts.append(f'db;desc="{self.queries} queries";dur={self.query_seconds * 1000:.2f}')
+        parts.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(parts)
+
+
+_current = ContextVar('eld_request_metrics', default=None)
+
+
+@contextmanager
+def timed(stage):
+    """Time a block (or, as a decorator, every call) as ``stage``"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage)
+        request_metrics = _current.get()
+        if request_metrics is not None:
+            request_metrics.add_stage(stage, elapsed)
+
+
+def count_queries(execute, sql, params, many, context):
+    """Database execute wrapper attributing each query to the request being served"""
+    request_metrics = _current.get()
+    if request_metrics is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        request_metrics.add_query(time.perf_counter() - start)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """connection_created receiver adding count_queries to every new connection"""
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+class MetricsMiddleware:
+    """Record request latency and query counts, and add a Server-Timing header"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        request_metrics = RequestMetrics()
+        token = _current.set(request_metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, request_metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        request_metrics = RequestMetrics()
+        token = _current.set(request_metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, request_metrics, time.perf_counter() - start)
+
+    def _finish(self, request, response, request_metrics, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match and match.url_name else 'unmatched'
+
+        REQUEST_SECONDS.observe(elapsed, view, request.method, str(response.status_code))
+        REQUEST_DB_QUERIES.observe(request_metrics.queries, view)
+
+        if settings.METRICS['SERVER_TIMING']:
+            response['Server-Timing'] = request_metrics.server_timing(elapsed)
+        return response
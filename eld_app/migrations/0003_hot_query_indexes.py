@@ -0,0 +1,45 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eld_app', '0002_planningjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dailylog',
+            index=models.Index(fields=['date'], name='dailylog_date'),
+        ),
+        migrations.AddIndex(
+            model_name='logentry',
+            index=models.Index(fields=['daily_log', 'start_time'], include=('end_time', 'duty_status'), name='logentry_log_start'),
+        ),
+        migrations.AddIndex(
+            model_name='routesegment',
+            index=models.Index(fields=['trip', 'order'], name='routesegment_trip_order'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['-created_at', '-id'], name='trip_created_id'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['carrier_name', '-created_at'], name='trip_carrier_created'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['driver_name', '-created_at'], name='trip_driver_created'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['truck_number', '-created_at'], name='trip_truck_created'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailylog',
+            constraint=models.UniqueConstraint(fields=('trip', 'date'), name='dailylog_unique_trip_date'),
+        ),
+    ]
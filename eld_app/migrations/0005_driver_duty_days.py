@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eld_app', '0004_trip_progress'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='routesegment',
+            name='segment_type',
+            field=models.CharField(choices=[('driving', 'Driving'), ('rest', 'Rest'), ('fuel', 'Fuel Stop'), ('pickup', 'Pickup'), ('dropoff', 'Drop-off'), ('break', '30-min Break'), ('restart', '34-hr Restart')], max_length=50),
+        ),
+        migrations.CreateModel(
+            name='DriverDutyDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('driver_name', models.CharField(max_length=100)),
+                ('date', models.DateField()),
+                ('on_duty_hours', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('driving_hours', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('first_duty_start', models.DecimalField(blank=True, decimal_places=2, max_digits=4, null=True)),
+                ('last_duty_end', models.DecimalField(blank=True, decimal_places=2, max_digits=4, null=True)),
+            ],
+            options={
+                'ordering': ['driver_name', 'date'],
+                'constraints': [models.UniqueConstraint(fields=('driver_name', 'date'), name='driverdutyday_unique_driver_date')],
+            },
+        ),
+    ]
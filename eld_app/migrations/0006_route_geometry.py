@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eld_app', '0005_driver_duty_days'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteGeometry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('leg', models.PositiveSmallIntegerField(choices=[(0, 'To pickup'), (1, 'To dropoff')])),
+                ('polyline', models.TextField()),
+                ('trip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='route_geometries', to='eld_app.trip')),
+            ],
+            options={
+                'ordering': ['leg'],
+                'constraints': [models.UniqueConstraint(fields=('trip', 'leg'), name='routegeometry_unique_trip_leg')],
+            },
+        ),
+    ]
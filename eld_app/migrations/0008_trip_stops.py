@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:07
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eld_app', '0007_geocoded_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='stop_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='TripStop',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stop_type', models.CharField(choices=[('pickup', 'Pickup'), ('dropoff', 'Drop-off')], max_length=20)),
+                ('location', models.CharField(max_length=255)),
+                ('lat', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('lng', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('shipment', models.CharField(blank=True, max_length=100)),
+                ('duration_hours', models.DecimalField(decimal_places=2, default=1, max_digits=4, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(24)])),
+                ('sequence', models.PositiveIntegerField()),
+                ('trip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stops', to='eld_app.trip')),
+            ],
+            options={
+                'ordering': ['sequence'],
+                'constraints': [models.UniqueConstraint(fields=('trip', 'sequence'), name='tripstop_unique_trip_sequence')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eld_app', '0008_trip_stops'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='routegeometry',
+            name='leg',
+            field=models.PositiveSmallIntegerField(),
+        ),
+    ]
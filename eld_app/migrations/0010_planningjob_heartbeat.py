@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:38
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def start_heartbeats(apps, schema_editor):
+    # Jobs already running count from when they started
+    PlanningJob = apps.get_model('eld_app', 'PlanningJob')
+    PlanningJob.objects.filter(status='running').update(heartbeat_at=F('started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eld_app', '0009_routegeometry_leg_without_choices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='planningjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(start_heartbeats, migrations.RunPython.noop),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 import uuid
 from datetime import datetime, timedelta
+from django.utils.functional import cached_property
 
 class Trip(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -22,10 +23,66 @@ class Trip(models.Model):
     carrier_name = models.CharField(max_length=200)
     truck_number = models.CharField(max_length=50)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Progress reported by the driver; the first completed_segments segments are final
+    completed_segments = models.PositiveIntegerField(default=0)
+    last_location = models.CharField(max_length=255, blank=True)
+    last_lat = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    last_lng = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    last_position_at = models.DateTimeField(null=True, blank=True)
+    # Number of TripStops of a multi-stop trip, whose first pickup and last dropoff are also
+    # kept in the pickup and dropoff fields; 0 for a trip with a single pickup and dropoff
+    stop_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Listing and cursor pagination order on (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='trip_created_id'),
+            # Per carrier/driver/truck lookups, newest first
+            models.Index(fields=['carrier_name', '-created_at'], name='trip_carrier_created'),
+            models.Index(fields=['driver_name', '-created_at'], name='trip_driver_created'),
+            models.Index(fields=['truck_number', '-created_at'], name='trip_truck_created'),
+        ]
 
     def __str__(self):
         return f"Trip {self.id} - {self.driver_name}"
 
+    @cached_property
+    def ordered_stops(self):
+        """TripStops of a multi-stop trip in the order they're made; empty for other trips
+
+        Assigned directly on trips planned before they are saved.
+        """
+        return list(self.stops.all()) if self.stop_count else []
+
+class TripStop(models.Model):
+    """A pickup or dropoff of a multi-stop trip"""
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='stops')
+    stop_type = models.CharField(max_length=20, choices=[
+        ('pickup', 'Pickup'),
+        ('dropoff', 'Drop-off')
+    ])
+    location = models.CharField(max_length=255)
+    lat = models.DecimalField(max_digits=9, decimal_places=6)
+    lng = models.DecimalField(max_digits=9, decimal_places=6)
+    # Pairs a pickup with the dropoff of the same load, which has to come after it
+    shipment = models.CharField(max_length=100, blank=True)
+    # Hours on duty loading or unloading
+    duration_hours = models.DecimalField(
+        max_digits=4, decimal_places=2, default=1,
+        validators=[MinValueValidator(0), MaxValueValidator(24)]
+    )
+    # Position in the order the planner chose to make the stops in
+    sequence = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['sequence']
+        constraints = [
+            models.UniqueConstraint(fields=['trip', 'sequence'], name='tripstop_unique_trip_sequence'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_stop_type_display()} {self.sequence} - {self.location}"
+
 class RouteSegment(models.Model):
     trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='route_segments')
     start_location = models.CharField(max_length=255)
@@ -38,12 +95,33 @@ class RouteSegment(models.Model):
         ('fuel', 'Fuel Stop'),
         ('pickup', 'Pickup'),
         ('dropoff', 'Drop-off'),
-        ('break', '30-min Break')
+        ('break', '30-min Break'),
+        ('restart', '34-hr Restart')
     ])
     order = models.PositiveIntegerField()
 
     class Meta:
         ordering = ['order']
+        indexes = [
+            models.Index(fields=['trip', 'order'], name='routesegment_trip_order'),
+        ]
+
+class RouteGeometry(models.Model):
+    """Road geometry of one leg of a trip, as an encoded polyline (precision 5)"""
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='route_geometries')
+    # Index of the leg among the trip's legs: the drive to its first stop (the pickup of a
+    # single trip) is 0, to the next 1, and so on up to the stops of a multi-stop trip
+    leg = models.PositiveSmallIntegerField()
+    polyline = models.TextField()
+
+    class Meta:
+        ordering = ['leg']
+        constraints = [
+            models.UniqueConstraint(fields=['trip', 'leg'], name='routegeometry_unique_trip_leg'),
+        ]
+
+    def __str__(self):
+        return f"Trip {self.trip_id} leg {self.leg}"
 
 class DailyLog(models.Model):
     trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='daily_logs')
@@ -56,6 +134,13 @@ class DailyLog(models.Model):
 
     class Meta:
         ordering = ['date']
+        constraints = [
+            # One log per trip per day; its index also serves per-trip date ordering
+            models.UniqueConstraint(fields=['trip', 'date'], name='dailylog_unique_trip_date'),
+        ]
+        indexes = [
+            models.Index(fields=['date'], name='dailylog_date'),
+        ]
 
 class LogEntry(models.Model):
     DUTY_STATUS_CHOICES = [
@@ -73,4 +158,75 @@ class LogEntry(models.Model):
     remarks = models.TextField(blank=True)
 
     class Meta:
-        ordering = ['start_time']
\ No newline at end of file
+        ordering = ['start_time']
+        indexes = [
+            # Covers the duty timeline of a log (INCLUDE is PostgreSQL-only, ignored elsewhere)
+            models.Index(
+                fields=['daily_log', 'start_time'],
+                include=['end_time', 'duty_status'],
+                name='logentry_log_start'
+            ),
+        ]
+
+class DriverDutyDay(models.Model):
+    """A driver's on-duty hours on one day, aggregated from their log entries for cycle queries"""
+    driver_name = models.CharField(max_length=100)
+    date = models.DateField()
+    on_duty_hours = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+    driving_hours = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+    # Hours after midnight the first on-duty period starts and the last ends (past 24 if it runs
+    # overnight); null on days without duty
+    first_duty_start = models.DecimalField(max_digits=4, decimal_places=2, null=True, blank=True)
+    last_duty_end = models.DecimalField(max_digits=4, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        ordering = ['driver_name', 'date']
+        constraints = [
+            models.UniqueConstraint(fields=['driver_name', 'date'], name='driverdutyday_unique_driver_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.driver_name} {self.date}: {self.on_duty_hours}h on duty"
+
+class GeocodedLocation(models.Model):
+    """A location name resolved to coordinates, cached so each name is only geocoded once"""
+    # Normalized name, as geocoding.normalize returns it
+    query = models.CharField(max_length=255, unique=True)
+    # Name of the place it resolved to
+    name = models.CharField(max_length=255)
+    lat = models.DecimalField(max_digits=9, decimal_places=6)
+    lng = models.DecimalField(max_digits=9, decimal_places=6)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.query} -> {self.name}"
+
+class PlanningJob(models.Model):
+    """Queued route/HOS planning for a trip created in async mode"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed')
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='planning_jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    stage = models.CharField(max_length=50, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Touched by the worker at each stage, so a slow job isn't taken for an orphaned one
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='planningjob_status_created')
+        ]
+
+    def __str__(self):
+        return f"PlanningJob {self.id} - {self.status}"
\ No newline at end of file
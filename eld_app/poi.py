@@ -0,0 +1,124 @@
+"""Fuel stations and rest areas for placing the planner's stops at real places
+
+Points of interest are loaded from a CSV into one grid index per kind, so the
+nearest place of the kinds a stop needs is found by scanning a few grid cells.
+"""
+import csv
+import logging
+import threading
+from functools import lru_cache
+from typing import NamedTuple
+
+from django.conf import settings
+
+from .geo import GridIndex
+
+logger = logging.getLogger(__name__)
+
+POI_KINDS = ('fuel', 'rest_area', 'truck_stop')
+
+# Kinds of place each planned stop can be made at; truck stops have both fuel and parking
+STOP_KINDS = {
+    'fuel': ('fuel', 'truck_stop'),
+    'break': ('rest_area', 'truck_stop', 'fuel'),
+    'rest': ('rest_area', 'truck_stop'),
+    'restart': ('rest_area', 'truck_stop'),
+}
+
+
+class Poi(NamedTuple):
+    name: str
+    kind: str
+    lat: float
+    lng: float
+
+
+class PoiIndex:
+    """Points of interest indexed by kind for nearest lookups"""
+
+    def __init__(self, pois, grid_degrees=0.25, max_detour_miles=15):
+        self.grid_degrees = grid_degrees
+        self.max_detour_miles = max_detour_miles
+        self._pois = {}
+        self._grids = {}
+        for kind in POI_KINDS:
+            pois_of_kind = [poi for poi in pois if poi.kind == kind]
+            self._pois[kind] = pois_of_kind
+            self._grids[kind] = GridIndex(
+                [poi.lat for poi in pois_of_kind], [poi.lng for poi in pois_of_kind], grid_degrees
+            )
+
+        self.queries = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_csv(cls, path, **options):
+        """Load a CSV with ``name,kind,lat,lng`` columns; rows of other kinds are skipped"""
+        pois = []
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                kind = row['kind'].strip().lower()
+                if kind in POI_KINDS:
+                    pois.append(Poi(row['name'].strip(), kind, float(row['lat']), float(row['lng'])))
+        return cls(pois, **options)
+
+    def nearest(self, lat, lng, kinds=POI_KINDS, max_miles=None):
+        """Return (poi, miles) for the place of one of ``kinds`` nearest a point, or None if none is in reach"""
+        max_miles = self.max_detour_miles if max_miles is None else max_miles
+        best = None
+        for kind in kinds:
+            found = self._grids[kind].nearest(lat, lng, max_miles)
+            if found is not None and (best is None or found[1] < best[1]):
+                best = (self._pois[kind][found[0]], found[1])
+                # Nothing of another kind can be nearer than that
+                max_miles = found[1]
+
+        with self._lock:
+            self.queries += 1
+            self.misses += best is None
+        return best
+
+    def stats(self):
+        return {
+            'pois': {kind: len(grid) for kind, grid in self._grids.items()},
+            'queries': self.queries,
+            'misses': self.misses,
+        }
+
+
+_poi_index = None
+_poi_index_loaded = False
+_poi_index_lock = threading.Lock()
+
+
+def get_poi_index():
+    """Return the process-wide POI index, or None if POI_PATH isn't set or fails to load"""
+    global _poi_index, _poi_index_loaded
+
+    if not _poi_index_loaded:
+        with _poi_index_lock:
+            if not _poi_index_loaded:
+                options = settings.POI
+                if options['PATH']:
+                    try:
+                        _poi_index = PoiIndex.from_csv(
+                            options['PATH'],
+                            grid_degrees=options['GRID_DEGREES'],
+                            max_detour_miles=options['MAX_DETOUR_MILES'],
+                        )
+                    except (OSError, KeyError, ValueError) as e:
+                        logger.error('Could not load points of interest from %s: %s', options['PATH'], e)
+                _poi_index_loaded = True
+    return _poi_index
+
+
+@lru_cache(maxsize=4096)
+def stop_place(segment_type, lat, lng):
+    """The place nearest (lat, lng) suiting a stop of ``segment_type``, or None
+
+    Memoized, since re-planning a lane places its stops at the same points again.
+    """
+    index = get_poi_index()
+    found = index.nearest(lat, lng, kinds=STOP_KINDS[segment_type]) if index is not None else None
+    return found[0] if found else None
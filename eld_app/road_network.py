@@ -0,0 +1,327 @@
+"""In-process routing over a local road graph, for when OpenRouteService can't answer
+
+The graph is loaded from an edge list (CSV, e.g. exported from OpenStreetMap) or from
+the ``.npz`` that ``python manage.py build_road_network`` compiles it into, and kept
+in compressed sparse row form. Trip endpoints are snapped to their nearest node through
+a uniform lat/lng grid, and A* finds the fastest path. Its heuristic is the straight-line
+distance at the network's top speed, or, for graphs compiled with landmarks, the much
+tighter bound travel times to and from a few far-apart landmark nodes give (ALT).
+"""
+import csv
+import heapq
+import logging
+import math
+import threading
+from array import array
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .geo import EARTH_RADIUS_MILES, GridIndex, encode_polyline
+
+logger = logging.getLogger(__name__)
+
+# Coordinates are rounded to this many decimals (about 10 cm) to merge edge endpoints into nodes
+NODE_PRECISION = 6
+
+
+def _miles(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _is_true(value):
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+
+class RoadNetwork:
+    """Directed road graph with grid-indexed snapping and A* shortest paths"""
+    # Graph routes are cheap to recompute and shouldn't outlive an ORS outage in the route cache
+    cacheable = False
+
+    def __init__(self, lats, lngs, offsets, targets, miles, hours, landmarks_from=None, landmarks_to=None,
+                 grid_degrees=0.1, max_snap_miles=10, connector_mph=25):
+        self.lats = np.asarray(lats, dtype=float)
+        self.lngs = np.asarray(lngs, dtype=float)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.targets = np.asarray(targets, dtype=np.int64)
+        self.miles = np.asarray(miles, dtype=float)
+        self.hours = np.asarray(hours, dtype=float)
+        self.grid_degrees = grid_degrees
+        self.max_snap_miles = max_snap_miles
+        self.connector_mph = connector_mph
+        self.max_mph = float((self.miles / self.hours).max()) if len(self.hours) else 1.0
+
+        # The search loop runs on plain lists: scalar indexing into numpy arrays is much slower
+        self._offsets = self.offsets.tolist()
+        self._targets = self.targets.tolist()
+        self._miles = self.miles.tolist()
+        self._hours = self.hours.tolist()
+        self._lat_radians = np.radians(self.lats).tolist()
+        self._lng_radians = np.radians(self.lngs).tolist()
+        self._grid = GridIndex(self.lats, self.lngs, grid_degrees)
+        self._set_landmarks(landmarks_from, landmarks_to)
+
+        self.queries = 0
+        self.unroutable = 0
+        self._lock = threading.Lock()
+
+    def _set_landmarks(self, landmarks_from, landmarks_to):
+        """Keep (landmarks, nodes) hours from and to each landmark, with inf where unreachable"""
+        self.landmarks_from = np.empty((0, len(self.lats)), dtype=np.float32)
+        self.landmarks_to = self.landmarks_from
+        if landmarks_from is not None and landmarks_to is not None:
+            self.landmarks_from = np.asarray(landmarks_from, dtype=np.float32)
+            self.landmarks_to = np.asarray(landmarks_to, dtype=np.float32)
+        # Compact rows the search can index without numpy's per-item overhead
+        self._landmarks_from = [array('f', row.tobytes()) for row in self.landmarks_from]
+        self._landmarks_to = [array('f', row.tobytes()) for row in self.landmarks_to]
+
+    def _hours_from(self, source, offsets, targets, hours):
+        """Fastest hours from source to every node over the given CSR edges (Dijkstra)"""
+        best = {source: 0.0}
+        heap = [(0.0, source)]
+        while heap:
+            elapsed, node = heapq.heappop(heap)
+            if elapsed > best[node]:
+                continue
+            for edge in range(offsets[node], offsets[node + 1]):
+                neighbour = targets[edge]
+                reached = elapsed + hours[edge]
+                if reached < best.get(neighbour, math.inf):
+                    best[neighbour] = reached
+                    heapq.heappush(heap, (reached, neighbour))
+
+        result = np.full(len(self.lats), np.inf)
+        result[list(best)] = list(best.values())
+        return result
+
+    def build_landmarks(self, count=8):
+        """Pick ``count`` far-apart landmarks and precompute hours from and to each of them"""
+        if not len(self.lats):
+            return
+
+        # Reversed edges give the hours from every node to a landmark
+        sources = np.repeat(np.arange(len(self.lats)), np.diff(self.offsets))
+        reverse = RoadNetwork.from_arrays(self.lats, self.lngs, self.targets, sources, self.miles, self.hours)
+
+        # Farthest-point selection: each landmark is the node furthest from those already picked
+        spread = self._hours_from(0, self._offsets, self._targets, self._hours)
+        landmarks_from, landmarks_to = [], []
+        for _ in range(min(count, len(self.lats))):
+            landmark = int(np.where(np.isfinite(spread), spread, -1).argmax())
+            hours_from = self._hours_from(landmark, self._offsets, self._targets, self._hours)
+            landmarks_from.append(hours_from)
+            landmarks_to.append(self._hours_from(landmark, reverse._offsets, reverse._targets, reverse._hours))
+            spread = hours_from if len(landmarks_from) == 1 else np.minimum(spread, hours_from)
+        self._set_landmarks(landmarks_from, landmarks_to)
+
+    @classmethod
+    def from_arrays(cls, lats, lngs, sources, targets, miles, hours, **options):
+        """Build the graph from parallel edge arrays over node indices"""
+        sources = np.asarray(sources, dtype=np.int64)
+        order = np.argsort(sources, kind='stable')
+        offsets = np.zeros(len(lats) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(lats)), out=offsets[1:])
+        return cls(
+            lats, lngs, offsets, np.asarray(targets, dtype=np.int64)[order],
+            np.asarray(miles, dtype=float)[order], np.asarray(hours, dtype=float)[order], **options
+        )
+
+    @classmethod
+    def from_edge_list(cls, path, default_mph=55, **options):
+        """Load an edge list CSV
+
+        Columns are ``from_lat,from_lng,to_lat,to_lng`` plus optional ``miles`` (defaults to
+        the straight-line distance), ``mph`` (defaults to ``default_mph``) and ``oneway``
+        (edges run both ways unless true).
+        """
+        nodes = {}
+        lats, lngs, sources, targets, miles, hours = [], [], [], [], [], []
+
+        def node(lat, lng):
+            key = (round(float(lat), NODE_PRECISION), round(float(lng), NODE_PRECISION))
+            index = nodes.get(key)
+            if index is None:
+                index = nodes[key] = len(lats)
+                lats.append(key[0])
+                lngs.append(key[1])
+            return index
+
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                u = node(row['from_lat'], row['from_lng'])
+                v = node(row['to_lat'], row['to_lng'])
+                if u == v:
+                    continue
+                length = float(row.get('miles') or _miles(lats[u], lngs[u], lats[v], lngs[v]))
+                duration = length / float(row.get('mph') or default_mph)
+                edges = [(u, v)] if _is_true(row.get('oneway', '')) else [(u, v), (v, u)]
+                for source, target in edges:
+                    sources.append(source)
+                    targets.append(target)
+                    miles.append(length)
+                    hours.append(duration)
+
+        return cls.from_arrays(lats, lngs, sources, targets, miles, hours, **options)
+
+    @classmethod
+    def load(cls, path, **options):
+        """Load a graph saved with save()"""
+        with np.load(path) as data:
+            landmarks = {name: data[name] for name in ('landmarks_from', 'landmarks_to') if name in data.files}
+            return cls(
+                data['lats'], data['lngs'], data['offsets'], data['targets'], data['miles'], data['hours'],
+                **landmarks, **options
+            )
+
+    def save(self, path):
+        np.savez_compressed(
+            path, lats=self.lats, lngs=self.lngs, offsets=self.offsets, targets=self.targets,
+            miles=self.miles, hours=self.hours, landmarks_from=self.landmarks_from,
+            landmarks_to=self.landmarks_to
+        )
+
+    def nearest_node(self, lat, lng):
+        """Return (node, miles) for the node nearest a point, or None if none is within max_snap_miles"""
+        return self._grid.nearest(lat, lng, self.max_snap_miles)
+
+    def _heuristic(self, target):
+        """Return a function bounding the hours from any node to target from below"""
+        # Triangle inequality: hours(v, t) >= hours(v, L) - hours(t, L) and >= hours(L, t) - hours(L, v);
+        # landmarks that can't reach (or be reached from) the target give no bound
+        to_terms = [(row, row[target]) for row in self._landmarks_to if row[target] != math.inf]
+        from_terms = [(row, row[target]) for row in self._landmarks_from if row[target] != math.inf]
+        if to_terms or from_terms:
+            def landmark_bound(node):
+                bound = 0.0
+                for row, to_target in to_terms:
+                    if row[node] - to_target > bound:
+                        bound = row[node] - to_target
+                for row, from_target in from_terms:
+                    if from_target - row[node] > bound:
+                        bound = from_target - row[node]
+                return bound
+            return landmark_bound
+
+        lat_radians, lng_radians = self._lat_radians, self._lng_radians
+        target_lat, target_lng = lat_radians[target], lng_radians[target]
+        cos_target = math.cos(target_lat)
+        # Straight-line hours to the target at top speed never overestimate the remaining time
+        hours_per_radian = 2 * EARTH_RADIUS_MILES / self.max_mph
+
+        def straight_line_bound(node):
+            lat = lat_radians[node]
+            a = (math.sin((target_lat - lat) / 2) ** 2
+                 + math.cos(lat) * cos_target * math.sin((target_lng - lng_radians[node]) / 2) ** 2)
+            return hours_per_radian * math.asin(min(1.0, math.sqrt(a)))
+        return straight_line_bound
+
+    def shortest_path(self, source, target):
+        """Return the fastest path from source to target as (nodes, miles, hours), or None"""
+        offsets, targets, edge_miles, edge_hours = self._offsets, self._targets, self._miles, self._hours
+        heuristic = self._heuristic(target)
+
+        best = {source: 0.0}
+        # node -> (previous node, edge taken from it)
+        via = {source: None}
+        heap = [(heuristic(source), 0.0, source)]
+        while heap:
+            _, elapsed, node = heapq.heappop(heap)
+            if node == target:
+                break
+            if elapsed > best[node]:
+                continue
+            for edge in range(offsets[node], offsets[node + 1]):
+                neighbour = targets[edge]
+                reached = elapsed + edge_hours[edge]
+                if reached < best.get(neighbour, math.inf):
+                    best[neighbour] = reached
+                    via[neighbour] = (node, edge)
+                    heapq.heappush(heap, (reached + heuristic(neighbour), reached, neighbour))
+        else:
+            return None
+
+        edges = []
+        node = target
+        while via[node] is not None:
+            node, edge = via[node]
+            edges.append(edge)
+        edges.reverse()
+
+        nodes = [source] + [targets[edge] for edge in edges]
+        return nodes, sum(edge_miles[edge] for edge in edges), best[target]
+
+    def route(self, start_lat, start_lng, end_lat, end_lng):
+        """Return route data shaped like ORSClient.route(), or None if the graph can't connect the points"""
+        with self._lock:
+            self.queries += 1
+
+        start = self.nearest_node(start_lat, start_lng)
+        end = self.nearest_node(end_lat, end_lng)
+        path = self.shortest_path(start[0], end[0]) if start and end else None
+        if path is None:
+            with self._lock:
+                self.unroutable += 1
+            return None
+
+        nodes, miles, hours = path
+        # Off-network stretches from the points to their snapped nodes
+        connector_miles = start[1] + end[1]
+        points = [(float(start_lat), float(start_lng))]
+        points.extend(zip(self.lats[nodes].tolist(), self.lngs[nodes].tolist()))
+        points.append((float(end_lat), float(end_lng)))
+        return {
+            'distance_miles': miles + connector_miles,
+            'duration_hours': hours + connector_miles / self.connector_mph,
+            'geometry': encode_polyline(points)
+        }
+
+    async def aroute(self, start_lat, start_lng, end_lat, end_lng):
+        """Async variant of route(), searching on a worker thread off the event loop"""
+        return await sync_to_async(self.route, thread_sensitive=False)(start_lat, start_lng, end_lat, end_lng)
+
+    def stats(self):
+        return {
+            'nodes': len(self.lats),
+            'edges': len(self.targets),
+            'landmarks': len(self.landmarks_from),
+            'queries': self.queries,
+            'unroutable': self.unroutable,
+        }
+
+
+_road_network = None
+_road_network_loaded = False
+_road_network_lock = threading.Lock()
+
+
+def load_road_network(path, **options):
+    """Load a graph from a ``.npz`` built by build_road_network, or from an edge list CSV"""
+    if str(path).endswith('.npz'):
+        return RoadNetwork.load(path, **options)
+    return RoadNetwork.from_edge_list(path, default_mph=settings.ROAD_NETWORK['DEFAULT_MPH'], **options)
+
+
+def get_road_network():
+    """Return the process-wide road graph, or None if ROAD_NETWORK_PATH isn't set or fails to load"""
+    global _road_network, _road_network_loaded
+
+    if not _road_network_loaded:
+        with _road_network_lock:
+            if not _road_network_loaded:
+                options = settings.ROAD_NETWORK
+                if options['PATH']:
+                    try:
+                        _road_network = load_road_network(
+                            options['PATH'],
+                            grid_degrees=options['GRID_DEGREES'],
+                            max_snap_miles=options['MAX_SNAP_MILES'],
+                            connector_mph=options['CONNECTOR_MPH'],
+                        )
+                    except (OSError, KeyError, ValueError) as e:
+                        logger.error('Could not load road network from %s: %s', options['PATH'], e)
+                _road_network_loaded = True
+    return _road_network
@@ -0,0 +1,220 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .geo import geohash_encode
+
+logger = logging.getLogger(__name__)
+
+
+class LRUTTLCache:
+    """Thread-safe in-process LRU cache whose entries expire after a TTL"""
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.evictions = 0
+        self.expirations = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RouteCache:
+    """Two-tier route cache keyed on geohash-quantized origin/destination pairs
+
+    The local tier is a per-process LRU with TTL eviction; the shared tier is a
+    Django cache backend so every gunicorn worker benefits from a lookup.
+    """
+
+    def __init__(self, precision=7, max_entries=1024, ttl_seconds=86400, shared_alias=None):
+        self.precision = precision
+        self.ttl_seconds = ttl_seconds
+        self.shared_alias = shared_alias
+        self.local = LRUTTLCache(max_entries, ttl_seconds)
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.shared_errors = 0
+        self._lock = threading.Lock()
+
+    def key(self, start_lat, start_lng, end_lat, end_lng):
+        """Build the cache key for a leg from its quantized endpoints"""
+        origin = geohash_encode(start_lat, start_lng, self.precision)
+        destination = geohash_encode(end_lat, end_lng, self.precision)
+        return f"route:{self.precision}:{origin}:{destination}"
+
+    def _shared(self):
+        if not self.shared_alias:
+            return None
+        return caches[self.shared_alias]
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, start_lat, start_lng, end_lat, end_lng):
+        """Return a cached route dict for the leg, or None on a miss"""
+        key = self.key(start_lat, start_lng, end_lat, end_lng)
+
+        route = self.local.get(key)
+        if route is not None:
+            self._count('hits')
+            return dict(route)
+
+        shared = self._shared()
+        if shared is not None:
+            try:
+                route = shared.get(key)
+            except Exception:
+                logger.exception('Shared route cache lookup failed')
+                self._count('shared_errors')
+                route = None
+
+            if route is not None:
+                self.local.set(key, route)
+                self._count('shared_hits')
+                return dict(route)
+
+        self._count('misses')
+        return None
+
+    async def aget(self, start_lat, start_lng, end_lat, end_lng):
+        """Async variant of get(); the shared tier is read through the cache's async API"""
+        key = self.key(start_lat, start_lng, end_lat, end_lng)
+
+        route = self.local.get(key)
+        if route is not None:
+            self._count('hits')
+            return dict(route)
+
+        shared = self._shared()
+        if shared is not None:
+            try:
+                route = await shared.aget(key)
+            except Exception:
+                logger.exception('Shared route cache lookup failed')
+                self._count('shared_errors')
+                route = None
+
+            if route is not None:
+                self.local.set(key, route)
+                self._count('shared_hits')
+                return dict(route)
+
+        self._count('misses')
+        return None
+
+    async def aset(self, start_lat, start_lng, end_lat, end_lng, route):
+        """Async variant of set()"""
+        key = self.key(start_lat, start_lng, end_lat, end_lng)
+        route = dict(route)
+        self.local.set(key, route)
+
+        shared = self._shared()
+        if shared is not None:
+            try:
+                await shared.aset(key, route, timeout=self.ttl_seconds)
+            except Exception:
+                logger.exception('Shared route cache write failed')
+                self._count('shared_errors')
+
+    def set(self, start_lat, start_lng, end_lat, end_lng, route):
+        """Store a route dict for the leg in both tiers"""
+        key = self.key(start_lat, start_lng, end_lat, end_lng)
+        route = dict(route)
+        self.local.set(key, route)
+
+        shared = self._shared()
+        if shared is not None:
+            try:
+                shared.set(key, route, timeout=self.ttl_seconds)
+            except Exception:
+                logger.exception('Shared route cache write failed')
+                self._count('shared_errors')
+
+    def clear(self):
+        """Empty the local tier and reset counters (the shared tier is left alone)"""
+        self.local.clear()
+        with self._lock:
+            self.hits = 0
+            self.shared_hits = 0
+            self.misses = 0
+            self.shared_errors = 0
+        self.local.evictions = 0
+        self.local.expirations = 0
+
+    def stats(self):
+        """Return hit/miss/eviction counters for this process"""
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            'local_hits': self.hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+            'evictions': self.local.evictions,
+            'expirations': self.local.expirations,
+            'shared_errors': self.shared_errors,
+            'local_size': len(self.local),
+            'local_max_entries': self.local.max_entries,
+            'geohash_precision': self.precision,
+            'ttl_seconds': self.ttl_seconds,
+        }
+
+
+_route_cache = None
+_route_cache_lock = threading.Lock()
+
+
+def get_route_cache():
+    """Return the process-wide route cache, or None when caching is disabled"""
+    global _route_cache
+
+    options = settings.ROUTE_CACHE
+    if not options['ENABLED']:
+        return None
+
+    if _route_cache is None:
+        with _route_cache_lock:
+            if _route_cache is None:
+                _route_cache = RouteCache(
+                    precision=options['GEOHASH_PRECISION'],
+                    max_entries=options['LOCAL_MAX_ENTRIES'],
+                    ttl_seconds=options['TTL_SECONDS'],
+                    shared_alias=options['SHARED_CACHE_ALIAS'],
+                )
+    return _route_cache
@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .road_network import get_road_network
+
+logger = logging.getLogger(__name__)
+
+
+def _directions_body(start_lat, start_lng, end_lat, end_lng):
+    return {
+        "coordinates": [[float(start_lng), float(start_lat)], [float(end_lng), float(end_lat)]],
+        "format": "json"
+    }
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, cooldown_seconds=30):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.short_circuited = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """Return True if a call may go out, False to short-circuit it"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown_seconds:
+                self.state = self.HALF_OPEN
+
+            # While half-open only one probe is let through at a time
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+
+            self.short_circuited += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning('OpenRouteService circuit opened after %d failures', self.consecutive_failures)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'consecutive_failures': self.consecutive_failures,
+            'short_circuited': self.short_circuited,
+            'failure_threshold': self.failure_threshold,
+            'cooldown_seconds': self.cooldown_seconds,
+        }
+
+
+class ORSClient:
+    """OpenRouteService directions client with a pooled keep-alive session"""
+    # Real routes are stored in the route cache
+    cacheable = True
+
+    def __init__(self, api_key, base_url, profile='driving-car', connect_timeout=3.05,
+                 read_timeout=10, pool_size=10, retries=1, backoff_factor=0.2,
+                 breaker=None):
+        self.api_key = api_key
+        self.url = f"{base_url.rstrip('/')}/v2/directions/{profile}"
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+        self.retries = retries
+        self.breaker = breaker or CircuitBreaker()
+        self.requests = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        # One httpx client per event loop; connections can't be shared across loops
+        self._async_sessions = weakref.WeakKeyDictionary()
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,  # A read timeout already cost the full timeout; let the breaker count it instead
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['POST']),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Accept': 'application/json, application/geo+json, application/gpx+xml, img/png; charset=utf-8',
+            'Authorization': api_key,
+            'Content-Type': 'application/json; charset=utf-8'
+        })
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _record_failure(self):
+        self._count('failures')
+        self.breaker.record_failure()
+        return None
+
+    def _parse_response(self, status_code, load_json):
+        """Turn an ORS response into route data, updating the breaker"""
+        if status_code >= 500 or status_code == 429:
+            return self._record_failure()
+
+        # Any other response means ORS is up, even if it could not route this leg
+        self.breaker.record_success()
+
+        if status_code != 200:
+            return None
+
+        try:
+            route = load_json()['routes'][0]
+            distance_km = route['summary']['distance'] / 1000
+            duration_sec = route['summary']['duration']
+        except (ValueError, KeyError, IndexError):
+            logger.warning('Unexpected OpenRouteService response body')
+            return None
+
+        return {
+            'distance_miles': distance_km * 0.621371,
+            'duration_hours': duration_sec / 3600,
+            'geometry': route.get('geometry')
+        }
+
+    def route(self, start_lat, start_lng, end_lat, end_lng):
+        """Return route data for a leg, or None if ORS is unavailable or has no route"""
+        if not self.breaker.allow_request():
+            return None
+
+        self._count('requests')
+        try:
+            response = self.session.post(
+                self.url, json=_directions_body(start_lat, start_lng, end_lat, end_lng), timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            logger.warning('OpenRouteService request failed: %s', e)
+            return self._record_failure()
+
+        return self._parse_response(response.status_code, response.json)
+
+    def _async_session(self):
+        """Return the httpx client for the running event loop, creating it on first use"""
+        loop = asyncio.get_running_loop()
+        client = self._async_sessions.get(loop)
+        if client is None:
+            transport = httpx.AsyncHTTPTransport(
+                retries=self.retries,
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+            client = httpx.AsyncClient(
+                transport=transport,
+                headers=dict(self.session.headers),
+                timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+            )
+            self._async_sessions[loop] = client
+        return client
+
+    async def aroute(self, start_lat, start_lng, end_lat, end_lng):
+        """Async variant of route(), sharing the same breaker and counters"""
+        if not self.breaker.allow_request():
+            return None
+
+        self._count('requests')
+        try:
+            response = await self._async_session().post(
+                self.url, json=_directions_body(start_lat, start_lng, end_lat, end_lng)
+            )
+        except httpx.HTTPError as e:
+            logger.warning('OpenRouteService request failed: %s', e)
+            return self._record_failure()
+
+        return self._parse_response(response.status_code, response.json)
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'failures': self.failures,
+            'circuit': self.breaker.stats(),
+        }
+
+
+_ors_client = None
+_ors_client_lock = threading.Lock()
+
+
+def get_ors_client():
+    """Return the process-wide OpenRouteService client"""
+    global _ors_client
+
+    if _ors_client is None:
+        with _ors_client_lock:
+            if _ors_client is None:
+                options = settings.ORS
+                _ors_client = ORSClient(
+                    api_key=options['API_KEY'],
+                    base_url=options['BASE_URL'],
+                    profile=options['PROFILE'],
+                    connect_timeout=options['CONNECT_TIMEOUT'],
+                    read_timeout=options['READ_TIMEOUT'],
+                    pool_size=options['POOL_SIZE'],
+                    retries=options['RETRIES'],
+                    breaker=CircuitBreaker(
+                        failure_threshold=options['BREAKER_FAILURE_THRESHOLD'],
+                        cooldown_seconds=options['BREAKER_COOLDOWN_SECONDS'],
+                    ),
+                )
+    return _ors_client
+
+
+# Routing backends by ROUTING_BACKENDS name; each returns the backend, or None if it isn't configured
+ROUTING_BACKENDS = {
+    'ors': get_ors_client,
+    'road_network': get_road_network,
+}
+
+
+def get_routing_backends():
+    """Return the configured (name, backend) pairs, in the order RouteService tries them"""
+    backends = []
+    for name in settings.ROUTING['BACKENDS']:
+        if name not in ROUTING_BACKENDS:
+            raise ImproperlyConfigured(f'Unknown routing backend {name!r}; choose from {", ".join(ROUTING_BACKENDS)}')
+        backend = ROUTING_BACKENDS[name]()
+        if backend is not None:
+            backends.append((name, backend))
+    return backends
@@ -1,5 +1,11 @@
+from collections import Counter
+
+from django.conf import settings
 from rest_framework import serializers
-from .models import Trip, RouteSegment, DailyLog, LogEntry
+from django.urls import reverse
+from .cycle import CycleService
+from .geocoding import LOCATION_FIELDS, STOP_LOCATION_FIELDS, geocode_many
+from .models import Trip, TripStop, RouteSegment, DailyLog, LogEntry, PlanningJob
 
 class RouteSegmentSerializer(serializers.ModelSerializer):
     class Meta:
@@ -18,15 +24,75 @@ class DailyLogSerializer(serializers.ModelSerializer):
         model = DailyLog
         fields = '__all__'
 
+class TripStopSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TripStop
+        fields = ['stop_type', 'location', 'lat', 'lng', 'shipment', 'duration_hours', 'sequence']
+        read_only_fields = ['sequence']
+        extra_kwargs = {
+            # Geocoded from the location name when both are omitted
+            'lat': {'required': False},
+            'lng': {'required': False},
+        }
+
+    def validate(self, data):
+        errors = geocode_fields(data, STOP_LOCATION_FIELDS, self.context.get('geocoded'))
+        if errors:
+            raise serializers.ValidationError(errors)
+        return data
+
 class TripSerializer(serializers.ModelSerializer):
     route_segments = RouteSegmentSerializer(many=True, read_only=True)
     daily_logs = DailyLogSerializer(many=True, read_only=True)
+    stops = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Trip
+        fields = '__all__'
 
+    def get_stops(self, trip):
+        # Only multi-stop trips have (and query) stops
+        return TripStopSerializer(trip.ordered_stops, many=True).data
+
+class TripSummarySerializer(serializers.ModelSerializer):
+    """Trip fields only, without the nested segments and logs"""
     class Meta:
         model = Trip
         fields = '__all__'
 
+def geocode_fields(data, location_fields, geocoded=None):
+    """Fill in the coordinates of locations given by name only, returning errors per field
+
+    ``geocoded`` may carry places already geocoded in bulk by callers validating many payloads.
+    """
+    errors = {}
+    missing = []
+    for name_field, lat_field, lng_field in location_fields:
+        if (lat_field in data) != (lng_field in data):
+            errors[lat_field if lat_field not in data else lng_field] = [
+                f'Send both {lat_field} and {lng_field}, or neither to geocode {name_field}'
+            ]
+        elif lat_field not in data:
+            missing.append((name_field, lat_field, lng_field))
+    if not missing:
+        return errors
+
+    names = [data[name_field] for name_field, _, _ in missing]
+    if geocoded is None or any(name not in geocoded for name in names):
+        geocoded = geocode_many(names)
+
+    for name_field, lat_field, lng_field in missing:
+        place = geocoded.get(data[name_field])
+        if place is None:
+            errors[name_field] = [f'Could not geocode "{data[name_field]}"; send {lat_field} and {lng_field}']
+        else:
+            data[lat_field], data[lng_field] = place.coordinates()
+    return errors
+
 class TripCreateSerializer(serializers.ModelSerializer):
+    # (name, lat, lng) fields of the locations in the payload
+    location_fields = LOCATION_FIELDS
+
     class Meta:
         model = Trip
         fields = [
@@ -34,4 +100,135 @@ class TripCreateSerializer(serializers.ModelSerializer):
             'pickup_location', 'pickup_lat', 'pickup_lng',
             'dropoff_location', 'dropoff_lat', 'dropoff_lng',
             'current_cycle_hours', 'driver_name', 'carrier_name', 'truck_number'
-        ]
\ No newline at end of file
+        ]
+        extra_kwargs = {
+            'current_cycle_hours': {'required': False},
+            # Geocoded from the location name when both are omitted
+            **{field: {'required': False} for _, *coordinates in LOCATION_FIELDS for field in coordinates}
+        }
+
+    def validate(self, data):
+        # Callers validating many trips can pass places geocoded in bulk as 'geocoded' in the context
+        errors = geocode_fields(data, self.location_fields, self.context.get('geocoded'))
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        # Without an explicit value, seed the cycle from the driver's logged duty;
+        # callers validating many trips can pass precomputed 'cycle_hours' in the context
+        if 'current_cycle_hours' not in data:
+            cycle_hours = self.context.get('cycle_hours')
+            if cycle_hours is None or data['driver_name'] not in cycle_hours:
+                cycle_hours = CycleService.cycle_hours([data['driver_name']])
+            data['current_cycle_hours'] = cycle_hours[data['driver_name']]
+        return data
+
+class MultiStopTripCreateSerializer(TripCreateSerializer):
+    """A trip with an unordered set of pickups and dropoffs; each shipment's dropoff follows its pickup"""
+    location_fields = LOCATION_FIELDS[:1]
+    stops = TripStopSerializer(many=True)
+
+    class Meta(TripCreateSerializer.Meta):
+        fields = [
+            'current_location', 'current_lat', 'current_lng', 'stops',
+            'current_cycle_hours', 'driver_name', 'carrier_name', 'truck_number'
+        ]
+
+    def validate_stops(self, stops):
+        max_stops = settings.MULTI_STOP['MAX_STOPS']
+        if not 2 <= len(stops) <= max_stops:
+            raise serializers.ValidationError(f'A multi-stop trip has from 2 to {max_stops} stops')
+        stop_types = [stop['stop_type'] for stop in stops]
+        if 'pickup' not in stop_types or 'dropoff' not in stop_types:
+            raise serializers.ValidationError('A multi-stop trip needs at least one pickup and one dropoff')
+
+        counts = Counter((stop['stop_type'], stop['shipment']) for stop in stops if stop.get('shipment'))
+        duplicates = sorted({shipment for (_, shipment), count in counts.items() if count > 1})
+        if duplicates:
+            raise serializers.ValidationError(
+                f'Shipments with more than one pickup or dropoff: {", ".join(duplicates)}'
+            )
+        return stops
+
+class TripProgressSerializer(serializers.Serializer):
+    location = serializers.CharField(max_length=255)
+    lat = serializers.DecimalField(max_digits=9, decimal_places=6, min_value=-90, max_value=90)
+    lng = serializers.DecimalField(max_digits=9, decimal_places=6, min_value=-180, max_value=180)
+    completed_segments = serializers.IntegerField(min_value=0)
+
+class CycleQuerySerializer(serializers.Serializer):
+    driver_name = serializers.CharField(max_length=100)
+    at = serializers.DateTimeField(required=False)
+
+class TripGeometryQuerySerializer(serializers.Serializer):
+    # Either the map zoom the geometry is drawn at, or an explicit tolerance; neither gives full detail
+    zoom = serializers.IntegerField(min_value=0, max_value=22, required=False)
+    tolerance = serializers.FloatField(min_value=0, required=False)
+
+    def validate(self, data):
+        if 'zoom' in data and 'tolerance' in data:
+            raise serializers.ValidationError('Pass either zoom or tolerance, not both')
+        return data
+
+class PlanningJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.UUIDField(source='id', read_only=True)
+    trip_id = serializers.UUIDField(read_only=True)
+    status_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = PlanningJob
+        fields = [
+            'job_id', 'trip_id', 'status', 'stage', 'attempts', 'error',
+            'created_at', 'started_at', 'finished_at', 'status_url'
+        ]
+
+    def get_status_url(self, job):
+        url = reverse('get_planning_job', kwargs={'job_id': job.id})
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+class CoordinateSerializer(serializers.Serializer):
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lng = serializers.FloatField(min_value=-180, max_value=180)
+
+class DistanceMatrixSerializer(serializers.Serializer):
+    origins = CoordinateSerializer(many=True, allow_empty=False)
+    destinations = CoordinateSerializer(many=True, allow_empty=False, required=False)
+
+    def validate(self, data):
+        rows = len(data['origins'])
+        columns = len(data.get('destinations') or data['origins'])
+        max_cells = settings.DISTANCE_MATRIX_MAX_CELLS
+        if rows * columns > max_cells:
+            raise serializers.ValidationError(
+                f'Distance matrix of {rows}x{columns} exceeds the limit of {max_cells} cells'
+            )
+        return data
+
+class LogExportSerializer(serializers.Serializer):
+    # Not "format": DRF reserves that query parameter for renderer selection
+    output = serializers.ChoiceField(choices=['ndjson', 'csv'], default='ndjson')
+    carrier = serializers.CharField(required=False)
+    driver = serializers.CharField(required=False)
+    truck = serializers.CharField(required=False)
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+
+    def validate(self, data):
+        if data.get('start_date') and data.get('end_date') and data['start_date'] > data['end_date']:
+            raise serializers.ValidationError('start_date must not be after end_date')
+        return data
+
+class GeocodingSearchSerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=255)
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=10)
+
+class ViolationScanSerializer(serializers.Serializer):
+    carrier = serializers.CharField(required=False)
+    driver = serializers.CharField(required=False)
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+
+    def validate(self, data):
+        if data.get('start_date') and data.get('end_date') and data['start_date'] > data['end_date']:
+            raise serializers.ValidationError('start_date must not be after end_date')
+        return data
@@ -1,14 +1,60 @@
-import requests
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
 from datetime import datetime, timedelta, time
+from functools import lru_cache
+from typing import NamedTuple
 from decimal import Decimal
-from .models import Trip, RouteSegment, DailyLog, LogEntry
+from django.conf import settings
+from django.db import connections, models, transaction
+from django.utils import timezone
+from .cycle import CYCLE_LIMIT_HOURS, RESTART_HOURS, CycleService
+from . import metrics
+from .geo import EARTH_RADIUS_MILES, haversine_matrix
+from .geocoding import get_gazetteer, place_near
+from .geometry import LegPath, leg_geometries
+from .logsheet import prerender_on_commit
+from .models import Trip, TripStop, RouteSegment, RouteGeometry, DailyLog, LogEntry, PlanningJob
+from .poi import get_poi_index, stop_place
+from .route_cache import get_route_cache
+from .routing import get_routing_backends
+from .stop_order import order_stops
+from .trip_cache import invalidate_trip_on_commit
 import math
+import threading
+
+_routing_executor = None
+_routing_executor_lock = threading.Lock()
+
+
+def _get_routing_executor():
+    """Return the process-wide thread pool used to route legs concurrently"""
+    global _routing_executor
+
+    if _routing_executor is None:
+        with _routing_executor_lock:
+            if _routing_executor is None:
+                _routing_executor = ThreadPoolExecutor(
+                    max_workers=settings.ROUTING['MAX_WORKERS'],
+                    thread_name_prefix='routing'
+                )
+    return _routing_executor
+
+
+def _route_leg(leg):
+    """Route one leg on a pool thread, releasing that thread's DB connection afterwards"""
+    try:
+        return RouteService.get_route_data(*leg)
+    finally:
+        # The shared route cache tier may have opened a connection on this thread; close it
+        # outright, as close_old_connections() keeps it open under DATABASE_CONN_MAX_AGE
+        connections.close_all()
 
 class RouteService:
     @staticmethod
     def calculate_distance(lat1, lng1, lat2, lng2):
         """Calculate distance between two points using Haversine formula"""
-        R = 3958.756  # Earth's radius in miles
+        R = EARTH_RADIUS_MILES
 
         lat1_rad = math.radians(float(lat1))
         lng1_rad = math.radians(float(lng1))
@@ -25,38 +71,87 @@ class RouteService:
         return R * c
 
     @staticmethod
+    def distance_matrix(origins, destinations=None):
+        """Return all-pairs Haversine distances in miles as a nested list
+
+        ``origins`` and ``destinations`` are sequences of (lat, lng) pairs;
+        ``destinations`` defaults to ``origins``.
+        """
+        return haversine_matrix(origins, destinations).tolist()
+
+    @staticmethod
+    @metrics.timed('routing')
     def get_route_data(start_lat, start_lng, end_lat, end_lng):
-        """Get route data from OpenRouteService or fallback to distance calculation"""
-        try:
-            # Try OpenRouteService API (free tier)
-            url = "https://api.openrouteservice.org/v2/directions/driving-car"
-            headers = {
-                'Accept': 'application/json, application/geo+json, application/gpx+xml, img/png; charset=utf-8',
-                'Authorization': '5b3ce3597851110001cf6248YOUR_API_KEY',  # Replace with actual key
-                'Content-Type': 'application/json; charset=utf-8'
-            }
-            body = {
-                "coordinates": [[float(start_lng), float(start_lat)], [float(end_lng), float(end_lat)]],
-                "format": "json"
-            }
+        """Get route data from the first routing backend that answers, or fall back to a distance estimate
+
+        Backends (OpenRouteService, then the local road network) are tried in
+        ROUTING_BACKENDS order.
+        """
+        cache = get_route_cache()
+        if cache is not None:
+            cached = cache.get(start_lat, start_lng, end_lat, end_lng)
+            if cached is not None:
+                metrics.ROUTE_RESULTS.inc('cache')
+                return cached
+
+        for name, backend in get_routing_backends():
+            route = backend.route(start_lat, start_lng, end_lat, end_lng)
+            if route is not None:
+                metrics.ROUTE_RESULTS.inc(name)
+                # Only real routes are cached; the fallback is cheap and would pin outages
+                if cache is not None and backend.cacheable:
+                    cache.set(start_lat, start_lng, end_lat, end_lng, route)
+                return route
+
+        metrics.ROUTE_RESULTS.inc('fallback')
+        return RouteService._fallback_route(start_lat, start_lng, end_lat, end_lng)
 
-            response = requests.post(url, json=body, headers=headers, timeout=10)
+    @staticmethod
+    def get_routes(legs):
+        """Get route data for each (start_lat, start_lng, end_lat, end_lng) leg, in order
 
-            if response.status_code == 200:
-                data = response.json()
-                route = data['routes'][0]
-                distance_km = route['summary']['distance'] / 1000
-                duration_sec = route['summary']['duration']
+        Legs are fetched in parallel on a shared thread pool unless ROUTING_CONCURRENT
+        is off; results and fallbacks are the same as calling get_route_data per leg.
+        """
+        legs = list(legs)
+        if len(legs) < 2 or not settings.ROUTING['CONCURRENT']:
+            return [RouteService.get_route_data(*leg) for leg in legs]
 
-                return {
-                    'distance_miles': distance_km * 0.621371,
-                    'duration_hours': duration_sec / 3600,
-                    'geometry': route['geometry']
-                }
-        except:
-            pass
+        # Each leg runs in a copy of the caller's context so its timings reach the request
+        executor = _get_routing_executor()
+        futures = [executor.submit(contextvars.copy_context().run, _route_leg, leg) for leg in legs]
+        return [future.result() for future in futures]
+
+    @staticmethod
+    async def aget_route_data(start_lat, start_lng, end_lat, end_lng):
+        """Async variant of get_route_data that never blocks the event loop on I/O"""
+        with metrics.timed('routing'):
+            cache = get_route_cache()
+            if cache is not None:
+                cached = await cache.aget(start_lat, start_lng, end_lat, end_lng)
+                if cached is not None:
+                    metrics.ROUTE_RESULTS.inc('cache')
+                    return cached
+
+            for name, backend in get_routing_backends():
+                route = await backend.aroute(start_lat, start_lng, end_lat, end_lng)
+                if route is not None:
+                    metrics.ROUTE_RESULTS.inc(name)
+                    if cache is not None and backend.cacheable:
+                        await cache.aset(start_lat, start_lng, end_lat, end_lng, route)
+                    return route
+
+            metrics.ROUTE_RESULTS.inc('fallback')
+            return RouteService._fallback_route(start_lat, start_lng, end_lat, end_lng)
 
-        # Fallback to simple calculation
+    @staticmethod
+    async def aget_routes(legs):
+        """Async variant of get_routes; legs are always fetched concurrently"""
+        return list(await asyncio.gather(*(RouteService.aget_route_data(*leg) for leg in legs)))
+
+    @staticmethod
+    def _fallback_route(start_lat, start_lng, end_lat, end_lng):
+        """Estimate route data from the straight-line distance"""
         distance = RouteService.calculate_distance(start_lat, start_lng, end_lat, end_lng)
         # Estimate driving time at realistic speeds:
         # - Urban/short distance: 45 mph average
@@ -74,165 +169,391 @@ class RouteService:
             'geometry': None
         }
 
+# Map segment types to duty status
+DUTY_STATUS_BY_SEGMENT_TYPE = {
+    'driving': 'driving',
+    'pickup': 'on_duty_not_driving',
+    'dropoff': 'on_duty_not_driving',
+    'fuel': 'on_duty_not_driving',
+    'break': 'off_duty',
+    'rest': 'sleeper_berth',
+    'restart': 'off_duty'
+}
+
+# Daily log total that each duty status accumulates into
+TOTAL_FIELD_BY_DUTY_STATUS = {
+    'off_duty': 'total_hours_off_duty',
+    'sleeper_berth': 'total_hours_sleeper',
+    'driving': 'total_hours_driving',
+    'on_duty_not_driving': 'total_hours_on_duty'
+}
+
+DAY_START = time(6, 0)
+
+# Miles driven between fuel stops, and the on-duty time each takes
+FUEL_INTERVAL_MILES = 1000
+FUEL_STOP_HOURS = 0.5
+
+# Location labels of the stops planned along a leg
+STOP_LABELS = {
+    'break': 'Rest stop',
+    'rest': 'Rest area',
+    'restart': 'Restart',
+    'fuel': 'Fuel stop',
+}
+
+
+class PlannedSegment(NamedTuple):
+    """Location-independent segment of a planned leg"""
+    segment_type: str
+    distance_miles: float
+    duration_hours: float
+    reaches_end: bool
+
+
+class Stop(NamedTuple):
+    """A pickup or dropoff the trip drives to"""
+    segment_type: str
+    location: str
+    lat: Decimal
+    lng: Decimal
+    duration_hours: float
+
+
+class DutyClocks(NamedTuple):
+    """A driver's HOS clocks at some point in a trip"""
+    driving: float  # Hours driven since the last rest
+    since_break: float  # Hours driven since the last 30 minutes off the wheel
+    duty: float  # Hours on duty since the last rest
+    cycle: float  # Cycle hours used
+    fuel_miles: float  # Miles driven since the last fuel stop
+
+
+@lru_cache(maxsize=4096)
+def _plan_leg(distance, duration, current_cycle, driving_clock=0, duty_clock=0, fuel_miles=0, break_clock=0):
+    """Plan the driving, breaks, rests and fuel stops for one leg with HOS compliance
+
+    Memoized on (distance, duration, cycle hours, clocks) since dispatch re-plans the same
+    lanes; results are immutable so they can be shared between callers. The clocks are the
+    driving and duty hours already used when the leg starts, for re-planning mid-trip,
+    ``fuel_miles`` the miles driven since the last fuel stop and ``break_clock`` the hours
+    driven since the last break. A break only resets the 8-hour break clock; the 11 hours
+    of driving and 14-hour window run until a 10-hour rest.
+    A 34-hour restart is taken whenever the 70-hour cycle runs out.
+    """
+    # If the trip is short (under 8 hours), don't add mandatory rest periods
+    if (break_clock + duration <= 8 and driving_clock + duration <= 11 and duty_clock + duration <= 14
+            and current_cycle + duration <= CYCLE_LIMIT_HOURS and distance <= 550
+            and fuel_miles + distance <= FUEL_INTERVAL_MILES):
+        return (PlannedSegment('driving', distance, duration, True),)
+
+    segments = []
+    remaining_distance = distance
+    remaining_duration = duration
+    current_driving_time = driving_clock
+    current_duty_time = duty_clock
+    driving_since_break = break_clock
+
+    while remaining_distance > 0:
+        # Legs too short to take any time (the straight-line estimate rounds those under a
+        # few hundred yards to 0 h) break no limit, so they're driven as they are
+        if remaining_duration <= 0:
+            segments.append(PlannedSegment('driving', round(remaining_distance, 2), 0, True))
+            break
+
+        # Refuel once less than a mile of the interval is left
+        if FUEL_INTERVAL_MILES - fuel_miles < 1:
+            segments.append(PlannedSegment('fuel', 0, FUEL_STOP_HOURS, False))
+            current_duty_time += FUEL_STOP_HOURS
+            current_cycle += FUEL_STOP_HOURS
+            fuel_miles = 0
+            # Half an hour off the wheel, so it counts as the 30-minute break
+            driving_since_break = 0
+
+        # Restart the cycle once less than a minute of it is left
+        if CYCLE_LIMIT_HOURS - current_cycle < 0.01:
+            segments.append(PlannedSegment('restart', 0, RESTART_HOURS, False))
+            current_driving_time = 0
+            current_duty_time = 0
+            current_cycle = 0
+            driving_since_break = 0
+
+        # A 10-hour rest after 11 hours of driving or 14 on duty, and a 30-minute break after 8
+        # hours of driving since the last one; the rest replaces a break that would run out
+        # the 14-hour window
+        needs_break = driving_since_break >= 8
+        if current_driving_time >= 11 or current_duty_time + (0.5 if needs_break else 0) >= 14:
+            segments.append(PlannedSegment('rest', 0, 10, False))
+            current_driving_time = 0
+            current_duty_time = 0
+            driving_since_break = 0
+        elif needs_break:
+            segments.append(PlannedSegment('break', 0, 0.5, False))
+            driving_since_break = 0
+            current_duty_time += 0.5
+
+        # Calculate how much we can drive before next break/rest; every limit has some
+        # time left after the stops above, so each pass drives part of the leg
+        max_driving_before_break = 8 - driving_since_break
+        max_driving_daily = 11 - current_driving_time
+        max_duty = 14 - current_duty_time
+        max_cycle = CYCLE_LIMIT_HOURS - current_cycle
+        max_fuel = (FUEL_INTERVAL_MILES - fuel_miles) * duration / distance
+
+        # Use the most restrictive limit
+        max_driving = min(max_driving_before_break, max_driving_daily, max_duty, max_cycle, max_fuel,
+                          remaining_duration)
+
+        # Calculate distance for this driving segment
+        segment_distance = min(remaining_distance, (max_driving / duration) * distance if duration > 0 else remaining_distance)
+
+        segments.append(PlannedSegment(
+            'driving',
+            round(segment_distance, 2),
+            round(max_driving, 2),
+            # The loop ends within 0.1 mi of the end, which rounding can leave short of it
+            remaining_distance - segment_distance <= 0.1
+        ))
+
+        remaining_distance -= segment_distance
+        remaining_duration -= max_driving
+        current_driving_time += max_driving
+        driving_since_break += max_driving
+        current_duty_time += max_driving
+        current_cycle += max_driving
+        fuel_miles += segment_distance
+
+        if remaining_distance <= 0.1:  # Small threshold to avoid rounding errors
+            break
+
+    return tuple(segments)
+
+
+def _stop_path(route, leg):
+    """LegPath to name a leg's stops along, or None without a POI index or gazetteer to name them from"""
+    if get_poi_index() is None and get_gazetteer() is None:
+        return None
+    return LegPath(route, leg)
+
+
 class HOSService:
     """Hours of Service compliance service"""
 
     @staticmethod
-    def plan_trip_segments(trip):
-        """Plan trip segments considering HOS regulations"""
-        segments = []
-        current_cycle = float(trip.current_cycle_hours)
+    def trip_stops(trip):
+        """Return the Stops of a trip in the order they're made"""
+        if trip.stop_count:
+            return [
+                Stop(stop.stop_type, stop.location, stop.lat, stop.lng, float(stop.duration_hours))
+                for stop in trip.ordered_stops
+            ]
+        return [
+            Stop('pickup', trip.pickup_location, trip.pickup_lat, trip.pickup_lng, 1),
+            Stop('dropoff', trip.dropoff_location, trip.dropoff_lat, trip.dropoff_lng, 1),
+        ]
 
-        # Calculate total trip distance
-        to_pickup = RouteService.get_route_data(
-            trip.current_lat, trip.current_lng,
-            trip.pickup_lat, trip.pickup_lng
-        )
-        to_dropoff = RouteService.get_route_data(
-            trip.pickup_lat, trip.pickup_lng,
-            trip.dropoff_lat, trip.dropoff_lng
+    @staticmethod
+    def _legs(lat, lng, stops):
+        """The (start_lat, start_lng, end_lat, end_lng) legs from (lat, lng) through ``stops``"""
+        points = [(lat, lng)] + [(stop.lat, stop.lng) for stop in stops]
+        return [(*start, *end) for start, end in zip(points, points[1:])]
+
+    @staticmethod
+    def trip_legs(trip):
+        """Return the (start_lat, start_lng, end_lat, end_lng) legs driven on a trip"""
+        return HOSService._legs(trip.current_lat, trip.current_lng, HOSService.trip_stops(trip))
+
+    @staticmethod
+    def plan_trip_segments(trip, routes=None):
+        """Plan trip segments considering HOS regulations
+
+        ``routes`` may carry pre-fetched route data for ``trip_legs(trip)``.
+        """
+        return HOSService.plan_remaining_segments(
+            trip, [], trip.current_location, trip.current_lat, trip.current_lng, routes=routes
         )
 
-        total_distance = to_pickup['distance_miles'] + to_dropoff['distance_miles']
-        total_driving_time = to_pickup['duration_hours'] + to_dropoff['duration_hours']
+    @staticmethod
+    def duty_clocks(trip, segments):
+        """Return the driver's clocks after driving ``segments`` from the start of a trip"""
+        driving = since_break = duty = fuel = 0.0
+        cycle = float(trip.current_cycle_hours)
+        # Hours since the driver last drove; half an hour of anything else is a break
+        pause = 0.0
 
-        # Current to pickup
-        segments.extend(HOSService._plan_segment(
-            trip.current_location, trip.pickup_location,
-            to_pickup['distance_miles'], to_pickup['duration_hours'],
-            current_cycle, 1
-        ))
+        for segment in segments:
+            hours = float(segment['duration_hours'])
+            if segment['segment_type'] == 'driving':
+                pause = 0.0
+            else:
+                pause += hours
+                if pause >= 0.5:
+                    since_break = 0.0
+            if segment['segment_type'] == 'fuel':
+                fuel = 0.0
+            if segment['segment_type'] == 'restart':
+                driving = duty = cycle = 0.0
+            elif segment['segment_type'] == 'rest':
+                driving = duty = 0.0
+            elif segment['segment_type'] == 'break':
+                duty += hours
+            else:
+                duty += hours
+                cycle += hours
+                if segment['segment_type'] == 'driving':
+                    driving += hours
+                    since_break += hours
+                    fuel += float(segment['distance_miles'])
 
-        # Pickup activity (1 hour)
-        segments.append({
-            'start_location': trip.pickup_location,
-            'end_location': trip.pickup_location,
-            'distance_miles': 0,
-            'duration_hours': 1,
-            'segment_type': 'pickup',
-            'order': len(segments) + 1
-        })
-
-        # Update cycle hours after pickup
-        current_cycle += 1
-
-        # Pickup to dropoff
-        segments.extend(HOSService._plan_segment(
-            trip.pickup_location, trip.dropoff_location,
-            to_dropoff['distance_miles'], to_dropoff['duration_hours'],
-            current_cycle, len(segments) + 1
-        ))
+        return DutyClocks(round(driving, 2), round(since_break, 2), round(duty, 2), round(cycle, 2), round(fuel, 2))
+
+    @staticmethod
+    def remaining_stops(trip, completed):
+        """Return the Stops not yet made in the ``completed`` segments"""
+        made = sum(1 for segment in completed if segment['segment_type'] in ('pickup', 'dropoff'))
+        return HOSService.trip_stops(trip)[made:]
+
+    @staticmethod
+    def remaining_legs(trip, completed, lat, lng):
+        """Return the legs still to drive from (lat, lng) after the ``completed`` segments"""
+        return HOSService._legs(lat, lng, HOSService.remaining_stops(trip, completed))
 
-        # Dropoff activity (1 hour)
-        segments.append({
-            'start_location': trip.dropoff_location,
-            'end_location': trip.dropoff_location,
-            'distance_miles': 0,
-            'duration_hours': 1,
-            'segment_type': 'dropoff',
-            'order': len(segments) + 1
-        })
+    @staticmethod
+    def plan_remaining_segments(trip, completed, location, lat, lng, routes=None):
+        """Plan the rest of a trip from a reported position, keeping the ``completed`` segments
+
+        The first remaining leg starts from the clocks left by the completed segments.
+        ``routes`` may carry pre-fetched route data for ``remaining_legs``.
+        """
+        legs = HOSService.remaining_legs(trip, completed, lat, lng)
+        if not legs:
+            return list(completed)
+
+        # The remaining legs are routed concurrently
+        if routes is None:
+            routes = RouteService.get_routes(legs)
+
+        return HOSService._plan_routed_segments(trip, completed, location, legs, routes)
+
+    @staticmethod
+    @metrics.timed('planning')
+    def _plan_routed_segments(trip, completed, location, legs, routes):
+        """Plan the remaining legs of a trip from their route data
+
+        The driver's clocks, cycle and miles since fuelling carry from each leg and
+        stop into the next.
+        """
+        segments = list(completed)
+        clocks = HOSService.duty_clocks(trip, completed)
+        start_location = location
+
+        for stop, leg, route in zip(HOSService.remaining_stops(trip, completed), legs, routes):
+            # Drive to the stop
+            segments.extend(HOSService._plan_segment(
+                start_location, stop.location,
+                route['distance_miles'], route['duration_hours'],
+                clocks.cycle, len(segments) + 1, clocks,
+                fuel_miles=clocks.fuel_miles, path=_stop_path(route, leg)
+            ))
+
+            # Pickup or dropoff activity
+            segments.append({
+                'start_location': stop.location,
+                'end_location': stop.location,
+                'distance_miles': 0,
+                'duration_hours': stop.duration_hours,
+                'segment_type': stop.segment_type,
+                'order': len(segments) + 1
+            })
+
+            clocks = HOSService.duty_clocks(trip, segments)
+            start_location = stop.location
 
         return segments
 
     @staticmethod
-    def _plan_segment(start_loc, end_loc, distance, duration, current_cycle, start_order):
-        """Plan a single driving segment with HOS compliance"""
+    def _plan_segment(start_loc, end_loc, distance, duration, current_cycle, start_order, clocks=None,
+                      fuel_miles=0, path=None):
+        """Plan a single driving segment with HOS compliance
+
+        ``clocks`` are the driver's DutyClocks at the start of the leg (fresh if omitted) and
+        ``fuel_miles`` the miles driven since the last fuel stop. With ``path`` (the leg's
+        LegPath) stops are labelled with the fuel station or rest area they're made at, and
+        stops and the ends of driving stretches with the nearest town in the gazetteer.
+        """
+        driving_clock, break_clock, duty_clock = (
+            (clocks.driving, clocks.since_break, clocks.duty) if clocks is not None else (0, 0, 0)
+        )
+        plan = _plan_leg(distance, duration, current_cycle, driving_clock, duty_clock, round(fuel_miles, 2),
+                         break_clock)
+
+        # Labels are built once per leg rather than once per segment
+        labels = {
+            segment_type: f"{stop} near {start_loc}" for segment_type, stop in STOP_LABELS.items()
+        }
+        en_route = None
+        # Miles along the leg, and where the next driving stretch starts
+        miles = 0.0
+        here = start_loc
+
         segments = []
-        remaining_distance = distance
-        remaining_duration = duration
-        current_driving_time = 0
-        current_duty_time = 0
         order = start_order
+        for planned in plan:
+            if planned.segment_type == 'driving':
+                start = here
+                miles += planned.distance_miles
+                if planned.reaches_end:
+                    end = end_loc
+                else:
+                    town = place_near(*path.position(miles)) if path is not None else None
+                    if town is not None:
+                        end = town
+                    else:
+                        if en_route is None:
+                            en_route = f"En route to {end_loc}"
+                        end = en_route
+                    # Along a path, the next stretch starts where this one was named as ending
+                    if path is not None:
+                        here = end
+            else:
+                position = path.position(miles) if path is not None else None
+                place = stop_place(planned.segment_type, *position) if position else None
+                town = place_near(*position) if position and place is None else None
+                if place is not None:
+                    start = end = f"{STOP_LABELS[planned.segment_type]} at {place.name}"
+                elif town is not None:
+                    start = end = f"{STOP_LABELS[planned.segment_type]} near {town}"
+                else:
+                    start = end = labels[planned.segment_type]
 
-        # If the trip is short (under 8 hours), don't add mandatory rest periods
-        if duration <= 8 and distance <= 550:  # Under 8 hours and 550 miles
-            # Just add the driving segment without mandatory breaks
-            segments.append({
-                'start_location': start_loc,
-                'end_location': end_loc,
-                'distance_miles': distance,
-                'duration_hours': duration,
-                'segment_type': 'driving',
-                'order': order
-            })
-            return segments
-
-        while remaining_distance > 0:
-            # Check if we need a 30-minute break (after 8 hours of driving)
-            if current_driving_time >= 8:
-                segments.append({
-                    'start_location': f"Rest stop near {start_loc}",
-                    'end_location': f"Rest stop near {start_loc}",
-                    'distance_miles': 0,
-                    'duration_hours': 0.5,
-                    'segment_type': 'break',
-                    'order': order
-                })
-                order += 1
-                current_driving_time = 0
-                current_duty_time += 0.5
-
-            # Check if we need a 10-hour rest period (only for long trips)
-            if current_duty_time >= 14:
-                segments.append({
-                    'start_location': f"Rest area near {start_loc}",
-                    'end_location': f"Rest area near {start_loc}",
-                    'distance_miles': 0,
-                    'duration_hours': 10,
-                    'segment_type': 'rest',
-                    'order': order
-                })
-                order += 1
-                current_driving_time = 0
-                current_duty_time = 0
-
-            # Calculate how much we can drive before next break/rest
-            max_driving_before_break = 8 - current_driving_time
-            max_driving_daily = 11 - current_driving_time
-            max_duty = 14 - current_duty_time
-
-            # Use the most restrictive limit
-            max_driving = min(max_driving_before_break, max_driving_daily, max_duty, remaining_duration)
-
-            if max_driving <= 0:
-                continue
-
-            # Calculate distance for this driving segment
-            segment_distance = min(remaining_distance, (max_driving / duration) * distance if duration > 0 else remaining_distance)
-
-            # Add driving segment
             segments.append({
-                'start_location': start_loc,
-                'end_location': end_loc if segment_distance >= remaining_distance else f"En route to {end_loc}",
-                'distance_miles': round(segment_distance, 2),
-                'duration_hours': round(max_driving, 2),
-                'segment_type': 'driving',
+                'start_location': start,
+                'end_location': end,
+                'distance_miles': planned.distance_miles,
+                'duration_hours': planned.duration_hours,
+                'segment_type': planned.segment_type,
                 'order': order
             })
-
-            remaining_distance -= segment_distance
-            remaining_duration -= max_driving
-            current_driving_time += max_driving
-            current_duty_time += max_driving
             order += 1
 
-            if remaining_distance <= 0.1:  # Small threshold to avoid rounding errors
-                break
-
         return segments
 
     @staticmethod
-    def generate_daily_logs(trip, segments):
-        """Generate daily log entries from trip segments"""
+    @metrics.timed('daily_logs')
+    def generate_daily_logs(trip, segments, start_date=None):
+        """Generate daily log entries from trip segments
+
+        Logs start at 6 AM on ``start_date``, today by default.
+        """
         daily_logs = {}
-        current_time = datetime.now().replace(hour=6, minute=0, second=0, microsecond=0)  # Start at 6 AM
+        current_time = datetime.combine(start_date or datetime.now().date(), DAY_START)  # Start at 6 AM
 
         for segment in segments:
             date = current_time.date()
 
-            if date not in daily_logs:
-                daily_logs[date] = {
+            day = daily_logs.get(date)
+            if day is None:
+                day = daily_logs[date] = {
                     'date': date,
                     'entries': [],
                     'total_miles': 0,
@@ -242,50 +563,443 @@ class HOSService:
                     'total_hours_on_duty': 0
                 }
 
-            start_time = current_time.time()
-            end_time = (current_time + timedelta(hours=float(segment['duration_hours']))).time()
-
-            # Map segment types to duty status
-            duty_status_map = {
-                'driving': 'driving',
-                'pickup': 'on_duty_not_driving',
-                'dropoff': 'on_duty_not_driving',
-                'fuel': 'on_duty_not_driving',
-                'break': 'off_duty',
-                'rest': 'sleeper_berth'
-            }
-
-            duty_status = duty_status_map.get(segment['segment_type'], 'on_duty_not_driving')
+            segment_type = segment['segment_type']
+            hours = float(segment['duration_hours'])
+            elapsed = timedelta(hours=hours)
+            duty_status = DUTY_STATUS_BY_SEGMENT_TYPE.get(segment_type, 'on_duty_not_driving')
 
             # Create log entry
-            entry = {
-                'start_time': start_time,
-                'end_time': end_time,
+            day['entries'].append({
+                'start_time': current_time.time(),
+                'end_time': (current_time + elapsed).time(),
                 'duty_status': duty_status,
                 'location': segment['start_location'],
-                'remarks': f"{segment['segment_type'].title()} - {segment['start_location']} to {segment['end_location']}"
-            }
-
-            daily_logs[date]['entries'].append(entry)
+                'remarks': f"{segment_type.title()} - {segment['start_location']} to {segment['end_location']}"
+            })
 
             # Update totals
-            hours = float(segment['duration_hours'])
-            daily_logs[date]['total_miles'] += float(segment['distance_miles'])
-
-            if duty_status == 'off_duty':
-                daily_logs[date]['total_hours_off_duty'] += hours
-            elif duty_status == 'sleeper_berth':
-                daily_logs[date]['total_hours_sleeper'] += hours
-            elif duty_status == 'driving':
-                daily_logs[date]['total_hours_driving'] += hours
-            else:
-                daily_logs[date]['total_hours_on_duty'] += hours
+            day['total_miles'] += float(segment['distance_miles'])
+            day[TOTAL_FIELD_BY_DUTY_STATUS[duty_status]] += hours
 
             # Advance time
-            current_time += timedelta(hours=hours)
+            current_time += elapsed
 
             # If we cross midnight, ensure proper day transition
-            if current_time.date() > date and current_time.time() < time(6, 0):
+            if current_time.date() > date and current_time.time() < DAY_START:
                 current_time = current_time.replace(hour=6, minute=0)
 
-        return list(daily_logs.values())
\ No newline at end of file
+        return list(daily_logs.values())
+
+class TripPlanService:
+    """Planning and persistence of whole trips"""
+
+    # Rows per INSERT statement when bulk-writing large batches of plans
+    BULK_BATCH_SIZE = 1000
+
+    @staticmethod
+    def plan_trips(trips):
+        """Plan many trips, routing each distinct leg only once
+
+        Returns one entry per trip, in order: a ``(trip, segments, daily_logs, routes)``
+        plan, or the exception raised while planning that trip.
+        """
+        legs_by_trip = [HOSService.trip_legs(trip) for trip in trips]
+        unique_legs = list(dict.fromkeys(leg for legs in legs_by_trip for leg in legs))
+        routes = dict(zip(unique_legs, RouteService.get_routes(unique_legs)))
+
+        results = []
+        for trip, legs in zip(trips, legs_by_trip):
+            try:
+                trip_routes = [routes[leg] for leg in legs]
+                segments = HOSService.plan_trip_segments(trip, routes=trip_routes)
+                daily_logs = HOSService.generate_daily_logs(trip, segments)
+                results.append((trip, segments, daily_logs, trip_routes))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    @staticmethod
+    def clear_plans(trips):
+        """Delete the segments, geometry and logs planned for ``trips``, refreshing their duty days"""
+        days = set(DailyLog.objects.filter(trip__in=trips).values_list('trip__driver_name', 'date'))
+        RouteSegment.objects.filter(trip__in=trips).delete()
+        RouteGeometry.objects.filter(trip__in=trips).delete()
+        DailyLog.objects.filter(trip__in=trips).delete()
+        CycleService.refresh_days(days)
+
+    @staticmethod
+    def save_plans(plans, create_trips=True):
+        """Write planned trips in one transaction using bulk inserts
+
+        ``plans`` is a list of ``(trip, segments, daily_logs, routes)`` tuples as produced by
+        ``HOSService.plan_trip_segments`` and ``HOSService.generate_daily_logs``, with the
+        route data of ``HOSService.trip_legs(trip)``, whose geometry is stored per leg.
+        The statement count is constant in the number of segments, days and entries.
+        """
+        with metrics.timed('persistence'), transaction.atomic():
+            if create_trips:
+                Trip.objects.bulk_create(
+                    [trip for trip, _, _, _ in plans], batch_size=TripPlanService.BULK_BATCH_SIZE
+                )
+                TripStop.objects.bulk_create(
+                    [stop for trip, _, _, _ in plans for stop in trip.ordered_stops],
+                    batch_size=TripPlanService.BULK_BATCH_SIZE
+                )
+
+            RouteSegment.objects.bulk_create([
+                RouteSegment(trip=trip, **segment_data)
+                for trip, segments, _, _ in plans
+                for segment_data in segments
+            ], batch_size=TripPlanService.BULK_BATCH_SIZE)
+
+            RouteGeometry.objects.bulk_create([
+                geometry
+                for trip, _, _, routes in plans
+                for geometry in leg_geometries(trip, HOSService.trip_legs(trip), routes)
+            ], batch_size=TripPlanService.BULK_BATCH_SIZE)
+
+            daily_logs = []
+            entries_by_log = []
+            for trip, _, daily_logs_data, _ in plans:
+                for log_data in daily_logs_data:
+                    daily_logs.append(DailyLog(
+                        trip=trip,
+                        date=log_data['date'],
+                        total_miles=Decimal(str(log_data['total_miles'])),
+                        total_hours_off_duty=Decimal(str(log_data['total_hours_off_duty'])),
+                        total_hours_sleeper=Decimal(str(log_data['total_hours_sleeper'])),
+                        total_hours_driving=Decimal(str(log_data['total_hours_driving'])),
+                        total_hours_on_duty=Decimal(str(log_data['total_hours_on_duty']))
+                    ))
+                    entries_by_log.append(log_data['entries'])
+
+            # Log entries need the daily log PKs, which only some backends return from a bulk insert
+            if connections[DailyLog.objects.db].features.can_return_rows_from_bulk_insert:
+                DailyLog.objects.bulk_create(daily_logs, batch_size=TripPlanService.BULK_BATCH_SIZE)
+            else:
+                for daily_log in daily_logs:
+                    daily_log.save(force_insert=True)
+
+            LogEntry.objects.bulk_create([
+                LogEntry(daily_log=daily_log, **entry_data)
+                for daily_log, entries_data in zip(daily_logs, entries_by_log)
+                for entry_data in entries_data
+            ], batch_size=TripPlanService.BULK_BATCH_SIZE)
+
+            # Bulk inserts send no signals, so existing trips are invalidated explicitly
+            if not create_trips:
+                for trip, _, _, _ in plans:
+                    invalidate_trip_on_commit(trip.pk)
+
+            prerender_on_commit(trip.pk for trip, _, _, _ in plans)
+
+            CycleService.refresh_days(
+                (trip.driver_name, log_data['date'])
+                for trip, _, daily_logs_data, _ in plans
+                for log_data in daily_logs_data
+            )
+
+
+class MultiStopTripService:
+    """Trips with several pickups and dropoffs, made in the order that drives the fewest miles"""
+
+    @staticmethod
+    @metrics.timed('stop_ordering')
+    def build_trip(trip_data, stops_data):
+        """Return an unsaved Trip making ``stops_data`` in the order ``order_stops`` finds
+
+        A dropoff comes after the pickup of the same shipment. The trip's pickup and dropoff
+        fields are set to its first pickup and last dropoff, so it lists like any other trip.
+        """
+        pickups = {
+            stop['shipment']: index for index, stop in enumerate(stops_data)
+            if stop['stop_type'] == 'pickup' and stop.get('shipment')
+        }
+        predecessors = {
+            index: pickups[stop['shipment']] for index, stop in enumerate(stops_data)
+            if stop['stop_type'] == 'dropoff' and stop.get('shipment') in pickups
+        }
+        order, _ = order_stops(
+            (float(trip_data['current_lat']), float(trip_data['current_lng'])),
+            [(float(stop['lat']), float(stop['lng'])) for stop in stops_data],
+            predecessors,
+            time_budget=settings.MULTI_STOP['ORDER_TIME_BUDGET_MS'] / 1000
+        )
+
+        trip = Trip(**trip_data, stop_count=len(order))
+        trip.ordered_stops = [
+            TripStop(trip=trip, sequence=sequence, **stops_data[index])
+            for sequence, index in enumerate(order, 1)
+        ]
+        first_pickup = next(stop for stop in trip.ordered_stops if stop.stop_type == 'pickup')
+        last_dropoff = next(stop for stop in reversed(trip.ordered_stops) if stop.stop_type == 'dropoff')
+        trip.pickup_location, trip.pickup_lat, trip.pickup_lng = (
+            first_pickup.location, first_pickup.lat, first_pickup.lng
+        )
+        trip.dropoff_location, trip.dropoff_lat, trip.dropoff_lng = (
+            last_dropoff.location, last_dropoff.lat, last_dropoff.lng
+        )
+        return trip
+
+
+class TripProgressService:
+    """Incremental re-planning of a trip as the driver reports progress"""
+
+    SEGMENT_FIELDS = ['start_location', 'end_location', 'distance_miles', 'duration_hours', 'segment_type', 'order']
+    DAILY_LOG_FIELDS = [
+        'total_miles', 'total_hours_off_duty', 'total_hours_sleeper', 'total_hours_driving', 'total_hours_on_duty'
+    ]
+    ENTRY_FIELDS = ['start_time', 'end_time', 'duty_status', 'location', 'remarks']
+
+    @staticmethod
+    def _assign(row, values):
+        """Set ``values`` on a model instance, returning whether any stored value changes"""
+        changed = False
+        for name, value in values.items():
+            field = row._meta.get_field(name)
+            value = field.to_python(value)
+            if isinstance(field, models.DecimalField):
+                # Compare at stored precision so float noise doesn't count as a change
+                value = value.quantize(Decimal(1).scaleb(-field.decimal_places))
+            if getattr(row, name) != value:
+                setattr(row, name, value)
+                changed = True
+        return changed
+
+    @staticmethod
+    def _diff(existing, desired, build):
+        """Match rows to desired values by position
+
+        Returns the rows to update, the new rows to create (made with ``build``) and
+        the primary keys of surplus rows to delete.
+        """
+        updated = [
+            row for row, values in zip(existing, desired)
+            if TripProgressService._assign(row, values)
+        ]
+        created = [build(values) for values in desired[len(existing):]]
+        deleted = [row.pk for row in existing[len(desired):]]
+        return updated, created, deleted
+
+    @staticmethod
+    def update_progress(trip, location, lat, lng, completed_segments):
+        """Re-plan the rest of a trip from the driver's reported position
+
+        The first ``completed_segments`` segments, and the log entries they produced,
+        are kept as they are; only rows whose values change are written.
+        Returns per-table counts of the rows created, updated and deleted.
+        Raises ValueError if the progress is inconsistent with the trip.
+        """
+        existing_segments = list(trip.route_segments.order_by('order'))
+        if not existing_segments:
+            raise ValueError('Trip has not been planned yet')
+        if completed_segments < trip.completed_segments:
+            raise ValueError(f'Trip already has {trip.completed_segments} completed segments')
+        if completed_segments > len(existing_segments):
+            raise ValueError(f'Trip only has {len(existing_segments)} segments')
+
+        completed = [
+            {
+                'start_location': segment.start_location,
+                'end_location': segment.end_location,
+                'distance_miles': float(segment.distance_miles),
+                'duration_hours': float(segment.duration_hours),
+                'segment_type': segment.segment_type,
+                'order': segment.order
+            }
+            for segment in existing_segments[:completed_segments]
+        ]
+
+        # Route before taking any locks; only the legs from the new position are requested
+        legs = HOSService.remaining_legs(trip, completed, lat, lng)
+        routes = RouteService.get_routes(legs)
+        segments = HOSService.plan_remaining_segments(trip, completed, location, lat, lng, routes=routes)
+
+        # Logs keep the dates they started on, so completed entries come out unchanged
+        start_date = trip.daily_logs.order_by('date').values_list('date', flat=True).first()
+        daily_logs = HOSService.generate_daily_logs(trip, segments, start_date)
+
+        with metrics.timed('persistence'), transaction.atomic():
+            locked = Trip.objects.select_for_update().only('completed_segments').get(pk=trip.pk)
+            if locked.completed_segments != trip.completed_segments:
+                raise ValueError('Trip progress changed while re-planning; retry the update')
+
+            # Another position update may have rewritten the unfinished segments since they were
+            # read; the completed ones are unchanged, so only the diff needs the current rows
+            existing_segments = list(trip.route_segments.order_by('order'))
+            counts = {}
+
+            updated, created, deleted = TripProgressService._diff(
+                existing_segments, segments, lambda values: RouteSegment(trip=trip, **values)
+            )
+            RouteSegment.objects.filter(pk__in=deleted).delete()
+            RouteSegment.objects.bulk_update(updated, TripProgressService.SEGMENT_FIELDS)
+            RouteSegment.objects.bulk_create(created)
+            counts['route_segments'] = {'created': len(created), 'updated': len(updated), 'deleted': len(deleted)}
+
+            # Logs are matched by date, which is unique per trip
+            existing_logs = {log.date: log for log in trip.daily_logs.all()}
+            desired_dates = {log_data['date'] for log_data in daily_logs}
+            deleted = [log.pk for date, log in existing_logs.items() if date not in desired_dates]
+            DailyLog.objects.filter(pk__in=deleted).delete()
+
+            log_counts = {'created': 0, 'updated': 0, 'deleted': len(deleted)}
+            updated_logs = []
+            new_logs = []
+            for log_data in daily_logs:
+                totals = {name: log_data[name] for name in TripProgressService.DAILY_LOG_FIELDS}
+                log = existing_logs.get(log_data['date'])
+                if log is None:
+                    new_logs.append(DailyLog(trip=trip, date=log_data['date'], **totals))
+                elif TripProgressService._assign(log, totals):
+                    updated_logs.append(log)
+
+            DailyLog.objects.bulk_update(updated_logs, TripProgressService.DAILY_LOG_FIELDS)
+            if connections[DailyLog.objects.db].features.can_return_rows_from_bulk_insert:
+                DailyLog.objects.bulk_create(new_logs)
+            else:
+                for log in new_logs:
+                    log.save(force_insert=True)
+            log_counts['created'] = len(new_logs)
+            log_counts['updated'] = len(updated_logs)
+            counts['daily_logs'] = log_counts
+
+            logs_by_date = {**existing_logs, **{log.date: log for log in new_logs}}
+            entries_by_log = {}
+            for entry in (LogEntry.objects
+                          .filter(daily_log__trip=trip, daily_log__date__in=desired_dates)
+                          .order_by('start_time', 'pk')):
+                entries_by_log.setdefault(entry.daily_log_id, []).append(entry)
+
+            updated, created, deleted = [], [], []
+            for log_data in daily_logs:
+                log = logs_by_date[log_data['date']]
+                day_updated, day_created, day_deleted = TripProgressService._diff(
+                    entries_by_log.get(log.pk, []), log_data['entries'],
+                    lambda values, log=log: LogEntry(daily_log=log, **values)
+                )
+                updated += day_updated
+                created += day_created
+                deleted += day_deleted
+
+            LogEntry.objects.filter(pk__in=deleted).delete()
+            LogEntry.objects.bulk_update(updated, TripProgressService.ENTRY_FIELDS)
+            LogEntry.objects.bulk_create(created)
+            counts['log_entries'] = {'created': len(created), 'updated': len(updated), 'deleted': len(deleted)}
+
+            CycleService.refresh_days((trip.driver_name, date) for date in existing_logs.keys() | desired_dates)
+
+            # The re-routed legs are the last ones, and now start from the reported position
+            geometries = leg_geometries(trip, legs, routes, first_leg=len(HOSService.trip_legs(trip)) - len(legs))
+            RouteGeometry.objects.bulk_create(
+                geometries, update_conflicts=True, unique_fields=['trip', 'leg'], update_fields=['polyline']
+            )
+            counts['route_geometries'] = {'replaced': len(geometries)}
+
+            # Bulk writes send no signals; saving the trip invalidates its cached response
+            trip.completed_segments = completed_segments
+            trip.last_location = location
+            trip.last_lat = lat
+            trip.last_lng = lng
+            trip.last_position_at = timezone.now()
+            trip.save(update_fields=[
+                'completed_segments', 'last_location', 'last_lat', 'last_lng', 'last_position_at'
+            ])
+            prerender_on_commit([trip.pk])
+
+        return counts
+
+
+class PlanningJobService:
+    """DB-backed queue of trip planning jobs, worked by `manage.py run_planning_worker`"""
+
+    @staticmethod
+    def enqueue(trip):
+        """Save a trip and queue its planning, returning the job"""
+        with transaction.atomic():
+            trip.save()
+            TripStop.objects.bulk_create(trip.ordered_stops)
+            return PlanningJob.objects.create(trip=trip)
+
+    @staticmethod
+    def claim_next():
+        """Claim the oldest queued job for this worker, or return None if the queue is empty"""
+        with transaction.atomic():
+            job = (PlanningJob.objects
+                   .select_for_update(skip_locked=True)
+                   .filter(status='queued')
+                   .order_by('created_at')
+                   .first())
+            if job is None:
+                return None
+
+            # The conditional update keeps the claim exclusive on backends without row locks
+            now = timezone.now()
+            claimed = PlanningJob.objects.filter(pk=job.pk, status='queued').update(
+                status='running',
+                stage='claimed',
+                started_at=now,
+                heartbeat_at=now,
+                attempts=job.attempts + 1
+            )
+            if not claimed:
+                return None
+
+        job.refresh_from_db()
+        return job
+
+    @staticmethod
+    def requeue_stale(stale_after, max_attempts):
+        """Requeue jobs left running by a dead worker, failing those out of attempts
+
+        A job is stale once its worker hasn't moved it to a new stage for ``stale_after``
+        seconds, however long ago it started.
+        """
+        cutoff = timezone.now() - timedelta(seconds=stale_after)
+        stale = PlanningJob.objects.filter(status='running', heartbeat_at__lt=cutoff)
+        failed = stale.filter(attempts__gte=max_attempts).update(
+            status='failed', error='Worker stopped before the job finished', finished_at=timezone.now()
+        )
+        requeued = stale.update(status='queued', stage='')
+        return requeued, failed
+
+    @staticmethod
+    def _set_stage(job, stage):
+        job.stage = stage
+        job.heartbeat_at = timezone.now()
+        PlanningJob.objects.filter(pk=job.pk).update(stage=stage, heartbeat_at=job.heartbeat_at)
+
+    @staticmethod
+    def run(job, max_attempts=3):
+        """Route, plan and persist a claimed job's trip"""
+        trip = job.trip
+        try:
+            PlanningJobService._set_stage(job, 'routing')
+            routes = RouteService.get_routes(HOSService.trip_legs(trip))
+
+            PlanningJobService._set_stage(job, 'planning')
+            segments = HOSService.plan_trip_segments(trip, routes=routes)
+            daily_logs_data = HOSService.generate_daily_logs(trip, segments)
+
+            PlanningJobService._set_stage(job, 'saving')
+            with transaction.atomic():
+                # A run taken for stale and retried can overlap this one; whichever saves last wins
+                TripPlanService.clear_plans([trip])
+                TripPlanService.save_plans([(trip, segments, daily_logs_data, routes)], create_trips=False)
+                job.status = 'succeeded'
+                job.stage = 'done'
+                job.error = ''
+                job.finished_at = timezone.now()
+                job.save(update_fields=['status', 'stage', 'error', 'finished_at'])
+
+        except Exception as e:
+            job.error = f'Failed to generate trip plan: {str(e)}'
+            if job.attempts < max_attempts:
+                job.status = 'queued'
+                job.stage = ''
+            else:
+                job.status = 'failed'
+                job.finished_at = timezone.now()
+            job.save(update_fields=['status', 'stage', 'error', 'finished_at'])
+
+        return job
\ No newline at end of file
@@ -0,0 +1,100 @@
+"""Cache invalidation and duty-day refreshes on writes to trips and their rows
+
+Only the trip itself has a delete receiver: a delete receiver on a model stops Django
+fast-deleting it in cascades, so deleting a trip or a progress update's stale rows
+would load every row and invalidate once per row. Deleting a trip invalidates it
+once; rows deleted on their own are covered where that happens (progress updates save
+the trip, and the admin invalidates in its delete paths).
+
+Bulk writes send no signals, so the planner and progress updates refresh the
+drivers' DriverDutyDay aggregates themselves; the receivers here cover one-off saves
+and deletes, such as admin edits, so a deleted or edited trip can't leave stale hours
+behind to seed the next trip's cycle.
+"""
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .cycle import CycleService
+from .models import Trip, RouteSegment, DailyLog, LogEntry
+from .trip_cache import invalidate_trip_on_commit
+
+
+@receiver([post_save, post_delete], sender=Trip)
+def invalidate_trip_response(sender, instance, **kwargs):
+    invalidate_trip_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=RouteSegment)
+@receiver(post_save, sender=DailyLog)
+def invalidate_parent_trip_response(sender, instance, **kwargs):
+    invalidate_trip_on_commit(instance.trip_id)
+
+
+@receiver(post_save, sender=LogEntry)
+def invalidate_log_entry_trip_response(sender, instance, **kwargs):
+    # Saved from a form or a fetched daily log, so the log is usually loaded already
+    invalidate_trip_on_commit(instance.daily_log.trip_id)
+
+
+def invalidate_trips_of(queryset):
+    """Invalidate the trips of a queryset of RouteSegment, DailyLog or LogEntry rows, once each"""
+    trip_field = 'daily_log__trip_id' if queryset.model is LogEntry else 'trip_id'
+    for trip_id in set(queryset.values_list(trip_field, flat=True)):
+        invalidate_trip_on_commit(trip_id)
+
+
+def duty_days_of(queryset):
+    """(driver_name, date) of the days a queryset of DailyLog or LogEntry rows falls on"""
+    if queryset.model is DailyLog:
+        return set(queryset.values_list('trip__driver_name', 'date'))
+    if queryset.model is LogEntry:
+        return set(queryset.values_list('daily_log__trip__driver_name', 'daily_log__date'))
+    return set()
+
+
+@receiver(pre_delete, sender=Trip)
+def remember_trip_duty_days(sender, instance, **kwargs):
+    # A trip's logs are deleted before the trip, so their days are read first
+    instance._duty_days = duty_days_of(DailyLog.objects.filter(trip=instance))
+
+
+@receiver(post_delete, sender=Trip)
+def refresh_deleted_trip_duty_days(sender, instance, **kwargs):
+    CycleService.refresh_days(getattr(instance, '_duty_days', ()))
+
+
+@receiver(pre_save, sender=Trip)
+def remember_trip_driver(sender, instance, raw, update_fields, **kwargs):
+    instance._saved_driver_name = None
+    if raw or instance._state.adding or (update_fields is not None and 'driver_name' not in update_fields):
+        return
+    instance._saved_driver_name = (Trip.objects.filter(pk=instance.pk)
+                                   .values_list('driver_name', flat=True).first())
+
+
+@receiver(post_save, sender=Trip)
+def refresh_reassigned_trip_duty_days(sender, instance, **kwargs):
+    previous = getattr(instance, '_saved_driver_name', None)
+    if previous is None or previous == instance.driver_name:
+        return
+    dates = set(instance.daily_logs.values_list('date', flat=True))
+    CycleService.refresh_days({(driver, date) for driver in (previous, instance.driver_name) for date in dates})
+
+
+@receiver(pre_save, sender=DailyLog)
+@receiver(pre_save, sender=LogEntry)
+def remember_saved_duty_days(sender, instance, raw, **kwargs):
+    # A log or entry can be moved to another day or trip; the day it leaves needs a refresh too.
+    # New logs have no entries yet, and the planner inserts entries in bulk
+    instance._saved_duty_days = set()
+    if not raw and not instance._state.adding:
+        instance._saved_duty_days = duty_days_of(sender.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=DailyLog)
+@receiver(post_save, sender=LogEntry)
+def refresh_saved_duty_days(sender, instance, created, raw, **kwargs):
+    if raw or (created and sender is DailyLog):
+        return
+    days = getattr(instance, '_saved_duty_days', set()) | duty_days_of(sender.objects.filter(pk=instance.pk))
+    CycleService.refresh_days(days)
@@ -0,0 +1,175 @@
+"""Ordering the stops of a multi-stop trip
+
+Stops are ordered on the straight-line distance matrix between the start and
+every stop, computed once. A first order is built by nearest neighbour, always
+driving to the closest stop whose pickup has already been made, then improved by
+local search: 2-opt reverses a run of stops and or-opt moves a run of up to three
+stops elsewhere in the order. A move is only taken if it shortens the route and
+keeps every dropoff after its pickup. When no move helps, the best order found is
+perturbed by a few random moves and improved again, a bounded number of times or
+until the time budget runs out. The perturbations are seeded, so unless the budget
+cuts the search short the same stops always come out in the same order.
+
+The route is open (it ends at the last stop) and distances are symmetric, so
+reversing a run only changes the cost of the two links at its ends.
+"""
+import random
+import time
+
+from .geo import haversine_matrix
+
+# Longest run of consecutive stops or-opt moves at once
+OR_OPT_MAX_RUN = 3
+# Smallest saving in miles taken as an improvement, so float noise can't make the search cycle
+MIN_SAVING_MILES = 1e-6
+# Perturbations of the best order tried once local search stops improving it
+RESTARTS = 20
+
+
+def route_miles(distances, order):
+    """Miles from the start (node 0) through the nodes in ``order``"""
+    miles = 0.0
+    previous = 0
+    for node in order:
+        miles += distances[previous][node]
+        previous = node
+    return miles
+
+
+def _feasible(order, predecessors):
+    """Whether every node in ``order`` comes after the node it must follow"""
+    position = {node: index for index, node in enumerate(order)}
+    return all(position[before] < position[node] for node, before in predecessors.items())
+
+
+def nearest_neighbour(distances, nodes, predecessors):
+    """Order ``nodes`` by repeatedly driving to the nearest one whose predecessor has been visited"""
+    remaining = set(nodes)
+    order = []
+    current = 0
+    while remaining:
+        ready = [node for node in sorted(remaining) if predecessors.get(node) not in remaining]
+        current = min(ready, key=lambda node: distances[current][node])
+        order.append(current)
+        remaining.remove(current)
+    return order
+
+
+def _two_opt(distances, order, predecessors, deadline):
+    """Reverse runs of ``order`` in place while that shortens it; return whether any was"""
+    improved = False
+    count = len(order)
+    for i in range(count - 1):
+        if time.perf_counter() > deadline:
+            break
+        for k in range(i + 1, count):
+            before = order[i - 1] if i else 0
+            first, last = order[i], order[k]
+            saving = distances[before][first] - distances[before][last]
+            if k + 1 < count:
+                after = order[k + 1]
+                saving += distances[last][after] - distances[first][after]
+            if saving <= MIN_SAVING_MILES:
+                continue
+
+            candidate = order[:i] + order[i:k + 1][::-1] + order[k + 1:]
+            if _feasible(candidate, predecessors):
+                order[:] = candidate
+                improved = True
+    return improved
+
+
+def _or_opt(distances, order, predecessors, deadline):
+    """Move runs of up to OR_OPT_MAX_RUN nodes of ``order`` in place while that shortens it"""
+    improved = False
+    for length in range(1, OR_OPT_MAX_RUN + 1):
+        i = 0
+        while i + length <= len(order):
+            if time.perf_counter() > deadline:
+                return improved
+            run = order[i:i + length]
+            rest = order[:i] + order[i + length:]
+            before = order[i - 1] if i else 0
+            after = order[i + length] if i + length < len(order) else None
+
+            # Miles saved by taking the run out and joining its neighbours
+            removed = distances[before][run[0]]
+            if after is not None:
+                removed += distances[run[-1]][after] - distances[before][after]
+
+            moved = False
+            for j in range(len(rest) + 1):
+                if j == i:
+                    continue
+                left = rest[j - 1] if j else 0
+                right = rest[j] if j < len(rest) else None
+                # The run can go in either way round
+                for candidate_run in (run, run[::-1]):
+                    added = distances[left][candidate_run[0]]
+                    if right is not None:
+                        added += distances[candidate_run[-1]][right] - distances[left][right]
+                    if removed - added <= MIN_SAVING_MILES:
+                        continue
+                    candidate = rest[:j] + candidate_run + rest[j:]
+                    if _feasible(candidate, predecessors):
+                        order[:] = candidate
+                        improved = moved = True
+                        break
+                if moved:
+                    break
+            if not moved:
+                i += 1
+    return improved
+
+
+def _improve(distances, order, predecessors, deadline):
+    """Apply 2-opt and or-opt moves to ``order`` in place until neither helps"""
+    while time.perf_counter() < deadline:
+        reversed_any = _two_opt(distances, order, predecessors, deadline)
+        moved_any = _or_opt(distances, order, predecessors, deadline)
+        if not (reversed_any or moved_any):
+            break
+
+
+def _perturb(order, predecessors, rng):
+    """A copy of ``order`` with a few random runs moved, keeping it feasible"""
+    order = list(order)
+    for _ in range(3):
+        length = rng.randint(1, min(OR_OPT_MAX_RUN, len(order)))
+        i = rng.randrange(len(order) - length + 1)
+        rest = order[:i] + order[i + length:]
+        j = rng.randrange(len(rest) + 1)
+        candidate = rest[:j] + order[i:i + length] + rest[j:]
+        if _feasible(candidate, predecessors):
+            order = candidate
+    return order
+
+
+def order_stops(start, points, predecessors=None, time_budget=0.05):
+    """Return the order to visit ``points`` in from ``start``, and its length in miles
+
+    ``start`` and ``points`` are (lat, lng) pairs; the order is a list of indexes into
+    ``points``. ``predecessors`` maps the index of a point to the index of the point
+    it must come after (a dropoff to its pickup). Improvement stops after
+    ``time_budget`` seconds, keeping the best order found by then.
+    """
+    deadline = time.perf_counter() + time_budget
+    predecessors = {node + 1: before + 1 for node, before in (predecessors or {}).items()}
+    # Node 0 is the start, node i the (i - 1)th point
+    distances = haversine_matrix([start, *points]).tolist()
+
+    best = nearest_neighbour(distances, range(1, len(points) + 1), predecessors)
+    _improve(distances, best, predecessors, deadline)
+    best_miles = route_miles(distances, best)
+
+    rng = random.Random(len(points))
+    for _ in range(RESTARTS if len(points) > 3 else 0):
+        if time.perf_counter() > deadline:
+            break
+        order = _perturb(best, predecessors, rng)
+        _improve(distances, order, predecessors, deadline)
+        miles = route_miles(distances, order)
+        if miles < best_miles - MIN_SAVING_MILES:
+            best, best_miles = order, miles
+
+    return [node - 1 for node in best], best_miles
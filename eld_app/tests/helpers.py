@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.test import override_settings
+
+# Legs are estimated from the straight-line distance, so tests never reach a routing service
+offline = override_settings(
+    ROUTING={**settings.ROUTING, 'BACKENDS': [], 'CONCURRENT': False},
+    ROUTE_CACHE={**settings.ROUTE_CACHE, 'ENABLED': False},
+)
+
+
+def trip_payload(**overrides):
+    """A create payload for a trip of a few hundred miles"""
+    return {
+        'current_location': 'Chicago, IL', 'current_lat': '41.878100', 'current_lng': '-87.629800',
+        'pickup_location': 'Milwaukee, WI', 'pickup_lat': '43.038900', 'pickup_lng': '-87.906500',
+        'dropoff_location': 'Minneapolis, MN', 'dropoff_lat': '44.977800', 'dropoff_lng': '-93.265000',
+        'current_cycle_hours': '0', 'driver_name': 'Test Driver', 'carrier_name': 'Test Carrier',
+        'truck_number': 'T-1',
+        **overrides,
+    }
@@ -0,0 +1,29 @@
+import asyncio
+from unittest import mock
+
+from django.test import TestCase
+
+from eld_app.services import HOSService
+
+from .helpers import offline, trip_payload
+
+
+@offline
+class AsyncCreateTripTests(TestCase):
+    async def test_planning_runs_off_the_event_loop(self):
+        plan = HOSService.plan_trip_segments
+        loops = []
+
+        def plan_and_record(*args, **kwargs):
+            try:
+                loops.append(asyncio.get_running_loop())
+            except RuntimeError:
+                loops.append(None)
+            return plan(*args, **kwargs)
+
+        with mock.patch('eld_app.services.HOSService.plan_trip_segments', side_effect=plan_and_record):
+            response = await self.async_client.post(
+                '/api/async/trips/create/', trip_payload(), content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(loops, [None])
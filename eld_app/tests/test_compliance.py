@@ -0,0 +1,108 @@
+import random
+import threading
+
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+
+from eld_app.compliance import iter_violations
+from eld_app.services import _plan_leg
+
+from .helpers import offline, trip_payload
+
+# Chicago to Los Angeles, by way of Denver: about three days of driving
+CROSS_COUNTRY = {
+    'pickup_location': 'Denver, CO', 'pickup_lat': '39.739200', 'pickup_lng': '-104.990300',
+    'dropoff_location': 'Los Angeles, CA', 'dropoff_lat': '34.052200', 'dropoff_lng': '-118.243700',
+}
+
+
+def plan_leg_or_fail(test, *args):
+    """_plan_leg(*args), failing the test rather than hanging it if the planner doesn't return"""
+    result = []
+    worker = threading.Thread(target=lambda: result.append(_plan_leg(*args)), daemon=True)
+    worker.start()
+    worker.join(timeout=5)
+    if not result:
+        test.fail(f'_plan_leg{args} did not return')
+    return result[0]
+
+
+class PlanLegTests(SimpleTestCase):
+    def test_zero_duration_leg_with_a_clock_over_its_limit(self):
+        # (current_cycle, driving_clock, duty_clock, fuel_miles, break_clock)
+        clocks = {
+            'cycle': (70.5, 0, 0, 0, 0),
+            'driving': (20.0, 11.5, 12.0, 0, 0),
+            'duty': (20.0, 5.0, 14.5, 0, 0),
+            'fuel': (20.0, 0, 0, 1000.5, 0),
+            'break': (20.0, 8.5, 9.0, 0, 8.5),
+        }
+        for clock, (cycle, driving, duty, fuel_miles, since_break) in clocks.items():
+            with self.subTest(clock=clock):
+                plan = plan_leg_or_fail(self, 0.1, 0.0, cycle, driving, duty, fuel_miles, since_break)
+                self.assertEqual(sum(segment.distance_miles for segment in plan), 0.1)
+                self.assertTrue(plan[-1].reaches_end)
+
+    def test_every_leg_is_planned(self):
+        rng = random.Random(14)
+        for _ in range(500):
+            distance = rng.choice([0.1, rng.uniform(1, 50), rng.uniform(50, 3000)])
+            duration = rng.choice([0.0, distance / rng.uniform(40, 65)])
+            args = (round(distance, 2), round(duration, 2), round(rng.uniform(0, 72), 2), round(rng.uniform(0, 12), 2),
+                    round(rng.uniform(0, 15), 2), round(rng.uniform(0, 1001), 2), round(rng.uniform(0, 9), 2))
+            plan = plan_leg_or_fail(self, *args)
+            self.assertAlmostEqual(sum(segment.distance_miles for segment in plan), args[0], delta=0.2, msg=args)
+            self.assertTrue(plan[-1].reaches_end, args)
+
+    def test_break_does_not_reset_the_driving_limit(self):
+        plan = _plan_leg(2000.0, 36.0, 0.0)
+        driving = 0.0
+        for segment in plan:
+            if segment.segment_type in ('rest', 'restart'):
+                driving = 0.0
+            elif segment.segment_type == 'driving':
+                driving += segment.duration_hours
+                self.assertLessEqual(driving, 11 + 1e-6)
+        self.assertIn('break', [segment.segment_type for segment in plan])
+
+
+@offline
+class PlannedTripViolationTests(TestCase):
+    def assert_no_violations(self, **overrides):
+        response = APIClient().post('/api/trips/create/', trip_payload(**CROSS_COUNTRY, **overrides), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(list(iter_violations(driver='Test Driver')), [])
+
+    def test_multi_day_trip(self):
+        self.assert_no_violations()
+
+    def test_multi_day_trip_through_a_restart(self):
+        self.assert_no_violations(current_cycle_hours='60')
+
+
+@offline
+class ShortLegAtCycleLimitTests(TestCase):
+    """Legs of a few hundred yards planned with the cycle almost used up"""
+
+    def setUp(self):
+        self.client = APIClient()
+        # Pickup where the driver is and a dropoff 0.08 mi away: both legs estimate to 0 h
+        self.payload = trip_payload(
+            current_location='Chicago, IL', current_lat='41.878100', current_lng='-87.629800',
+            pickup_location='Chicago, IL', pickup_lat='41.878100', pickup_lng='-87.629800',
+            dropoff_location='Chicago, IL', dropoff_lat='41.879200', dropoff_lng='-87.629800',
+            current_cycle_hours='69.5',
+        )
+
+    def test_create(self):
+        response = self.client.post('/api/trips/create/', self.payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['route_segments'][-1]['segment_type'], 'dropoff')
+
+    def test_progress(self):
+        response = self.client.post('/api/trips/create/', self.payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.patch(f"/api/trips/{response.data['id']}/progress/", {
+            'location': 'Chicago, IL', 'lat': '41.878600', 'lng': '-87.629800', 'completed_segments': 2,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
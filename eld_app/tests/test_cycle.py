@@ -0,0 +1,107 @@
+from datetime import date, datetime, time
+from io import StringIO
+
+from django.contrib import admin
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from eld_app.admin import DailyLogAdmin
+from eld_app.cycle import CycleService
+from eld_app.models import DailyLog, DriverDutyDay, LogEntry, Trip
+
+from .helpers import offline, trip_payload
+
+
+@offline
+class RefreshDaysTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_overlapping_trips_count_once(self):
+        for _ in range(2):
+            response = self.client.post('/api/trips/create/', trip_payload(), format='json')
+            self.assertEqual(response.status_code, 201)
+
+        single = DriverDutyDay.objects.get(driver_name='Test Driver', date=date.today())
+        trip = Trip.objects.first()
+        log = trip.daily_logs.get(date=date.today())
+        self.assertEqual(single.on_duty_hours, log.total_hours_driving + log.total_hours_on_duty)
+        self.assertLessEqual(single.on_duty_hours, 24)
+
+    def test_day_is_capped_at_24_hours(self):
+        day = date(2025, 1, 6)
+        for offset in range(3):
+            trip = Trip.objects.create(**{
+                **trip_payload(driver_name='Capped'), 'current_cycle_hours': 0
+            })
+            log = DailyLog.objects.create(trip=trip, date=day)
+            # Three overlapping all-day driving entries
+            LogEntry.objects.create(daily_log=log, start_time=time(0, offset), end_time=time(23, 59),
+                                    duty_status='driving')
+            LogEntry.objects.create(daily_log=log, start_time=time(23, 59), end_time=time(0, offset),
+                                    duty_status='on_duty_not_driving')
+
+        CycleService.refresh_days([('Capped', day)])
+        aggregate = DriverDutyDay.objects.get(driver_name='Capped', date=day)
+        self.assertLessEqual(aggregate.on_duty_hours, 24)
+        self.assertEqual(CycleService.cycle_state('Capped', datetime(2025, 1, 6, 23)).used_hours,
+                         float(aggregate.on_duty_hours))
+
+
+@offline
+class RebuildDutyDaysTests(TestCase):
+    def test_rebuild_keeps_live_days_and_drops_stale(self):
+        response = APIClient().post('/api/trips/create/', trip_payload(), format='json')
+        self.assertEqual(response.status_code, 201)
+        live = {(day.driver_name, day.date): day.on_duty_hours for day in DriverDutyDay.objects.all()}
+        DriverDutyDay.objects.create(driver_name='Gone', date=date(2020, 1, 1), on_duty_hours=5)
+
+        call_command('rebuild_duty_days', batch_size=1, stdout=StringIO())
+
+        self.assertEqual(
+            {(day.driver_name, day.date): day.on_duty_hours for day in DriverDutyDay.objects.all()}, live
+        )
+
+
+@offline
+class DutyDayRefreshTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        response = self.client.post('/api/trips/create/', trip_payload(), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.trip = Trip.objects.get(pk=response.data['id'])
+
+    def days(self, driver='Test Driver'):
+        return {day.date: day.on_duty_hours for day in DriverDutyDay.objects.filter(driver_name=driver)}
+
+    def test_deleted_trip_stops_counting(self):
+        self.assertTrue(self.days())
+        self.trip.delete()
+        self.assertEqual(self.days(), {})
+
+        # A new trip without cycle hours is seeded from the aggregates
+        payload = trip_payload()
+        del payload['current_cycle_hours']
+        response = self.client.post('/api/trips/create/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(float(response.data['current_cycle_hours']), 0)
+
+    def test_reassigned_trip_moves_to_the_new_driver(self):
+        before = self.days()
+        self.trip.driver_name = 'Other Driver'
+        self.trip.save()
+        self.assertEqual(self.days(), {})
+        self.assertEqual(self.days('Other Driver'), before)
+
+    def test_edited_entry_is_counted(self):
+        entry = LogEntry.objects.filter(daily_log__trip=self.trip, duty_status='driving').first()
+        before = self.days()[entry.daily_log.date]
+        entry.duty_status = 'off_duty'
+        entry.save()
+        self.assertLess(self.days()[entry.daily_log.date], before)
+
+    def test_admin_delete_of_a_log_is_counted(self):
+        log = self.trip.daily_logs.first()
+        DailyLogAdmin(DailyLog, admin.site).delete_model(None, log)
+        self.assertNotIn(log.date, self.days())
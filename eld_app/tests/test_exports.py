@@ -0,0 +1,50 @@
+import json
+import os
+import tempfile
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from eld_app.exports import iter_export
+
+from .helpers import offline, trip_payload
+
+
+@offline
+class ExportTests(TestCase):
+    def setUp(self):
+        response = APIClient().post('/api/trips/create/', trip_payload(), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.trip_id = response.data['id']
+
+    def export_file(self, *args):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'logs.ndjson')
+            call_command('export_logs', '--file', path, *args)
+            with open(path) as export:
+                return [json.loads(line) for line in export]
+
+    def test_ndjson_keeps_json_types(self):
+        rows = [json.loads(line) for line in ''.join(iter_export('ndjson')).splitlines()]
+        self.assertTrue(rows)
+        for row in rows:
+            self.assertEqual(row['trip_id'], str(self.trip_id))
+            self.assertIsInstance(row['daily_log_id'], int)
+            self.assertNotEqual(row['remarks'], 'None')
+
+    def test_csv_is_text(self):
+        header, first = ''.join(iter_export('csv')).splitlines()[:2]
+        self.assertTrue(header.startswith('trip_id,'))
+        self.assertTrue(first.startswith(f'{self.trip_id},'))
+
+    def test_command_filters_by_date(self):
+        rows = self.export_file()
+        first_date = min(row['date'] for row in rows)
+        self.assertEqual(self.export_file('--end-date', first_date),
+                         [row for row in rows if row['date'] == first_date])
+        self.assertEqual(self.export_file('--start-date', '2999-01-01'), [])
+
+    def test_command_rejects_malformed_dates(self):
+        with self.assertRaises(CommandError):
+            call_command('export_logs', '--start-date', '01/02/2026')
@@ -0,0 +1,57 @@
+import random
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase
+
+from eld_app.geo import encode_polyline, haversine_matrix
+from eld_app.geometry import LegPath, LegPathCache
+from eld_app.services import RouteService
+
+
+class HaversineMatrixTests(SimpleTestCase):
+    def test_matches_scalar_distance(self):
+        rng = random.Random(6)
+        points = [(rng.uniform(25, 49), rng.uniform(-124, -67)) for _ in range(40)]
+        matrix = haversine_matrix(points)
+        for i, (lat1, lng1) in enumerate(points):
+            for j, (lat2, lng2) in enumerate(points):
+                self.assertAlmostEqual(matrix[i, j], RouteService.calculate_distance(lat1, lng1, lat2, lng2),
+                                       delta=1e-9)
+
+    def test_benchmark_fails_on_parity_regression(self):
+        call_command('benchmark_haversine', sizes=[20], repeat=1, stdout=StringIO())
+
+        def skewed(*args):
+            return haversine_matrix(*args) + 1e-6
+
+        with mock.patch('eld_app.management.commands.benchmark_haversine.haversine_matrix', side_effect=skewed):
+            with self.assertRaises(CommandError):
+                call_command('benchmark_haversine', sizes=[20], repeat=1, stdout=StringIO())
+
+
+class LegPathCacheTests(SimpleTestCase):
+    def leg(self, rng, points):
+        line = [(rng.uniform(40, 45), rng.uniform(-95, -85)) for _ in range(points)]
+        return {'geometry': encode_polyline(line), 'distance_miles': 500.0}, (*line[0], *line[-1])
+
+    def test_bounded_by_bytes(self):
+        rng = random.Random(23)
+        cache = LegPathCache(max_bytes=100 * 24 * 3)
+        with mock.patch('eld_app.geometry._leg_paths', cache):
+            for _ in range(10):
+                LegPath(*self.leg(rng, 100)).position(250)
+        self.assertEqual(len(cache), 3)
+        self.assertLessEqual(cache.size, cache.max_bytes)
+
+    def test_keys_do_not_hold_the_polyline(self):
+        rng = random.Random(24)
+        route, ends = self.leg(rng, 2000)
+        cache = LegPathCache(max_bytes=1024 * 1024)
+        with mock.patch('eld_app.geometry._leg_paths', cache):
+            first = LegPath(route, ends).position(100)
+            self.assertEqual(LegPath(route, ends).position(100), first)
+        self.assertEqual(len(cache), 1)
+        (digest, _), = cache._data
+        self.assertLess(len(digest), 32)
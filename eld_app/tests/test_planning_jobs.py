@@ -0,0 +1,106 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from eld_app.models import DailyLog, LogEntry, PlanningJob, RouteGeometry, RouteSegment
+from eld_app.services import PlanningJobService
+
+from .helpers import offline, trip_payload
+
+
+@offline
+class PlanningJobTests(TestCase):
+    def enqueue(self):
+        response = APIClient().post('/api/trips/create/?async=true', trip_payload(), format='json')
+        self.assertEqual(response.status_code, 202)
+        return PlanningJob.objects.get(pk=response.data['job_id'])
+
+    def age(self, job, seconds):
+        """Move a running job's heartbeat ``seconds`` into the past"""
+        PlanningJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=seconds))
+
+    def plan_rows(self, trip):
+        return [
+            model.objects.filter(**{lookup: trip}).count()
+            for model, lookup in ((RouteSegment, 'trip'), (RouteGeometry, 'trip'), (DailyLog, 'trip'),
+                                  (LogEntry, 'daily_log__trip'))
+        ]
+
+    def test_claims_oldest_job_once(self):
+        first, second = self.enqueue(), self.enqueue()
+
+        claimed = PlanningJobService.claim_next()
+        self.assertEqual(claimed.pk, first.pk)
+        self.assertEqual((claimed.status, claimed.attempts), ('running', 1))
+        self.assertIsNotNone(claimed.heartbeat_at)
+
+        self.assertEqual(PlanningJobService.claim_next().pk, second.pk)
+        self.assertIsNone(PlanningJobService.claim_next())
+
+    def test_requeues_only_jobs_without_a_recent_heartbeat(self):
+        slow, orphaned = self.enqueue(), self.enqueue()
+        PlanningJobService.claim_next()
+        PlanningJobService.claim_next()
+        # Started long ago, but still moving through its stages
+        PlanningJob.objects.filter(pk=slow.pk).update(started_at=timezone.now() - timedelta(hours=1))
+        self.age(slow, 10)
+        self.age(orphaned, 600)
+
+        self.assertEqual(PlanningJobService.requeue_stale(stale_after=300, max_attempts=3), (1, 0))
+        slow.refresh_from_db()
+        orphaned.refresh_from_db()
+        self.assertEqual(slow.status, 'running')
+        self.assertEqual((orphaned.status, orphaned.stage), ('queued', ''))
+
+    def test_fails_stale_jobs_out_of_attempts(self):
+        job = self.enqueue()
+        PlanningJobService.claim_next()
+        self.age(job, 600)
+
+        self.assertEqual(PlanningJobService.requeue_stale(stale_after=300, max_attempts=1), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+    def test_stages_touch_the_heartbeat(self):
+        self.enqueue()
+        job = PlanningJobService.claim_next()
+        self.age(job, 600)
+        PlanningJobService._set_stage(job, 'routing')
+        self.assertEqual(PlanningJobService.requeue_stale(stale_after=300, max_attempts=3), (0, 0))
+
+    def test_run_plans_the_trip(self):
+        self.enqueue()
+        job = PlanningJobService.run(PlanningJobService.claim_next())
+        self.assertEqual((job.status, job.stage, job.error), ('succeeded', 'done', ''))
+        self.assertTrue(all(self.plan_rows(job.trip)))
+
+    def test_overlapping_runs_leave_one_plan(self):
+        self.enqueue()
+        single = PlanningJobService.run(PlanningJobService.claim_next())
+
+        self.enqueue()
+        slow = PlanningJobService.claim_next()
+        # Taken for orphaned and claimed by a second worker while the first is still on it
+        self.age(slow, 600)
+        PlanningJobService.requeue_stale(stale_after=300, max_attempts=3)
+        retry = PlanningJobService.claim_next()
+        self.assertEqual(retry.pk, slow.pk)
+
+        for job in (slow, retry):
+            self.assertEqual(PlanningJobService.run(job).status, 'succeeded')
+        self.assertEqual(self.plan_rows(retry.trip), self.plan_rows(single.trip))
+
+    def test_failed_run_is_retried_until_out_of_attempts(self):
+        self.enqueue()
+        with mock.patch('eld_app.services.RouteService.get_routes', side_effect=RuntimeError('routing down')):
+            job = PlanningJobService.run(PlanningJobService.claim_next(), max_attempts=2)
+            self.assertEqual(job.status, 'queued')
+            self.assertIn('routing down', job.error)
+
+            job = PlanningJobService.run(PlanningJobService.claim_next(), max_attempts=2)
+            self.assertEqual((job.status, job.attempts), ('failed', 2))
+            self.assertIsNotNone(job.finished_at)
+        self.assertIsNone(PlanningJobService.claim_next())
@@ -0,0 +1,57 @@
+from unittest import mock
+
+from django.db.models import Count
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from eld_app.models import LogEntry, RouteSegment, Trip
+from eld_app.services import HOSService, TripProgressService
+
+from .helpers import offline, trip_payload
+
+
+@offline
+class UpdateProgressTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        response = self.client.post('/api/trips/create/', trip_payload(), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.trip = Trip.objects.get(pk=response.data['id'])
+
+    def patch(self, **progress):
+        return self.client.patch(f'/api/trips/{self.trip.pk}/progress/', progress, format='json')
+
+    def test_repeated_update_writes_nothing(self):
+        progress = {'location': 'Kenosha, WI', 'lat': '42.584700', 'lng': '-87.821200', 'completed_segments': 1}
+        self.assertEqual(self.patch(**progress).status_code, 200)
+
+        response = self.patch(**progress)
+        self.assertEqual(response.status_code, 200)
+        for table, counts in response.data['changes'].items():
+            if table != 'route_geometries':
+                self.assertEqual(counts, {'created': 0, 'updated': 0, 'deleted': 0}, table)
+
+    def test_concurrent_updates_with_same_progress_leave_one_plan(self):
+        plan = HOSService.plan_remaining_segments
+        calls = []
+
+        def plan_while_another_update_lands(*args, **kwargs):
+            # The first update plans, then another update commits before it takes the lock
+            calls.append(1)
+            if len(calls) == 1:
+                TripProgressService.update_progress(
+                    Trip.objects.get(pk=self.trip.pk), 'Denver, CO', 39.7392, -104.9903, 0
+                )
+            return plan(*args, **kwargs)
+
+        with mock.patch.object(HOSService, 'plan_remaining_segments', side_effect=plan_while_another_update_lands):
+            TripProgressService.update_progress(self.trip, 'Zion, IL', 42.4461, -87.8328, 0)
+
+        orders = RouteSegment.objects.filter(trip=self.trip).values('order').annotate(rows=Count('id'))
+        self.assertTrue(all(row['rows'] == 1 for row in orders))
+        fresh = HOSService.plan_remaining_segments(self.trip, [], 'Zion, IL', 42.4461, -87.8328)
+        self.assertEqual(RouteSegment.objects.filter(trip=self.trip).count(), len(fresh))
+        self.assertEqual(
+            LogEntry.objects.filter(daily_log__trip=self.trip).count(),
+            sum(len(day['entries']) for day in HOSService.generate_daily_logs(self.trip, fresh))
+        )
@@ -0,0 +1,37 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from .helpers import offline, trip_payload
+
+# Creating a trip is a constant number of statements however many segments, days and entries
+# it has: BEGIN, one INSERT per table (trip, segments, geometry, logs, entries), the duty-day
+# read and upsert, COMMIT, then one prefetch per nested relation of the response
+CREATE_TRIP_QUERIES = 12
+
+
+@offline
+class CreateTripQueryCountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def create(self, payload):
+        response = self.client.post('/api/trips/create/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def test_short_trip(self):
+        with self.assertNumQueries(CREATE_TRIP_QUERIES):
+            trip = self.create(trip_payload())
+        self.assertEqual(len(trip['daily_logs']), 1)
+
+    def test_multi_day_trip(self):
+        payload = trip_payload(dropoff_location='Seattle, WA', dropoff_lat='47.606200', dropoff_lng='-122.332100')
+        with self.assertNumQueries(CREATE_TRIP_QUERIES):
+            trip = self.create(payload)
+        self.assertGreater(len(trip['daily_logs']), 1)
+
+    def test_seeded_cycle_adds_one_query(self):
+        payload = trip_payload()
+        del payload['current_cycle_hours']
+        with self.assertNumQueries(CREATE_TRIP_QUERIES + 1):
+            self.create(payload)
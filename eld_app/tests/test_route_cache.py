@@ -0,0 +1,102 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from eld_app.route_cache import LRUTTLCache, RouteCache
+
+CHICAGO_MILWAUKEE = (41.8781, -87.6298, 43.0389, -87.9065)
+ROUTE = {'distance_miles': 92.4, 'duration_hours': 1.6, 'geometry': None}
+
+
+class Clock:
+    """Stands in for time.monotonic, moved on by hand"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class ClockedTestCase(SimpleTestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch('eld_app.route_cache.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class LRUTTLCacheTests(ClockedTestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUTTLCache(max_entries=2, ttl_seconds=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        self.assertEqual((len(cache), cache.evictions), (2, 1))
+
+    def test_entries_expire_after_the_ttl(self):
+        cache = LRUTTLCache(max_entries=2, ttl_seconds=60)
+        cache.set('a', 1)
+        self.clock.now += 59
+        self.assertEqual(cache.get('a'), 1)
+
+        self.clock.now += 1
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual((len(cache), cache.expirations, cache.evictions), (0, 1, 0))
+
+    def test_setting_again_renews_the_ttl(self):
+        cache = LRUTTLCache(max_entries=2, ttl_seconds=60)
+        cache.set('a', 1)
+        self.clock.now += 50
+        cache.set('a', 2)
+        self.clock.now += 50
+        self.assertEqual(cache.get('a'), 2)
+
+
+class RouteCacheTests(ClockedTestCase):
+    def test_counts_hits_and_misses(self):
+        cache = RouteCache(max_entries=4, ttl_seconds=60)
+        self.assertIsNone(cache.get(*CHICAGO_MILWAUKEE))
+        cache.set(*CHICAGO_MILWAUKEE, ROUTE)
+        self.assertEqual(cache.get(*CHICAGO_MILWAUKEE), ROUTE)
+        # Within the same geohash cell, so it shares the entry
+        self.assertEqual(cache.get(41.87811, -87.62981, 43.03891, -87.90651), ROUTE)
+
+        stats = cache.stats()
+        self.assertEqual((stats['local_hits'], stats['misses'], stats['hit_rate']), (2, 1, 0.6667))
+
+    def test_stats_report_evictions_and_expirations(self):
+        cache = RouteCache(max_entries=1, ttl_seconds=60)
+        cache.set(*CHICAGO_MILWAUKEE, ROUTE)
+        cache.set(43.0389, -87.9065, 44.9778, -93.2650, ROUTE)
+        self.clock.now += 60
+        self.assertIsNone(cache.get(43.0389, -87.9065, 44.9778, -93.2650))
+
+        stats = cache.stats()
+        self.assertEqual((stats['evictions'], stats['expirations'], stats['local_size']), (1, 1, 0))
+
+        cache.clear()
+        stats = cache.stats()
+        self.assertEqual((stats['evictions'], stats['expirations'], stats['misses']), (0, 0, 0))
+
+    def test_returns_copies(self):
+        cache = RouteCache()
+        cache.set(*CHICAGO_MILWAUKEE, ROUTE)
+        cache.get(*CHICAGO_MILWAUKEE)['distance_miles'] = 0
+        self.assertEqual(cache.get(*CHICAGO_MILWAUKEE), ROUTE)
+
+    @override_settings(CACHES={'routes': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                          'LOCATION': 'route-cache-tests'}})
+    def test_shared_tier_fills_the_local_tier(self):
+        writer = RouteCache(shared_alias='routes')
+        writer.set(*CHICAGO_MILWAUKEE, ROUTE)
+
+        reader = RouteCache(shared_alias='routes')
+        self.assertEqual(reader.get(*CHICAGO_MILWAUKEE), ROUTE)
+        self.assertEqual(reader.get(*CHICAGO_MILWAUKEE), ROUTE)
+        stats = reader.stats()
+        self.assertEqual((stats['shared_hits'], stats['local_hits'], stats['misses']), (1, 1, 0))
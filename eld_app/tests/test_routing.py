@@ -0,0 +1,113 @@
+from unittest import mock
+
+import requests
+from django.test import SimpleTestCase
+
+from eld_app.routing import CircuitBreaker, ORSClient
+
+
+class Clock:
+    """Stands in for time.monotonic, moved on by hand"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch('eld_app.routing.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(failure_threshold=3, cooldown_seconds=30)
+
+    def trip(self):
+        for _ in range(self.breaker.failure_threshold):
+            self.assertTrue(self.breaker.allow_request())
+            self.breaker.record_failure()
+
+    def test_opens_after_consecutive_failures(self):
+        for _ in range(2):
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_success_resets_the_failure_count(self):
+        for _ in range(2):
+            self.breaker.record_failure()
+        self.breaker.record_success()
+        for _ in range(2):
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_open_circuit_short_circuits_until_the_cooldown(self):
+        self.trip()
+        self.clock.now += 29
+        self.assertFalse(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+        self.assertEqual(self.breaker.stats()['short_circuited'], 2)
+
+    def test_lets_one_probe_through_after_the_cooldown(self):
+        self.trip()
+        self.clock.now += 30
+        self.assertTrue(self.breaker.allow_request())
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        # Everything else waits on the probe
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_successful_probe_closes_the_circuit(self):
+        self.trip()
+        self.clock.now += 30
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_failed_probe_reopens_for_another_cooldown(self):
+        self.trip()
+        self.clock.now += 30
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+        self.clock.now += 29
+        self.assertFalse(self.breaker.allow_request())
+        self.clock.now += 1
+        self.assertTrue(self.breaker.allow_request())
+
+
+class ORSClientBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.client = ORSClient('key', 'http://ors.invalid', breaker=CircuitBreaker(failure_threshold=2))
+        self.addCleanup(self.client.session.close)
+
+    def test_stops_calling_ors_once_open(self):
+        with mock.patch.object(self.client.session, 'post', side_effect=requests.ConnectionError('down')) as post:
+            for _ in range(4):
+                self.assertIsNone(self.client.route(41.88, -87.63, 43.04, -87.91))
+
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual((self.client.requests, self.client.failures), (2, 2))
+        self.assertEqual(self.client.breaker.stats()['short_circuited'], 2)
+
+    def test_server_errors_count_as_failures(self):
+        response = mock.Mock(status_code=503)
+        with mock.patch.object(self.client.session, 'post', return_value=response):
+            self.client.route(41.88, -87.63, 43.04, -87.91)
+            self.client.route(41.88, -87.63, 43.04, -87.91)
+        self.assertEqual(self.client.breaker.state, CircuitBreaker.OPEN)
+
+    def test_client_errors_keep_the_circuit_closed(self):
+        # ORS answered; it just couldn't route the leg
+        response = mock.Mock(status_code=404)
+        with mock.patch.object(self.client.session, 'post', return_value=response):
+            for _ in range(3):
+                self.assertIsNone(self.client.route(41.88, -87.63, 43.04, -87.91))
+        self.assertEqual(self.client.breaker.state, CircuitBreaker.CLOSED)
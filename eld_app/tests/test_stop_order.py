@@ -0,0 +1,90 @@
+import random
+from itertools import permutations
+
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+
+from eld_app.geo import haversine_matrix
+from eld_app.models import RouteGeometry, Trip
+from eld_app.stop_order import order_stops, route_miles
+
+from .helpers import offline
+
+START = (41.8781, -87.6298)
+
+
+def random_stops(rng, count):
+    """``count`` points within a few hundred miles of START, paired into shipments"""
+    points = [(START[0] + rng.uniform(-4, 4), START[1] + rng.uniform(-5, 5)) for _ in range(count)]
+    predecessors = {index + 1: index for index in range(0, count - 1, 2)}
+    return points, predecessors
+
+
+def best_order(points, predecessors):
+    """The shortest feasible order, by trying them all"""
+    distances = haversine_matrix([START, *points]).tolist()
+    best = None
+    for order in permutations(range(len(points))):
+        position = {node: index for index, node in enumerate(order)}
+        if any(position[before] > position[node] for node, before in predecessors.items()):
+            continue
+        miles = route_miles(distances, [node + 1 for node in order])
+        if best is None or miles < best:
+            best = miles
+    return best
+
+
+class OrderStopsTests(SimpleTestCase):
+    def test_matches_brute_force_on_small_trips(self):
+        rng = random.Random(7)
+        for _ in range(10):
+            points, predecessors = random_stops(rng, 7)
+            order, miles = order_stops(START, points, predecessors, time_budget=1)
+            self.assertAlmostEqual(miles, best_order(points, predecessors), delta=1e-6)
+            self.assertEqual(sorted(order), list(range(len(points))))
+
+    def test_dropoffs_follow_their_pickups(self):
+        rng = random.Random(11)
+        for _ in range(20):
+            points, predecessors = random_stops(rng, 15)
+            order, _ = order_stops(START, points, predecessors)
+            position = {node: index for index, node in enumerate(order)}
+            for node, before in predecessors.items():
+                self.assertLess(position[before], position[node])
+
+
+@offline
+class MultiStopTripTests(TestCase):
+    def test_stops_are_sequenced_by_shipment(self):
+        # Each dropoff is nearer the start than its pickup, so the nearest stop can't always come first
+        stops = [
+            {'stop_type': 'dropoff', 'location': 'Milwaukee, WI', 'lat': '43.038900', 'lng': '-87.906500',
+             'shipment': 'A'},
+            {'stop_type': 'pickup', 'location': 'Minneapolis, MN', 'lat': '44.977800', 'lng': '-93.265000',
+             'shipment': 'A'},
+            {'stop_type': 'dropoff', 'location': 'Gary, IN', 'lat': '41.593400', 'lng': '-87.346400',
+             'shipment': 'B'},
+            {'stop_type': 'pickup', 'location': 'Indianapolis, IN', 'lat': '39.768400', 'lng': '-86.158100',
+             'shipment': 'B'},
+        ]
+        response = APIClient().post('/api/trips/multi-stop/', {
+            'current_location': 'Chicago, IL', 'current_lat': '41.878100', 'current_lng': '-87.629800',
+            'stops': stops, 'current_cycle_hours': '0', 'driver_name': 'Test Driver',
+            'carrier_name': 'Test Carrier', 'truck_number': 'T-1',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+
+        trip = Trip.objects.get(pk=response.data['id'])
+        sequence = {(stop.stop_type, stop.shipment): stop.sequence for stop in trip.ordered_stops}
+        for shipment in 'AB':
+            self.assertLess(sequence['pickup', shipment], sequence['dropoff', shipment])
+        self.assertEqual(trip.route_geometries.count(), len(stops))
+
+    def test_geometry_leg_is_not_limited_to_two(self):
+        trip = Trip.objects.create(
+            current_location='Chicago, IL', current_lat='41.878100', current_lng='-87.629800',
+            pickup_location='Milwaukee, WI', pickup_lat='43.038900', pickup_lng='-87.906500',
+            dropoff_location='Minneapolis, MN', dropoff_lat='44.977800', dropoff_lng='-93.265000',
+            current_cycle_hours='0', driver_name='Test Driver', carrier_name='Test Carrier', truck_number='T-1',
+        )
+        RouteGeometry(trip=trip, leg=5, polyline='_p~iF~ps|U').full_clean()
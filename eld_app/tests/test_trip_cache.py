@@ -0,0 +1,119 @@
+from unittest import mock
+
+from django.contrib import admin
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import parse_http_date
+from rest_framework.test import APIClient
+
+from eld_app.admin import LogEntryAdmin
+from eld_app.models import LogEntry, Trip
+from eld_app.trip_cache import invalidate_trip
+
+from .helpers import offline, trip_payload
+
+START = 1_800_000_000.2
+
+
+class Clock:
+    """Stands in for time.time and time.time_ns, moved on by hand"""
+
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def time_ns(self):
+        return int(self.now * 1_000_000_000)
+
+
+@offline
+class LastModifiedTests(TestCase):
+    def setUp(self):
+        caches['responses'].clear()
+        self.clock = Clock(START)
+        for name in ('time', 'time_ns'):
+            patcher = mock.patch(f'eld_app.trip_cache.time.{name}', getattr(self.clock, name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.client = APIClient()
+        response = self.client.post('/api/trips/create/', trip_payload(), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.trip_id = response.data['id']
+        self.urls = [f'/api/trips/{self.trip_id}/', f'/api/trips/{self.trip_id}/geometry/']
+
+    def last_modified(self, response):
+        return parse_http_date(response['Last-Modified'])
+
+    def test_unchanged_trip_is_not_modified(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.client.get(url)
+                self.clock.now += 1
+                last_modified = self.client.get(url)['Last-Modified']
+                self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_last_modified_is_withheld_in_the_second_of_a_change(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.client.get(url)
+                self.clock.now += 1
+                last_modified = self.client.get(url)['Last-Modified']
+
+                # Changed and fetched again within one second: the change's second can't be promised yet
+                self.clock.now += 1.2
+                invalidate_trip(self.trip_id)
+                self.clock.now += 0.1
+                response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn('Last-Modified', response)
+
+                self.clock.now += 1
+                response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+                self.assertEqual(response.status_code, 200)
+                self.assertGreater(self.last_modified(response), parse_http_date(last_modified))
+                self.assertLessEqual(self.last_modified(response), self.clock.now)
+
+    def test_lost_version_does_not_revive_old_entries(self):
+        url = self.urls[0]
+        self.client.get(url)
+        # Culled from the cache, and the trip changed without signals
+        caches['responses'].delete(f'trip-version:{self.trip_id}')
+        Trip.objects.filter(pk=self.trip_id).update(driver_name='Renamed Driver')
+
+        self.assertEqual(self.client.get(url).json()['driver_name'], 'Renamed Driver')
+
+
+@offline
+class InvalidationTests(TestCase):
+    def create_trip(self, **overrides):
+        response = APIClient().post('/api/trips/create/', trip_payload(**overrides), format='json')
+        self.assertEqual(response.status_code, 201)
+        return Trip.objects.get(pk=response.data['id'])
+
+    def delete_queries(self, trip):
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks() as callbacks:
+            trip.delete()
+        self.assertEqual(len(callbacks), 1)
+        return len(queries)
+
+    def test_deleting_a_trip_invalidates_once_and_fast_deletes_its_rows(self):
+        short = self.delete_queries(self.create_trip())
+        # Several days of logs and segments, deleted in as many queries as the short trip's
+        long = self.delete_queries(self.create_trip(
+            dropoff_location='Los Angeles, CA', dropoff_lat='34.052200', dropoff_lng='-118.243700'
+        ))
+        self.assertEqual(long, short)
+
+    def test_admin_delete_invalidates_each_trip_once(self):
+        trip = self.create_trip()
+        entries = LogEntry.objects.filter(daily_log__trip=trip)
+        self.assertGreater(entries.count(), 1)
+        with self.captureOnCommitCallbacks() as callbacks:
+            LogEntryAdmin(LogEntry, admin.site).delete_queryset(None, entries)
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(entries.exists())
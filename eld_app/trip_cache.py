@@ -0,0 +1,193 @@
+"""Cache of rendered get_trip responses, with ETags for conditional GETs
+
+Each trip has a version stamp that invalidation bumps. Rendered entries record the
+version they were rendered at, so an entry rendered concurrently with a change is
+never served once the change's invalidation has run. Other per-trip responses (such
+as simplified route geometry) are cached against the same version.
+
+Versions are the time of the change in nanoseconds. A trip with no version (never
+changed, or its version culled from the cache) is stamped with a new one before it's
+rendered, so a lost version can't make an older entry match again. The version's
+second is the Last-Modified of the responses rendered at it; during that second a
+later change could share it, so responses carry only their ETag until it has passed.
+"""
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+
+from . import metrics
+from .db_router import primary_reads
+from .models import Trip
+from .serializers import TripSerializer
+
+
+def _cache():
+    return caches[settings.TRIP_RESPONSE_CACHE['ALIAS']]
+
+
+def _entry_key(trip_id):
+    return f'trip-response:{trip_id}'
+
+
+def _version_key(trip_id):
+    return f'trip-version:{trip_id}'
+
+
+def _current(values, trip_id, key=None):
+    """Return the cached entry from a get_many result if it matches the current version"""
+    entry = values.get(key or _entry_key(trip_id))
+    if entry is not None and entry['version'] == values.get(_version_key(trip_id)):
+        return entry
+    return None
+
+
+def _version(cache, values, trip_id):
+    """Return the trip's version from a get_many result, stamping a new one if it has none"""
+    version = values.get(_version_key(trip_id))
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(_version_key(trip_id), version, timeout=None):
+            # Stamped or invalidated since the read
+            version = cache.get(_version_key(trip_id), version)
+    return version
+
+
+async def _aversion(cache, values, trip_id):
+    """Async variant of _version"""
+    version = values.get(_version_key(trip_id))
+    if version is None:
+        version = time.time_ns()
+        if not await cache.aadd(_version_key(trip_id), version, timeout=None):
+            version = await cache.aget(_version_key(trip_id), version)
+    return version
+
+
+def render_trip(trip, version):
+    """Render a trip (with its nested relations prefetched) into a cache entry"""
+    return render_entry(TripSerializer(trip).data, version)
+
+
+def render_entry(data, version):
+    """Render response data into a cache entry"""
+    with metrics.timed('render'):
+        body = JSONRenderer().render(data)
+    return {
+        'body': body,
+        'etag': f'"{hashlib.sha1(body).hexdigest()}"',
+        'last_modified': version // 1_000_000_000,
+        'version': version,
+    }
+
+
+def _load_and_render(trip_id, version):
+    # Read from the primary: a lagging replica could render a stale trip under the
+    # current version, and the entry would then be served until the next change
+    try:
+        with primary_reads():
+            trip = Trip.objects.prefetch_related('route_segments', 'daily_logs__log_entries').get(id=trip_id)
+    except Trip.DoesNotExist:
+        return None
+    return render_trip(trip, version)
+
+
+def get_trip_entry(trip_id):
+    """Return the rendered entry for a trip, rendering and caching it on a miss
+
+    Returns None if the trip doesn't exist.
+    """
+    cache = _cache()
+    values = cache.get_many([_entry_key(trip_id), _version_key(trip_id)])
+
+    entry = _current(values, trip_id)
+    if entry is None:
+        entry = _load_and_render(trip_id, _version(cache, values, trip_id))
+        if entry is not None:
+            cache.set(_entry_key(trip_id), entry, timeout=settings.TRIP_RESPONSE_CACHE['TTL_SECONDS'])
+    return entry
+
+
+async def aget_trip_entry(trip_id):
+    """Async variant of get_trip_entry"""
+    cache = _cache()
+    values = await cache.aget_many([_entry_key(trip_id), _version_key(trip_id)])
+
+    entry = _current(values, trip_id)
+    if entry is None:
+        entry = await sync_to_async(_load_and_render)(trip_id, await _aversion(cache, values, trip_id))
+        if entry is not None:
+            await cache.aset(_entry_key(trip_id), entry, timeout=settings.TRIP_RESPONSE_CACHE['TTL_SECONDS'])
+    return entry
+
+
+def _get_versioned(trip_id, name, build):
+    """get_versioned, with ``build(trip_id, version)`` also given the version it builds at"""
+    cache = _cache()
+    key = f'trip-{name}:{trip_id}'
+    values = cache.get_many([key, _version_key(trip_id)])
+
+    entry = _current(values, trip_id, key)
+    if entry is not None:
+        return entry['value']
+
+    version = _version(cache, values, trip_id)
+    value = build(trip_id, version)
+    if value is not None:
+        entry = {'value': value, 'version': version}
+        cache.set(key, entry, timeout=settings.TRIP_RESPONSE_CACHE['TTL_SECONDS'])
+    return value
+
+
+def get_versioned(trip_id, name, build):
+    """Return a value derived from a trip, cached until the trip changes
+
+    ``build(trip_id)`` computes the value, or returns None (which isn't cached) if
+    the trip doesn't exist. ``name`` tells apart the different values cached for one trip.
+    """
+    return _get_versioned(trip_id, name, lambda trip_id, version: build(trip_id))
+
+
+def get_derived_entry(trip_id, name, build):
+    """Return the rendered entry for response data derived from a trip, cached until the trip changes
+
+    ``build(trip_id)`` returns the response data, or None if the trip doesn't exist.
+    """
+    def build_entry(trip_id, version):
+        data = build(trip_id)
+        return None if data is None else render_entry(data, version)
+
+    return _get_versioned(trip_id, name, build_entry)
+
+
+def entry_response(request, entry):
+    """Build the 200 (or 304 for a matching conditional GET) response for an entry"""
+    # A change later in the version's second would get the same Last-Modified
+    last_modified = entry['last_modified'] if entry['last_modified'] < int(time.time()) else None
+    response = get_conditional_response(request, etag=entry['etag'], last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(entry['body'], content_type='application/json')
+
+    response['ETag'] = entry['etag']
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # Clients may keep the body but must revalidate before reusing it
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def invalidate_trip(trip_id):
+    """Invalidate any cached response for a trip immediately"""
+    # Versions are times, so a new one never equals one an entry was rendered at
+    _cache().set(_version_key(trip_id), time.time_ns(), timeout=None)
+
+
+def invalidate_trip_on_commit(trip_id):
+    """Invalidate a trip's cached response once the current transaction commits"""
+    transaction.on_commit(lambda: invalidate_trip(trip_id))
@@ -1,8 +1,28 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path('trips/', views.list_trips, name='list_trips'),
     path('trips/create/', views.create_trip, name='create_trip'),
+    path('trips/batch/', views.create_trips_batch, name='create_trips_batch'),
+    path('trips/multi-stop/', views.create_multi_stop_trip, name='create_multi_stop_trip'),
     path('trips/<uuid:trip_id>/', views.get_trip, name='get_trip'),
+    path('trips/<uuid:trip_id>/geometry/', views.get_trip_geometry, name='get_trip_geometry'),
+    path('trips/<uuid:trip_id>/logs/sheets.zip', views.get_log_sheet_packet, name='get_log_sheet_packet'),
+    path('trips/<uuid:trip_id>/logs/<str:date>/sheet.svg', views.get_log_sheet, name='get_log_sheet'),
+    path('trips/<uuid:trip_id>/progress/', views.update_trip_progress, name='update_trip_progress'),
+    path('async/trips/', async_views.list_trips, name='async_list_trips'),
+    path('async/trips/create/', async_views.create_trip, name='async_create_trip'),
+    path('async/trips/<uuid:trip_id>/', async_views.get_trip, name='async_get_trip'),
+    path('jobs/<uuid:job_id>/', views.get_planning_job, name='get_planning_job'),
+    path('drivers/cycle/', views.driver_cycle, name='driver_cycle'),
+    path('exports/logs/', views.export_logs, name='export_logs'),
+    path('compliance/violations/', views.scan_violations, name='scan_violations'),
+    path('geocoding/search/', views.geocoding_search, name='geocoding_search'),
+    path('routing/distance-matrix/', views.distance_matrix, name='distance_matrix'),
+    path('routing/cache-stats/', views.route_cache_stats, name='route_cache_stats'),
+    path('routing/ors-stats/', views.ors_client_stats, name='ors_client_stats'),
+    path('routing/road-network-stats/', views.road_network_stats, name='road_network_stats'),
+    path('routing/poi-stats/', views.poi_stats, name='poi_stats'),
+    path('metrics/', views.metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -1,75 +1,457 @@
+import datetime
+
+from django.conf import settings
+from django.utils import timezone
+from django.db import router
+from django.db.models import prefetch_related_objects
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_GET
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from .models import Trip, RouteSegment, DailyLog, LogEntry
-from .serializers import TripSerializer, TripCreateSerializer
-from .services import HOSService
-from decimal import Decimal
+from .models import LogEntry, Trip, PlanningJob
+from .pagination import TripCursorPagination
+from .serializers import (
+    TripSerializer, TripCreateSerializer, TripSummarySerializer, DistanceMatrixSerializer,
+    PlanningJobSerializer, LogExportSerializer, TripProgressSerializer, CycleQuerySerializer,
+    TripGeometryQuerySerializer, ViolationScanSerializer, GeocodingSearchSerializer, MultiStopTripCreateSerializer
+)
+from . import metrics
+from .compliance import iter_ndjson, iter_violations
+from .cycle import CycleService
+from .db_router import primary_reads
+from .exports import export_response, streaming_response
+from .geocoding import STOP_LOCATION_FIELDS, geocode_many, get_gazetteer, names_to_geocode
+from .geometry import normalize_tolerance, tolerance_for_zoom, trip_geometry
+from .logsheet import get_packet, get_sheet
+from .services import (
+    HOSService, RouteService, TripPlanService, TripProgressService, PlanningJobService, MultiStopTripService
+)
+from .poi import get_poi_index
+from .road_network import get_road_network
+from .route_cache import get_route_cache
+from .routing import get_ors_client
+from .trip_cache import entry_response, get_derived_entry, get_trip_entry
 
 @api_view(['POST'])
 def create_trip(request):
-    """Create a new trip and generate route plan with HOS compliance"""
+    """Create a new trip and generate route plan with HOS compliance
+
+    With ``?async=true`` planning is queued and a 202 with the planning job is returned.
+    """
     serializer = TripCreateSerializer(data=request.data)
 
     if not serializer.is_valid():
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    trip = serializer.save()
+    # Plan on an unsaved trip so nothing is written until the whole plan is ready
+    return _plan_new_trip(request, Trip(**serializer.validated_data))
 
-    try:
-        # Generate route segments
-        segments = HOSService.plan_trip_segments(trip)
+@api_view(['POST'])
+def create_multi_stop_trip(request):
+    """Create a trip with several pickups and dropoffs, ordering its stops before planning it
+
+    With ``?async=true`` the stops are ordered straight away and the rest of the planning is queued.
+    """
+    # Geocode every location given without coordinates in one cache query
+    payload = request.data
+    names = names_to_geocode(payload)
+    stops = payload.get('stops') if isinstance(payload, dict) else None
+    if isinstance(stops, list):
+        names = names.union(*(names_to_geocode(stop, STOP_LOCATION_FIELDS) for stop in stops))
+    context = {'geocoded': geocode_many(names) if names else {}}
+    serializer = MultiStopTripCreateSerializer(data=payload, context=context)
+
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        # Save route segments
-        for segment_data in segments:
-            RouteSegment.objects.create(trip=trip, **segment_data)
+    trip_data = dict(serializer.validated_data)
+    stops_data = trip_data.pop('stops')
+    return _plan_new_trip(request, MultiStopTripService.build_trip(trip_data, stops_data))
 
-        # Generate daily logs
+def _plan_new_trip(request, trip):
+    """Plan and save an unsaved trip, or with ``?async=true`` save it and queue its planning"""
+    # ?async=true saves the trip, queues its planning and returns straight away
+    if request.query_params.get('async', '').lower() in ('1', 'true', 'yes'):
+        job = PlanningJobService.enqueue(trip)
+        return Response(
+            PlanningJobSerializer(job, context={'request': request}).data,
+            status=status.HTTP_202_ACCEPTED
+        )
+
+    try:
+        # Generate route segments and daily logs
+        routes = RouteService.get_routes(HOSService.trip_legs(trip))
+        segments = HOSService.plan_trip_segments(trip, routes=routes)
         daily_logs_data = HOSService.generate_daily_logs(trip, segments)
 
-        # Save daily logs and entries
-        for log_data in daily_logs_data:
-            entries_data = log_data.pop('entries')
-            daily_log = DailyLog.objects.create(
-                trip=trip,
-                date=log_data['date'],
-                total_miles=Decimal(str(log_data['total_miles'])),
-                total_hours_off_duty=Decimal(str(log_data['total_hours_off_duty'])),
-                total_hours_sleeper=Decimal(str(log_data['total_hours_sleeper'])),
-                total_hours_driving=Decimal(str(log_data['total_hours_driving'])),
-                total_hours_on_duty=Decimal(str(log_data['total_hours_on_duty']))
-            )
-
-            for entry_data in entries_data:
-                LogEntry.objects.create(daily_log=daily_log, **entry_data)
-
-        # Return complete trip data
-        trip_serializer = TripSerializer(trip)
-        return Response(trip_serializer.data, status=status.HTTP_201_CREATED)
+        # Save the trip, segments, leg geometry, daily logs and entries in one transaction
+        TripPlanService.save_plans([(trip, segments, daily_logs_data, routes)])
+
+        # Return complete trip data (prefetched so the render doesn't query per day)
+        prefetch_related_objects([trip], 'route_segments', 'daily_logs__log_entries')
+        with metrics.timed('render'):
+            data = TripSerializer(trip).data
+        return Response(data, status=status.HTTP_201_CREATED)
 
     except Exception as e:
-        trip.delete()  # Clean up if something goes wrong
         return Response(
             {'error': f'Failed to generate trip plan: {str(e)}'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@api_view(['POST'])
+def create_trips_batch(request):
+    """Create many trips from an array of trip payloads
+
+    Each distinct leg is routed once and all plans are bulk-inserted together.
+    Results are reported per item, so invalid or unplannable trips don't fail the batch.
+    """
+    items = request.data
+    if not isinstance(items, list) or not items:
+        return Response(
+            {'error': 'Expected a non-empty array of trips'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    max_size = settings.TRIP_BATCH_MAX_SIZE
+    if len(items) > max_size:
+        return Response(
+            {'error': f'Batch of {len(items)} trips exceeds the limit of {max_size}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # Seed the cycle of every driver without explicit cycle hours in one query
+    unseeded = {
+        item['driver_name'] for item in items
+        if isinstance(item, dict) and 'current_cycle_hours' not in item and isinstance(item.get('driver_name'), str)
+    }
+    context = {'cycle_hours': CycleService.cycle_hours(unseeded) if unseeded else {}}
+    # and geocode every location given without coordinates in one cache query
+    names = set().union(*(names_to_geocode(item) for item in items))
+    context['geocoded'] = geocode_many(names) if names else {}
+
+    results = [None] * len(items)
+    trips = []
+    indexes = []
+    for index, item in enumerate(items):
+        serializer = TripCreateSerializer(data=item, context=context)
+        if serializer.is_valid():
+            trips.append(Trip(**serializer.validated_data))
+            indexes.append(index)
+        else:
+            results[index] = {'index': index, 'status': 'invalid', 'errors': serializer.errors}
+
+    plans = []
+    plan_indexes = []
+    for index, plan in zip(indexes, TripPlanService.plan_trips(trips)):
+        if isinstance(plan, Exception):
+            results[index] = {'index': index, 'status': 'error', 'error': f'Failed to generate trip plan: {plan}'}
+        else:
+            plans.append(plan)
+            plan_indexes.append(index)
+
+    try:
+        TripPlanService.save_plans(plans)
+        saved = [(index, plan, None) for index, plan in zip(plan_indexes, plans)]
+    except Exception:
+        # Isolate the failing trips by saving the rest one at a time
+        saved = []
+        for index, plan in zip(plan_indexes, plans):
+            try:
+                TripPlanService.save_plans([plan])
+                saved.append((index, plan, None))
+            except Exception as e:
+                saved.append((index, plan, e))
+
+    for index, (trip, segments, daily_logs, _), error in saved:
+        if error is None:
+            results[index] = {
+                'index': index,
+                'status': 'created',
+                'trip_id': str(trip.id),
+                'segments': len(segments),
+                'daily_logs': len(daily_logs)
+            }
+        else:
+            results[index] = {'index': index, 'status': 'error', 'error': f'Failed to save trip plan: {error}'}
+
+    created = sum(1 for result in results if result['status'] == 'created')
+    return Response(
+        {'created': created, 'failed': len(results) - created, 'results': results},
+        status=status.HTTP_201_CREATED if created == len(results) else status.HTTP_207_MULTI_STATUS
+    )
+
 @api_view(['GET'])
 def get_trip(request, trip_id):
-    """Get trip details by ID"""
+    """Get trip details by ID
+
+    Responses are served from the rendered-trip cache and carry an ETag and
+    Last-Modified, so pollers can revalidate with a conditional GET and get a 304.
+    """
+    entry = get_trip_entry(trip_id)
+    if entry is None:
+        return Response(
+            {'error': 'Trip not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    return entry_response(request, entry)
+
+@api_view(['GET'])
+def get_trip_geometry(request, trip_id):
+    """Get the encoded polylines of a trip's legs, simplified for ``?zoom=`` or ``?tolerance=`` miles
+
+    Simplified versions are cached until the trip changes and carry an ETag.
+    """
+    serializer = TripGeometryQuerySerializer(data=request.query_params)
+
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    if 'zoom' in serializer.validated_data:
+        tolerance = tolerance_for_zoom(serializer.validated_data['zoom'])
+    else:
+        tolerance = serializer.validated_data.get('tolerance', 0)
+    tolerance = normalize_tolerance(tolerance)
+
+    entry = get_derived_entry(
+        trip_id, f'geometry:{tolerance}', lambda trip_id: trip_geometry(trip_id, tolerance)
+    )
+    if entry is None:
+        return Response(
+            {'error': 'Trip not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    return entry_response(request, entry)
+
+def _content_response(request, content, content_hash, content_type):
+    """Response for content-addressed bytes, or a 304 if the client already has them"""
+    etag = f'"{content_hash}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(content, content_type=content_type)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+# Plain Django views: DRF content negotiation would refuse clients that only accept SVG or zip
+@require_GET
+def get_log_sheet(request, trip_id, date):
+    """Get a trip's log sheet (the 24-hour duty-status grid) for one day as SVG"""
+    try:
+        date = datetime.date.fromisoformat(date).isoformat()
+    except ValueError:
+        return JsonResponse({'error': 'Date must be YYYY-MM-DD'}, status=400)
+
+    sheet = get_sheet(trip_id, date)
+    if sheet is None:
+        return JsonResponse({'error': 'No daily log for this trip and date'}, status=404)
+    sheet_hash, svg = sheet
+    return _content_response(request, svg, sheet_hash, 'image/svg+xml')
+
+@require_GET
+def get_log_sheet_packet(request, trip_id):
+    """Get every log sheet of a trip as a zip of one SVG per day"""
+    packet = get_packet(trip_id)
+    if packet is None:
+        return JsonResponse({'error': 'Trip not found'}, status=404)
+    packet_hash, content = packet
+    response = _content_response(request, content, packet_hash, 'application/zip')
+    response['Content-Disposition'] = f'attachment; filename="log-sheets-{trip_id}.zip"'
+    return response
+
+@api_view(['PATCH'])
+def update_trip_progress(request, trip_id):
+    """Record the driver's position and re-plan the rest of the trip from it
+
+    Segments before ``completed_segments`` and their log entries are kept; only
+    rows that change are written.
+    """
+    serializer = TripProgressSerializer(data=request.data)
+
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
     try:
         trip = Trip.objects.get(id=trip_id)
-        serializer = TripSerializer(trip)
-        return Response(serializer.data)
     except Trip.DoesNotExist:
         return Response(
             {'error': 'Trip not found'},
             status=status.HTTP_404_NOT_FOUND
         )
 
+    try:
+        changes = TripProgressService.update_progress(trip, **serializer.validated_data)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+    except Exception as e:
+        return Response(
+            {'error': f'Failed to re-plan trip: {str(e)}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+    prefetch_related_objects([trip], 'route_segments', 'daily_logs__log_entries')
+    return Response({'changes': changes, 'trip': TripSerializer(trip).data})
+
+@api_view(['GET'])
+@primary_reads()
+def get_planning_job(request, job_id):
+    """Get the status of an async planning job, with the planned trip once it succeeds"""
+    try:
+        job = PlanningJob.objects.select_related('trip').get(id=job_id)
+    except PlanningJob.DoesNotExist:
+        return Response(
+            {'error': 'Planning job not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    data = PlanningJobSerializer(job, context={'request': request}).data
+    if job.status == 'succeeded':
+        prefetch_related_objects([job.trip], 'route_segments', 'daily_logs__log_entries')
+        data['trip'] = TripSerializer(job.trip).data
+    return Response(data)
+
+def paginate_trips(request):
+    """Return the paginator and serialized page of trips for a list request
+
+    ``?view=summary`` returns trip fields only, without segments and logs.
+    """
+    trips = Trip.objects.all()
+    summary = request.query_params.get('view') == 'summary'
+
+    if not summary:
+        trips = trips.prefetch_related('route_segments', 'daily_logs__log_entries', 'stops')
+
+    paginator = TripCursorPagination()
+    page = paginator.paginate_queryset(trips, request)
+    serializer_class = TripSummarySerializer if summary else TripSerializer
+    return paginator, serializer_class(page, many=True).data
+
 @api_view(['GET'])
 def list_trips(request):
-    """List all trips"""
-    trips = Trip.objects.all().order_by('-created_at')
-    serializer = TripSerializer(trips, many=True)
-    return Response(serializer.data)
\ No newline at end of file
+    """List trips, newest first, a cursor page at a time"""
+    paginator, data = paginate_trips(request)
+    return paginator.get_paginated_response(data)
+
+@api_view(['GET'])
+def driver_cycle(request):
+    """Report a driver's 70-hour/8-day cycle hours used and available, now or at ``?at=``"""
+    serializer = CycleQuerySerializer(data=request.query_params)
+
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    driver_name = serializer.validated_data['driver_name']
+    # Logs are kept in naive local time
+    at = serializer.validated_data.get('at')
+    if at is not None and timezone.is_aware(at):
+        at = timezone.make_naive(at)
+
+    state = CycleService.cycle_state(driver_name, at)
+    return Response({
+        'driver_name': driver_name,
+        'used_hours': state.used_hours,
+        'available_hours': state.available_hours
+    })
+
+@api_view(['GET'])
+def export_logs(request):
+    """Stream log entries as NDJSON or CSV, filtered by carrier, driver, truck and date range"""
+    serializer = LogExportSerializer(data=request.query_params)
+
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    filters = dict(serializer.validated_data)
+    output = filters.pop('output')
+    return export_response(output, f'daily-logs.{output}', **filters)
+
+@api_view(['GET'])
+def scan_violations(request):
+    """Stream the hours-of-service violations in stored logs as NDJSON, filtered by carrier, driver and date range"""
+    serializer = ViolationScanSerializer(data=request.query_params)
+
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    violations = iter_violations(using=router.db_for_read(LogEntry), **serializer.validated_data)
+    return streaming_response(iter_ndjson(violations), 'application/x-ndjson', 'violations.ndjson')
+
+@api_view(['POST'])
+def distance_matrix(request):
+    """Return straight-line distances in miles between lists of coordinates"""
+    serializer = DistanceMatrixSerializer(data=request.data)
+
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    origins = [(point['lat'], point['lng']) for point in serializer.validated_data['origins']]
+    destinations = serializer.validated_data.get('destinations')
+    if destinations is not None:
+        destinations = [(point['lat'], point['lng']) for point in destinations]
+
+    return Response({
+        'units': 'miles',
+        'matrix': RouteService.distance_matrix(origins, destinations)
+    })
+
+@api_view(['GET'])
+def route_cache_stats(request):
+    """Report route cache hit/miss/eviction counters for this worker"""
+    cache = get_route_cache()
+    if cache is None:
+        return Response({'enabled': False})
+    return Response({'enabled': True, **cache.stats()})
+
+@api_view(['GET'])
+def ors_client_stats(request):
+    """Report OpenRouteService request/failure counts and circuit breaker state"""
+    return Response(get_ors_client().stats())
+
+@api_view(['GET'])
+def road_network_stats(request):
+    """Report the local road graph's size and query counts for this worker"""
+    network = get_road_network()
+    if network is None:
+        return Response({'loaded': False})
+    return Response({'loaded': True, **network.stats()})
+
+@api_view(['GET'])
+def geocoding_search(request):
+    """Return the gazetteer places best matching a location name, for autocompletion"""
+    serializer = GeocodingSearchSerializer(data=request.query_params)
+
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    gazetteer = get_gazetteer()
+    if gazetteer is None:
+        return Response(
+            {'error': 'No gazetteer is configured'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+
+    matches = gazetteer.search(serializer.validated_data['q'], limit=serializer.validated_data['limit'])
+    return Response({
+        'results': [
+            {'name': place.name, 'lat': place.lat, 'lng': place.lng, 'score': score}
+            for place, score in matches
+        ]
+    })
+
+@api_view(['GET'])
+def poi_stats(request):
+    """Report the points of interest indexed per kind and the stop lookups made by this worker"""
+    index = get_poi_index()
+    if index is None:
+        return Response({'loaded': False})
+    return Response({'loaded': True, **index.stats()})
+
+@require_GET
+def metrics_view(request):
+    """Export this worker's metrics in Prometheus text format
+
+    A plain Django view, since DRF content negotiation would reject scrapers' Accept headers.
+    """
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -14,3 +14,17 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'eld_project.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402  (needs the settings module set above)
+
+if settings.SERVER_MODE == 'asgi':
+    from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
+    from django.views import static
+
+    class CollectedStaticFilesHandler(ASGIStaticFilesHandler):
+        """Serve collected (hashed) files from STATIC_ROOT in place of WhiteNoise"""
+
+        def serve(self, request):
+            return static.serve(request, self.file_path(request.path), document_root=settings.STATIC_ROOT)
+
+    application = CollectedStaticFilesHandler(application)
@@ -1,5 +1,5 @@
 import os
-from decouple import config
+from decouple import Csv, config
 import dj_database_url
 from pathlib import Path
 
@@ -30,7 +30,12 @@ INSTALLED_APPS = [
     'eld_app',
 ]
 
+# 'wsgi' for gunicorn sync workers, 'asgi' for uvicorn workers serving the async views
+SERVER_MODE = config('SERVER_MODE', default='wsgi')
+
 MIDDLEWARE = [
+    # Outermost so request latency covers every other middleware
+    'eld_app.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Add for static files
     'django.middleware.security.SecurityMiddleware',
@@ -42,6 +47,11 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+if SERVER_MODE == 'asgi':
+    # WhiteNoise is sync-only and would force every async view through one thread;
+    # eld_project.asgi serves STATIC_ROOT itself instead
+    MIDDLEWARE.remove('whitenoise.middleware.WhiteNoiseMiddleware')
+
 ROOT_URLCONF = 'eld_project.urls'
 
 TEMPLATES = [
@@ -62,12 +72,165 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'eld_project.wsgi.application'
 
+# Persistent connections, health-checked before reuse. ASGI runs each request's
+# queries on a fresh thread, so connections aren't reused there; front the database
+# with a pooler (e.g. PgBouncer) instead. Only request threads keep a connection: the
+# routing pool and the log sheet pre-render thread close theirs after each task, so a
+# WSGI worker holds one per thread (per database alias) plus those of tasks in flight
+DATABASE_CONN_MAX_AGE = config(
+    'DATABASE_CONN_MAX_AGE', default=0 if SERVER_MODE == 'asgi' else 600, cast=int
+)
+
+# Required behind a transaction-mode pooler (e.g. PgBouncer), which can't hold
+# the server-side cursors that .iterator() uses on PostgreSQL
+DATABASE_DISABLE_SERVER_SIDE_CURSORS = config('DATABASE_DISABLE_SERVER_SIDE_CURSORS', default=False, cast=bool)
+
+DATABASE_OPTIONS = {
+    'conn_max_age': DATABASE_CONN_MAX_AGE,
+    'conn_health_checks': DATABASE_CONN_MAX_AGE > 0,
+    'disable_server_side_cursors': DATABASE_DISABLE_SERVER_SIDE_CURSORS,
+}
+
 DATABASES = {
     'default': dj_database_url.config(
-        default=config('DATABASE_URL', default='sqlite:///' + str(BASE_DIR / 'db.sqlite3'))
+        default=config('DATABASE_URL', default='sqlite:///' + str(BASE_DIR / 'db.sqlite3')),
+        **DATABASE_OPTIONS
     )
 }
 
+# Optional read replicas (comma-separated URLs) serving the reads of GET requests
+for index, replica_url in enumerate(config('DATABASE_REPLICA_URLS', default='', cast=Csv())):
+    DATABASES[f'replica_{index}'] = dj_database_url.parse(
+        replica_url, test_options={'MIRROR': 'default'}, **DATABASE_OPTIONS
+    )
+
+READ_REPLICAS = {
+    'ALIASES': [alias for alias in DATABASES if alias != 'default'],
+    # How long a client that wrote keeps reading from the primary
+    'PIN_SECONDS': config('DATABASE_REPLICA_PIN_SECONDS', default=5, cast=int),
+    'PIN_COOKIE': 'eld_read_primary',
+}
+
+if READ_REPLICAS['ALIASES']:
+    DATABASE_ROUTERS = ['eld_app.db_router.ReplicaRouter']
+    MIDDLEWARE.insert(1, 'eld_app.db_router.ReadReplicaMiddleware')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Shared across gunicorn workers; create with `python manage.py createcachetable`
+    'routes': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'eld_route_cache',
+        'TIMEOUT': config('ROUTE_CACHE_TTL_SECONDS', default=86400, cast=int),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('ROUTE_CACHE_SHARED_MAX_ENTRIES', default=50000, cast=int),
+        },
+    },
+    # Rendered get_trip responses; shared so signal invalidation reaches every worker
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'eld_response_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': config('TRIP_RESPONSE_CACHE_MAX_ENTRIES', default=20000, cast=int),
+        },
+    },
+}
+
+TRIP_RESPONSE_CACHE = {
+    'ALIAS': config('TRIP_RESPONSE_CACHE_ALIAS', default='responses'),
+    'TTL_SECONDS': config('TRIP_RESPONSE_CACHE_TTL_SECONDS', default=3600, cast=int),
+}
+
+# Route cache for RouteService.get_route_data (legs keyed by geohash of their endpoints)
+ROUTE_CACHE = {
+    'ENABLED': config('ROUTE_CACHE_ENABLED', default=True, cast=bool),
+    'GEOHASH_PRECISION': config('ROUTE_CACHE_GEOHASH_PRECISION', default=7, cast=int),
+    'LOCAL_MAX_ENTRIES': config('ROUTE_CACHE_LOCAL_MAX_ENTRIES', default=1024, cast=int),
+    'TTL_SECONDS': config('ROUTE_CACHE_TTL_SECONDS', default=86400, cast=int),
+    'SHARED_CACHE_ALIAS': config('ROUTE_CACHE_SHARED_ALIAS', default='routes'),
+}
+
+# OpenRouteService client (pooled session + circuit breaker falling back to Haversine)
+ORS = {
+    'API_KEY': config('OPENROUTE_API_KEY', default='5b3ce3597851110001cf6248YOUR_API_KEY'),
+    'BASE_URL': config('ORS_BASE_URL', default='https://api.openrouteservice.org'),
+    'PROFILE': config('ORS_PROFILE', default='driving-car'),
+    'CONNECT_TIMEOUT': config('ORS_CONNECT_TIMEOUT', default=3.05, cast=float),
+    'READ_TIMEOUT': config('ORS_READ_TIMEOUT', default=10, cast=float),
+    'POOL_SIZE': config('ORS_POOL_SIZE', default=10, cast=int),
+    'RETRIES': config('ORS_RETRIES', default=1, cast=int),
+    'BREAKER_FAILURE_THRESHOLD': config('ORS_BREAKER_FAILURE_THRESHOLD', default=5, cast=int),
+    'BREAKER_COOLDOWN_SECONDS': config('ORS_BREAKER_COOLDOWN_SECONDS', default=30, cast=float),
+}
+
+# Route the legs of a trip in parallel; set ROUTING_CONCURRENT=false to go sequential
+ROUTING = {
+    'CONCURRENT': config('ROUTING_CONCURRENT', default=True, cast=bool),
+    'MAX_WORKERS': config('ROUTING_MAX_WORKERS', default=8, cast=int),
+    # Tried in order until one returns a route; the Haversine estimate is the last resort
+    'BACKENDS': config('ROUTING_BACKENDS', default='ors,road_network', cast=Csv()),
+}
+
+# Local road graph for offline routing (an edge list CSV or a .npz from build_road_network)
+ROAD_NETWORK = {
+    'PATH': config('ROAD_NETWORK_PATH', default=''),
+    # Side of the grid cells nodes are indexed by for snapping
+    'GRID_DEGREES': config('ROAD_NETWORK_GRID_DEGREES', default=0.05, cast=float),
+    # Points further than this from every node can't be routed on the graph
+    'MAX_SNAP_MILES': config('ROAD_NETWORK_MAX_SNAP_MILES', default=15, cast=float),
+    # Speed of edges without an mph column, and of the stretch between a point and its node
+    'DEFAULT_MPH': config('ROAD_NETWORK_DEFAULT_MPH', default=55, cast=float),
+    'CONNECTOR_MPH': config('ROAD_NETWORK_CONNECTOR_MPH', default=25, cast=float),
+}
+
+# Fuel stations, rest areas and truck stops (a CSV of name,kind,lat,lng) the planner stops at
+POI = {
+    'PATH': config('POI_PATH', default=''),
+    'GRID_DEGREES': config('POI_GRID_DEGREES', default=0.25, cast=float),
+    # Stops are labelled with the nearest place within this distance of where they fall on the route
+    'MAX_DETOUR_MILES': config('POI_MAX_DETOUR_MILES', default=15, cast=float),
+}
+
+# Gazetteer (a CSV of name,lat,lng with optional region,population) trip locations are geocoded against
+GEOCODING = {
+    'GAZETTEER_PATH': config('GEOCODING_GAZETTEER_PATH', default=''),
+    'GRID_DEGREES': config('GEOCODING_GRID_DEGREES', default=0.25, cast=float),
+    # Fuzzy matches scoring below this are treated as not found
+    'MIN_SIMILARITY': config('GEOCODING_MIN_SIMILARITY', default=0.5, cast=float),
+    # Planned segments are labelled with the nearest town within this distance
+    'REVERSE_MAX_MILES': config('GEOCODING_REVERSE_MAX_MILES', default=25, cast=float),
+}
+
+# Multi-stop trips: the most stops a trip may have, and how long ordering them may search for a shorter route
+MULTI_STOP = {
+    'MAX_STOPS': config('MULTI_STOP_MAX_STOPS', default=25, cast=int),
+    'ORDER_TIME_BUDGET_MS': config('MULTI_STOP_ORDER_TIME_BUDGET_MS', default=50, cast=float),
+}
+
+# Most trips accepted by one /api/trips/batch/ request
+TRIP_BATCH_MAX_SIZE = config('TRIP_BATCH_MAX_SIZE', default=5000, cast=int)
+
+# Largest rows x columns accepted by /api/routing/distance-matrix/
+DISTANCE_MATRIX_MAX_CELLS = config('DISTANCE_MATRIX_MAX_CELLS', default=250000, cast=int)
+
+# Request instrumentation; Server-Timing exposes per-stage durations to clients
+METRICS = {
+    'SERVER_TIMING': config('METRICS_SERVER_TIMING', default=True, cast=bool),
+}
+
+# Rendered log sheets; content-addressed, so they never need invalidating
+LOGSHEET = {
+    'CACHE_ALIAS': config('LOGSHEET_CACHE_ALIAS', default='responses'),
+    'TTL_SECONDS': config('LOGSHEET_CACHE_TTL_SECONDS', default=30 * 86400, cast=int),
+    # Render a trip's sheets in the background as soon as its plan is saved
+    'PRERENDER': config('LOGSHEET_PRERENDER', default=True, cast=bool),
+}
+
+# Rows fetched from the database per round trip by the log exports
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
 
@@ -100,4 +263,7 @@ if not DEBUG:
     SECURE_HSTS_INCLUDE_SUBDOMAINS = True
     SECURE_HSTS_PRELOAD = True
 
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Covering-index INCLUDE columns only apply on PostgreSQL; SQLite builds the plain index
+SILENCED_SYSTEM_CHECKS = ['models.W040']
\ No newline at end of file
@@ -17,6 +17,7 @@ if __name__ == '__main__':
     # Run migrations
     print("Running migrations...")
     execute_from_command_line(['manage.py', 'migrate', '--verbosity=2'])
+    execute_from_command_line(['manage.py', 'createcachetable'])
     
     # Verify tables exist
     from django.db import connection
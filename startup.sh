@@ -37,6 +37,10 @@ else
     echo "Skipping migrations (SKIP_MIGRATIONS=true)"
 fi
 
+# Shared route cache table (no-op when it already exists)
+echo "Creating cache tables..."
+python manage.py createcachetable
+
 # Verify tables exist
 echo "Verifying database tables..."
 python -c "
@@ -54,5 +58,10 @@ with connection.cursor() as cursor:
         print('❌ eld_app_trip table missing!')
 "
 
-echo "=== Starting Gunicorn ==="
-exec gunicorn eld_project.wsgi:application --bind 0.0.0.0:$PORT
\ No newline at end of file
+if [ "$SERVER_MODE" = "asgi" ]; then
+    echo "=== Starting Gunicorn with uvicorn workers (ASGI) ==="
+    exec gunicorn eld_project.asgi:application -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:$PORT
+else
+    echo "=== Starting Gunicorn ==="
+    exec gunicorn eld_project.wsgi:application --bind 0.0.0.0:$PORT
+fi
\ No newline at end of file